@@ -0,0 +1,56 @@
+"""
+What the monitoring services, power-monitoring/collector.py and
+sysstat-monitoring/sampler.py, have in common: writing their readings to one
+file per day, and being stopped by systemd.
+
+Only the standard library is used, so that the services can run on the
+monitored machine as is.
+"""
+
+import datetime
+import os
+import signal
+import sys
+
+
+class DailyWriter:
+    """
+    Appends rows to OUTPUT_DIR/YYYY-MM-DD<ext>, switching file at midnight
+    and writing header() whenever a file is created. Rows are bytes, and every
+    row is written with a single unbuffered write, so readers never see half a
+    row unless the service dies while writing
+    """
+
+    def __init__(self, output_dir, ext, header):
+        self.output_dir = output_dir
+        self.ext = ext
+        self.header = header
+        self.date = None
+        self.f = None
+
+    def write(self, row):
+        date = datetime.date.today().isoformat()
+        if date != self.date:
+            self.close()
+            fpath = os.path.join(self.output_dir, date + self.ext)
+            is_new = not os.path.isfile(fpath)
+            self.f = open(fpath, "ab", buffering=0)
+            if is_new:
+                self.f.write(self.header())
+            self.date = date
+        self.f.write(row)
+
+    def close(self):
+        if self.f is not None:
+            self.f.close()
+            self.f = None
+
+
+def stop(signum, frame):
+    sys.exit(0)
+
+
+## systemd stops the services with SIGTERM, let it unwind like ^C, so the
+## daily files and whatever else is open are closed
+def exit_on_sigterm():
+    signal.signal(signal.SIGTERM, stop)
@@ -0,0 +1,205 @@
+"""
+Vectorized alignment of time series with different cadences onto a common
+time grid, e.g. RAPL readings every 1-6 s, top bursts every 30 minutes,
+vnstat every 5 minutes and ledger closes every ~5 s.
+
+asof() picks, for every target time, the sample closest to it in one
+direction (like pandas.merge_asof, for a whole frame at once).
+interval_mean() averages samples over the intervals between consecutive grid
+times, weighting each sample by the time it covers within the interval
+rather than counting samples. A power reading covering 6 s counts six times
+as much as one covering 1 s, so the average times the length of an interval
+is its energy. The grid can be anything from hours to the close times of
+ledgers.
+
+interval_sum() spreads counts (e.g. bytes) accumulated over the windows of
+the samples onto the grid in proportion to the overlap, so daily and
+5-minute traffic can be put on one hourly grid. resample_mean() is
+interval_mean() on a regular grid, like df.resample(freq).mean() but
+weighted by time.
+
+Both work on the int64 nanosecond timestamps with searchsorted and
+cumulative sums, so millions of rows align in well under a second.
+"""
+
+import numpy as np
+import pandas as pd
+
+DIRECTIONS = ["backward", "forward", "nearest"]
+
+
+"""
+Timestamps as int64 nanoseconds (since the epoch in UTC for tz-aware ones)
+"""
+def to_ns(times):
+    return pd.DatetimeIndex(times).as_unit("ns").asi8
+
+
+def check_comparable(a, b):
+    if (pd.DatetimeIndex(a).tz is None) != (pd.DatetimeIndex(b).tz is None):
+        raise ValueError("Can't align tz-aware and tz-naive timestamps")
+
+
+def sorted_frame(df):
+    if df.index.is_monotonic_increasing:
+        return df
+    return df.sort_index(kind="stable")
+
+
+"""
+The rows of df at every time of target: the last sample at or before it
+(backward), the first at or after it (forward) or the closest one (nearest).
+Times without a sample within tolerance (e.g. "10s") get NaN. Returns a frame
+indexed by target
+"""
+def asof(df, target, direction="backward", tolerance=None):
+    if direction not in DIRECTIONS:
+        raise ValueError("Expected one of %s, got %s" % (DIRECTIONS, direction))
+    check_comparable(df.index, target)
+    df = sorted_frame(df)
+    times = to_ns(df.index)
+    t = to_ns(target)
+
+    if direction == "backward":
+        idx = np.searchsorted(times, t, side="right") - 1
+    elif direction == "forward":
+        idx = np.searchsorted(times, t, side="left")
+    else:
+        after = np.clip(np.searchsorted(times, t, side="left"), 0, len(times) - 1)
+        before = np.clip(after - 1, 0, len(times) - 1)
+        use_before = np.abs(t - times[before]) <= np.abs(times[after] - t)
+        idx = np.where(use_before, before, after)
+
+    valid = (idx >= 0) & (idx < len(times))
+    idx = np.clip(idx, 0, max(len(times) - 1, 0))
+    if tolerance is not None and len(times):
+        valid &= np.abs(t - times[idx]) <= pd.Timedelta(tolerance).value
+
+    if not len(times):
+        return pd.DataFrame(np.nan, index=target, columns=df.columns)
+    out = df.iloc[idx].set_axis(pd.DatetimeIndex(target), axis=0)
+    return out.where(np.broadcast_to(valid[:, None], out.shape))
+
+
+"""
+The start and end (ns) of the time covered by every sample of df. With
+durations (seconds per sample) a sample covers the window starting at its
+timestamp, which is how manager.sh stamps its power readings: the time is
+taken before the window is measured. Otherwise a sample holds until the next
+one, but for at most max_gap (e.g. "2s" for top, which samples in bursts),
+and the last one for as long as the median gap. Intervals are clipped so
+that they don't overlap
+"""
+def sample_intervals(df, durations=None, max_gap=None):
+    times = to_ns(df.index)
+    if durations is not None:
+        starts = times
+        ends = times + (np.asarray(durations, dtype="float64") * 1e9).astype("int64")
+    else:
+        starts = times
+        ends = np.empty_like(times)
+        ends[:-1] = times[1:]
+        if len(times) > 1:
+            ends[-1] = times[-1] + int(np.median(np.diff(times)))
+        elif len(times):
+            ends[-1] = times[-1]
+        if max_gap is not None:
+            ends = np.minimum(ends, starts + pd.Timedelta(max_gap).value)
+    ends[:-1] = np.minimum(ends[:-1], starts[1:])
+    return starts, np.maximum(ends, starts)
+
+
+"""
+Integrate every column of df over the intervals between consecutive times of
+grid, taking each sample as constant over its interval (see
+sample_intervals()). Returns the integrals (value * seconds) and the seconds
+covered by non-missing samples, both as frames indexed by the start of each
+interval
+"""
+def integrate(df, grid, durations=None, max_gap=None):
+    check_comparable(df.index, grid)
+    if durations is not None and not df.index.is_monotonic_increasing:
+        order = np.argsort(to_ns(df.index), kind="stable")
+        durations = np.asarray(durations)[order]
+    df = sorted_frame(df)
+    starts, ends = sample_intervals(df, durations, max_gap)
+    edges = to_ns(grid)
+
+    # Relative to the first time, so that the float64 conversion keeps the
+    # nanoseconds
+    origin = min(starts[0], edges[0]) if len(starts) else edges[0]
+    points = np.empty(2 * len(starts), dtype="float64")
+    points[0::2] = starts - origin
+    points[1::2] = ends - origin
+    x = (edges - origin).astype("float64")
+    seconds = (ends - starts) / 1e9
+
+    integrals = {}
+    covered = {}
+    for column in df.columns:
+        values = df[column].to_numpy(dtype="float64")
+        present = ~np.isnan(values)
+        # The integral up to every start and end of a sample is a piecewise
+        # linear function of time, so it can be interpolated at the grid
+        for out, weights in [
+            (integrals, np.where(present, values, 0.0) * seconds),
+            (covered, np.where(present, seconds, 0.0)),
+        ]:
+            cumulative = np.zeros(len(points))
+            cumulative[1::2] = np.cumsum(weights)
+            cumulative[2::2] = cumulative[1:-1:2]
+            out[column] = np.diff(np.interp(x, points, cumulative)) if len(points) else np.zeros(len(x) - 1)
+
+    index = pd.DatetimeIndex(grid)[:-1]
+    return pd.DataFrame(integrals, index=index), pd.DataFrame(covered, index=index)
+
+
+"""
+Time-weighted mean of every column of df over the intervals between
+consecutive times of grid (see integrate()). Intervals where less than
+min_coverage of the time is covered by samples get NaN
+"""
+def interval_mean(df, grid, durations=None, max_gap=None, min_coverage=0.0):
+    integrals, covered = integrate(df, grid, durations, max_gap)
+    lengths = np.diff(to_ns(grid)) / 1e9
+    enough = (covered.to_numpy() > 0) & (
+        covered.to_numpy() >= min_coverage * lengths[:, None]
+    )
+    return (integrals / covered).where(enough)
+
+
+"""
+Counts accumulated by every sample of df over the seconds of durations (one
+for all or one per sample) starting at its timestamp, spread over the
+intervals between consecutive times of grid in proportion to how much of
+each window falls into them. Intervals without any sample get NaN
+"""
+def interval_sum(df, grid, durations):
+    durations = np.broadcast_to(np.asarray(durations, dtype="float64"), (len(df),))
+    rates = df.div(durations, axis=0)
+    integrals, covered = integrate(rates, grid, durations)
+    return integrals.where(covered.to_numpy() > 0)
+
+
+"""
+The times from the start of the freq (e.g. "1h") period holding the first
+time of index to the end of the one holding the last, one every freq
+"""
+def time_grid(index, freq):
+    index = pd.DatetimeIndex(index)
+    if not len(index):
+        return index
+    step = pd.Timedelta(freq)
+    return pd.date_range(index.min().floor(step), index.max().floor(step) + step, freq=step)
+
+
+"""
+Time-weighted mean of every column of df per freq period (see
+interval_mean()), indexed by the start of each period like
+df.resample(freq).mean()
+"""
+def resample_mean(df, freq, durations=None, max_gap=None, min_coverage=0.0):
+    grid = time_grid(df.index, freq)
+    if len(grid) < 2:
+        return pd.DataFrame(columns=df.columns, index=grid, dtype="float64")
+    return interval_mean(df, grid, durations, max_gap, min_coverage)
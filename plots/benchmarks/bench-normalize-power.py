@@ -0,0 +1,114 @@
+#!/usr/bin/env python
+
+import argparse
+from pathlib import Path
+import tempfile
+
+import numpy
+import pandas
+
+from common import load_script, timed
+
+parse_power = load_script("parse-and-normalize-power-data.py")
+
+
+## The row-wise normalization that parse-and-normalize-power-data.py used
+## before it was vectorized, kept as the reference implementation
+def legacy_normalize(series):
+    duration = series["duration"]
+
+    def normalizer(elem):
+        if isinstance(elem, (int, numpy.integer)):
+            return elem / duration
+        else:
+            return elem
+
+    return series.drop(labels=["duration"]).apply(normalizer)
+
+
+def legacy_read(files):
+    dfs = []
+    header_names = ["timestamp", "duration", "CORE", "CPU", "DRAM"]
+    for p in files:
+        df = pandas.read_csv(
+            p,
+            sep=";",
+            header=0,
+            names=header_names,
+            usecols=[0, 1, 2, 3, 4],
+            parse_dates=[0],
+        ).apply(legacy_normalize, axis=1)
+        dfs.append(df)
+    return pandas.concat(dfs, ignore_index=True)
+
+
+def vectorized_read(files):
+    return pandas.concat(
+        [parse_power.read_power_file(p) for p in files], ignore_index=True
+    )
+
+
+DST_CROSSING = (
+    "timestamp;duration;CORE\x1c0;CPU\x1c0;DRAM\x1c0;UNCORE\x1c0;EXIT_CODE\n"
+    "2021-03-28T01:59:56+01:00;1000213;1403321;1834411;1101230;0;0\n"
+    "2021-03-28T01:59:58+01:00;1000102;2514006;2950214;1099871;0;0\n"
+    "2021-03-28T03:00:01+02:00;1000350;1215533;1650012;1100454;0;0\n"
+    "2021-03-28T03:00:04+02:00;1000077;3120946;3561003;1102135;0;0\n"
+)
+
+
+## Both versions on a file crossing the switch to DST, where the UTC offset
+## changes within the file. The row-wise version keeps such timestamps as
+## strings, so the instants are compared in UTC
+def check_dst_crossing():
+    with tempfile.TemporaryDirectory() as tmp:
+        fpath = Path(tmp, "2021-03-28.csv")
+        fpath.write_text(DST_CROSSING)
+        old = legacy_read([fpath])
+        new = vectorized_read([fpath])
+
+    old["timestamp"] = pandas.to_datetime(old["timestamp"], utc=True)
+    new["timestamp"] = new["timestamp"].dt.tz_convert("UTC")
+    pandas.testing.assert_frame_equal(
+        old.astype({c: "float64" for c in ["CORE", "CPU", "DRAM"]}), new,
+        check_dtype=False,
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Compare the row-wise and the vectorized normalization of \
+        power-monitoring csv files"
+    )
+    parser.add_argument(
+        "--input-dir",
+        default=str(Path(parse_power.__file__).parent / "data/power-monitoring-db"),
+        help="directory with power-monitoring csv files",
+    )
+    parser.add_argument(
+        "--files",
+        type=int,
+        default=2,
+        help="number of daily files to benchmark on, the row-wise version \
+        needs minutes for the whole dataset (0 for all)",
+    )
+    args = parser.parse_args()
+
+    files = sorted(Path(args.input_dir).glob("*.csv"))
+    if args.files > 0:
+        files = files[: args.files]
+
+    check_dst_crossing()
+
+    new, t_new = timed(vectorized_read, files)
+    old, t_old = timed(legacy_read, files)
+
+    pandas.testing.assert_frame_equal(
+        old.astype({c: "float64" for c in ["CORE", "CPU", "DRAM"]}), new
+    )
+
+    print("files:      %d" % len(files))
+    print("rows:       %d" % len(new))
+    print("row-wise:   %.3f s (%.0f rows/s)" % (t_old, len(old) / t_old))
+    print("vectorized: %.3f s (%.0f rows/s)" % (t_new, len(new) / t_new))
+    print("speedup:    %.1fx" % (t_old / t_new))
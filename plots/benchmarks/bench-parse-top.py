@@ -0,0 +1,139 @@
+#!/usr/bin/env python
+
+import argparse
+from pathlib import Path
+import re
+import tracemalloc
+
+from common import load_script, timed
+
+parse_top = load_script("parse-top-data.py")
+
+
+## The readlines()/pop() parser that parse-top-data.py used before it was
+## rewritten as a streaming state machine, kept as the reference
+def legacy_csv_rows_generator(lines):
+    if not lines:
+        return
+
+    row = lines.pop()
+    while not row.startswith("top"):
+        if not lines: return
+
+        row = lines.pop().strip()
+
+    yield row.split(" ")[2]
+
+    while not row.startswith("%Cpu"):
+        row = lines.pop().strip()
+
+    cpu_stats = row.split("  ")
+    cpu_us = cpu_stats[1].split(" ")[0]
+    cpu_sy = cpu_stats[2].split(" ")[0]
+    cpu_id = cpu_stats[4].split(" ")[0]
+
+    yield cpu_us
+    yield cpu_sy
+    yield cpu_id
+
+    while not row.startswith("MiB Mem"):
+        row = lines.pop().strip()
+
+    mem = row.split("  ")
+    mem_used = mem[2].strip().split(" ")[0]
+    mem_buff = mem[4].strip().split(" ")[0]
+
+    yield mem_used
+    yield mem_buff
+
+    while not "PID" in row:
+        row = lines.pop().strip()
+
+    procs = []
+    while not row.startswith("top") and lines:
+        row = lines.pop().strip()
+        if not row.startswith("top"):
+            procs.append(row)
+
+    lines.append(row)
+
+    stellar = next(filter(lambda x: "stellar" in x, procs), None)
+    postgres = next(filter(lambda x: "postgres" in x, procs), None)
+
+    if stellar:
+        stellar = re.split(r'\s+', stellar.strip())
+        stellar_cpu = stellar[8]
+        stellar_mem = stellar[9]
+        yield stellar_cpu
+        yield stellar_mem
+    else :
+        yield ""
+        yield ""
+
+    if postgres:
+        postgres = re.split(r'\s+', postgres.strip())
+        postgres_cpu = postgres[8]
+        postgres_mem = postgres[9]
+        yield postgres_cpu
+        yield postgres_mem
+    else :
+        yield ""
+        yield ""
+
+def legacy_read_top_file(fpath, delimiter = ','):
+    with open(fpath, 'r') as f:
+        lines = f.readlines()
+        lines.reverse()
+
+        entries = []
+        while len(lines) > 0:
+            gen = legacy_csv_rows_generator(lines)
+            row = delimiter.join([x for x in gen])
+            entries.append(row)
+        return entries
+
+
+def run(read_fn, files):
+    rows = 0
+    for fpath in files:
+        for _ in read_fn(str(fpath)):
+            rows += 1
+    return rows
+
+
+## Time a run, then repeat it under tracemalloc (which slows it down) to get
+## the peak memory
+def measure(read_fn, files):
+    rows, seconds = timed(run, read_fn, files)
+    tracemalloc.start()
+    run(read_fn, files)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return rows, seconds, peak
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Compare the throughput of the legacy and the streaming \
+        parser of top batch output"
+    )
+    parser.add_argument(
+        "--input-dir",
+        default=str(Path(parse_top.__file__).parent / "data/sysstat-monitoring-db"),
+        help="directory with .top files",
+    )
+    args = parser.parse_args()
+
+    files = sorted(Path(args.input_dir).glob("*.top"))
+    size = sum(p.stat().st_size for p in files) / 1e6
+
+    print("files: %d (%.1f MB)" % (len(files), size))
+    for name, fn in (
+        ("legacy", legacy_read_top_file),
+        ("streaming", parse_top.read_top_file),
+    ):
+        rows, seconds, peak = measure(fn, files)
+        print(
+            "%-10s %d rows in %.3f s (%.1f MB/s), peak memory %.0f kB"
+            % (name + ":", rows, seconds, size / seconds, peak / 1e3)
+        )
@@ -0,0 +1,394 @@
+#!/usr/bin/env python
+
+"""
+Benchmark every parser and the main.py stages on synthetic data (see
+synthetic.py) at one or more scales of days x nodes, e.g.
+
+    python bench-suite.py --scales 1x1 7x1 30x2 --save-baseline baselines/laptop.json
+    python bench-suite.py --scales 1x1 7x1 30x2 --compare baselines/laptop.json
+
+Each stage runs in a fresh process, which reports its wall and CPU time, its
+throughput and its peak RSS. The RSS delta is how much the peak grew while
+the timed part ran, on top of what setting up the stage (imports, loading
+its input where that isn't what is measured) took. With several scales, how
+the time of each stage grows with the size of its input is estimated as the
+exponent k of time ~ size^k: 1 is linear, 2 quadratic.
+"""
+
+import argparse
+import contextlib
+import csv
+import io
+import json
+import math
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from common import load_script
+from profiling import peak_rss_kb
+import synthetic
+
+DEFAULT_WORK_DIR = os.path.join(tempfile.gettempdir(), "eitl01-benchmarks")
+DEFAULT_SCALES = ["1x1", "7x1"]
+DEFAULT_THRESHOLD = 1.25
+
+
+def node_dirs(data_dir, name):
+    return sorted(Path(data_dir, name).glob("node-*"))
+
+
+def files_size(files):
+    return sum(p.stat().st_size for p in files)
+
+
+## The RAPL readings of the first node as main.py loads them
+def load_rapl(data_dir):
+    parse_power = load_script("parse-and-normalize-power-data.py")
+    df = parse_power.read_and_parse_csv(node_dirs(data_dir, "power-monitoring-db")[0])
+    df = df.set_index("timestamp")[["CPU", "DRAM"]]
+    df.columns = ["CPU", "RAM"]
+    return df
+
+
+def rapl_cache(data_dir):
+    from framecache import FrameCache
+
+    data = FrameCache()
+    data.register("rapl", load_rapl(data_dir), max_gap="6s")
+    return data
+
+
+# Every stage is a function setting up the stage and returning the function
+# to time, which returns (bytes of input, rows parsed or processed)
+
+
+def stage_power_parse(data_dir):
+    parse_power = load_script("parse-and-normalize-power-data.py")
+    dirs = node_dirs(data_dir, "power-monitoring-db")
+
+    def run():
+        rows = sum(len(parse_power.read_and_parse_csv(d)) for d in dirs)
+        return files_size(p for d in dirs for p in d.glob("*.csv")), rows
+
+    return run
+
+
+def stage_top_parse(data_dir):
+    parse_top = load_script("parse-top-data.py")
+    files = sorted(p for d in node_dirs(data_dir, "sysstat-monitoring-db") for p in d.glob("*.top"))
+
+    def run():
+        rows = sum(1 for fpath in files for _ in parse_top.read_top_file(str(fpath)))
+        return files_size(files), rows
+
+    return run
+
+
+def stage_vnstat_parse(data_dir):
+    import vnstatjson
+
+    parse_vnstat = load_script("parse-vnstat-data-finegrained.py")
+    fpath = Path(data_dir, "vnstat.5m.json")
+
+    def run():
+        out = csv.writer(io.StringIO())
+        rows = 0
+        with open(fpath, "r") as f:
+            for _, entry in vnstatjson.iter_traffic(f, "fiveminute"):
+                out.writerow(parse_vnstat.flatten_traffic_obj(entry))
+                rows += 1
+        return fpath.stat().st_size, rows
+
+    return run
+
+
+def stage_ledger_fetch(data_dir):
+    fetch = load_script("fetch-ledger-activity.py")
+    cache_dir = os.path.join(data_dir, "horizon-pages")
+    with open(os.path.join(data_dir, "scale.json"), "r") as f:
+        top = json.load(f)["top_ledger"]
+    output = tempfile.NamedTemporaryFile("w", suffix=".csv", delete=False)
+
+    def run():
+        writer = csv.writer(output)
+        known = set()
+        rollup = {}
+
+        def write(records):
+            rows = fetch.write_records(writer, known, records)
+            fetch.add_to_rollup(rollup, rows, "1h")
+            return len(rows)
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            fetch.fetch_range(fetch.API_URL, top, None, "", write, cache_dir, 4)
+        output.close()
+        os.remove(output.name)
+        return files_size(Path(cache_dir).glob("*/*.json.gz")), len(known)
+
+    return run
+
+
+def stage_main_tables(data_dir):
+    import pandas as pd
+
+    main = load_script("main.py")
+    rapl = load_rapl(data_dir)
+    days = pd.date_range(rapl.index[0].normalize(), periods=21, freq="D")
+    network = pd.DataFrame({"rx": 4.5e10, "tx": 5e10}, index=days)
+
+    def run():
+        with contextlib.redirect_stdout(io.StringIO()):
+            summary = main.summarize(rapl)
+            main.print_rapl_table(summary)
+            main.print_summary_table(summary, network, 6.5)
+            main.print_total_power_table(summary, network, 1.67, 132, 6.5)
+        return int(rapl.memory_usage().sum()), len(rapl)
+
+    return run
+
+
+def stage_main_resample(data_dir):
+    from framecache import TIME_MEAN
+
+    data = rapl_cache(data_dir)
+
+    def run():
+        data.get("rapl", "1h", "mean")
+        data.get("rapl", "5min", "mean")
+        data.get("rapl", "1h", TIME_MEAN)
+        rapl = data.get("rapl")
+        return int(rapl.memory_usage().sum()), len(rapl)
+
+    return run
+
+
+## Ledgers close about every 5 s
+LEDGER_SECONDS = 5
+
+
+def stage_align(data_dir):
+    import pandas as pd
+
+    import align
+
+    rapl = load_rapl(data_dir)
+    closes = pd.date_range(rapl.index[0], rapl.index[-1], freq="%ds" % LEDGER_SECONDS)
+
+    def run():
+        align.interval_mean(rapl, closes, max_gap="6s")
+        align.asof(rapl, closes, "nearest", tolerance="6s")
+        return int(rapl.memory_usage().sum()), len(rapl) + len(closes)
+
+    return run
+
+
+def stage_main_plot(data_dir):
+    import matplotlib
+
+    matplotlib.use("Agg")
+    main = load_script("main.py")
+    data = rapl_cache(data_dir)
+    output_dir = tempfile.mkdtemp()
+
+    def run():
+        main.plot_rapl_readings(data, output_dir)
+        rapl = data.get("rapl")
+        return int(rapl.memory_usage().sum()), len(rapl)
+
+    return run
+
+
+STAGES = {
+    "power-parse": stage_power_parse,
+    "top-parse": stage_top_parse,
+    "vnstat-parse": stage_vnstat_parse,
+    "ledger-fetch": stage_ledger_fetch,
+    "main-tables": stage_main_tables,
+    "main-resample": stage_main_resample,
+    "align": stage_align,
+    "main-plot": stage_main_plot,
+}
+
+
+## Run a stage in this process and return its measurements
+def run_stage(name, data_dir):
+    run = STAGES[name](data_dir)
+    rss_before = peak_rss_kb()
+    cpu = time.process_time()
+    start = time.perf_counter()
+    size, rows = run()
+    seconds = time.perf_counter() - start
+    cpu_seconds = time.process_time() - cpu
+    peak = peak_rss_kb()
+    return {
+        "stage": name,
+        "bytes": size,
+        "rows": rows,
+        "seconds": seconds,
+        "cpu_seconds": cpu_seconds,
+        "peak_rss_kb": peak,
+        "rss_delta_kb": peak - rss_before,
+    }
+
+
+## Run a stage in a fresh process, so that its peak RSS is its own
+def spawn_stage(name, data_dir):
+    out = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--run-stage", name, "--data-dir", data_dir],
+        check=True,
+        stdout=subprocess.PIPE,
+        text=True,
+    )
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def parse_scale(arg):
+    days, sep, nodes = arg.partition("x")
+    try:
+        scale = (int(days), int(nodes))
+    except ValueError:
+        scale = None
+    if not sep or scale is None or min(scale) < 1:
+        raise argparse.ArgumentTypeError("expected DAYSxNODES, got '%s'" % arg)
+    return scale
+
+
+def print_results(results):
+    print(
+        "%-14s %8s %9s %10s %8s %9s %11s %9s %9s"
+        % ("stage", "scale", "input MB", "rows", "s", "MB/s", "rows/s", "peak MB", "delta MB")
+    )
+    for r in results:
+        print(
+            "%-14s %8s %9.1f %10d %8.3f %9.1f %11.0f %9.1f %9.1f"
+            % (
+                r["stage"],
+                "%dx%d" % (r["days"], r["nodes"]),
+                r["bytes"] / 1e6,
+                r["rows"],
+                r["seconds"],
+                r["bytes"] / 1e6 / r["seconds"],
+                r["rows"] / r["seconds"],
+                r["peak_rss_kb"] / 1024,
+                r["rss_delta_kb"] / 1024,
+            )
+        )
+
+
+## Estimate k in time ~ input size^k between the smallest and largest scale
+def print_scaling(results):
+    for stage in STAGES:
+        runs = sorted((r["bytes"], r["seconds"]) for r in results if r["stage"] == stage)
+        if len(runs) < 2 or runs[0][0] == runs[-1][0]:
+            continue
+        (b0, t0), (b1, t1) = runs[0], runs[-1]
+        k = math.log(t1 / t0) / math.log(b1 / b0)
+        print("%-14s time ~ size^%.2f over %.0fx the input" % (stage, k, b1 / b0))
+
+
+def key(result):
+    return result["stage"], result["days"], result["nodes"]
+
+
+## Compare with stored results. Returns the number of regressions: stages
+## which got slower or use more memory by more than threshold
+def compare(results, baseline, threshold):
+    stored = {key(r): r for r in baseline["results"]}
+    regressions = 0
+    print("%-14s %8s %8s %8s" % ("stage", "scale", "time", "peak RSS"))
+    for r in results:
+        old = stored.get(key(r))
+        if old is None:
+            continue
+        time_ratio = r["seconds"] / old["seconds"]
+        rss_ratio = r["peak_rss_kb"] / old["peak_rss_kb"]
+        flag = ""
+        if time_ratio > threshold or rss_ratio > threshold:
+            flag = "REGRESSION"
+            regressions += 1
+        print(
+            "%-14s %8s %7.2fx %7.2fx %s"
+            % (r["stage"], "%dx%d" % (r["days"], r["nodes"]), time_ratio, rss_ratio, flag)
+        )
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Benchmark the parsers and main.py stages on synthetic data"
+    )
+    parser.add_argument(
+        "--scales",
+        nargs="+",
+        type=parse_scale,
+        default=[parse_scale(s) for s in DEFAULT_SCALES],
+        metavar="DAYSxNODES",
+        help="scales to generate and benchmark (default: %s)" % " ".join(DEFAULT_SCALES),
+    )
+    parser.add_argument(
+        "--stages",
+        nargs="+",
+        choices=list(STAGES),
+        default=list(STAGES),
+        help="stages to run (default: all)",
+    )
+    parser.add_argument(
+        "--work-dir",
+        default=DEFAULT_WORK_DIR,
+        help="where the synthetic data is generated, and kept for later runs \
+        (default: %s)" % DEFAULT_WORK_DIR,
+    )
+    parser.add_argument(
+        "--save-baseline",
+        help="store the results as json, to --compare later runs with",
+    )
+    parser.add_argument(
+        "--compare",
+        help="compare with results stored with --save-baseline, exiting with \
+        status 1 on regressions",
+    )
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=DEFAULT_THRESHOLD,
+        help="ratio of time or peak RSS to the baseline counted as a \
+        regression (default: %.2f)" % DEFAULT_THRESHOLD,
+    )
+    parser.add_argument("--run-stage", choices=list(STAGES), help=argparse.SUPPRESS)
+    parser.add_argument("--data-dir", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_stage:
+        print(json.dumps(run_stage(args.run_stage, args.data_dir)))
+        sys.exit(0)
+
+    results = []
+    for days, nodes in args.scales:
+        data_dir = os.path.join(args.work_dir, "%dx%d" % (days, nodes))
+        print("Generating %d days x %d nodes in %s ..." % (days, nodes, data_dir), file=sys.stderr)
+        synthetic.generate(data_dir, days, nodes)
+        for stage in args.stages:
+            print("Running %s ..." % stage, file=sys.stderr)
+            result = spawn_stage(stage, data_dir)
+            result.update(days=days, nodes=nodes)
+            results.append(result)
+
+    print_results(results)
+    print()
+    print_scaling(results)
+
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(os.path.abspath(args.save_baseline)), exist_ok=True)
+        with open(args.save_baseline, "w") as f:
+            json.dump({"results": results}, f, indent=2)
+
+    if args.compare:
+        with open(args.compare, "r") as f:
+            baseline = json.load(f)
+        print()
+        if compare(results, baseline, args.threshold):
+            sys.exit(1)
@@ -0,0 +1,28 @@
+import importlib.util
+import os
+import sys
+import time
+
+PLOTS_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Make the helper modules the scripts import (datastore, parallel, ...)
+# importable when running from the benchmarks directory
+if PLOTS_DIR not in sys.path:
+    sys.path.insert(0, PLOTS_DIR)
+
+
+## The scripts in plots/ have hyphenated names, so they are loaded by path
+## rather than imported
+def load_script(name):
+    path = os.path.join(PLOTS_DIR, name)
+    spec = importlib.util.spec_from_file_location(name.replace("-", "_")[:-3], path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+## Run fn once and return (result, seconds)
+def timed(fn, *args, **kwargs):
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return result, time.perf_counter() - start
@@ -0,0 +1,201 @@
+#!/usr/bin/env python
+
+"""
+Generators of realistic synthetic input data for the benchmarks, at a
+configurable scale of days x nodes:
+
+- power-monitoring-db/node-N/YYYY-MM-DD.csv as written by manager.sh, a
+  reading every 1-6 s
+- sysstat-monitoring-db/node-N/YYYY-MM-DD.top as written by top -b, 30
+  one-second samples every half hour
+- vnstat.5m.json, a vnstat --json f export with one interface per node
+- horizon-pages/, Horizon /ledgers pages for every ledger of the period (one
+  every 5 s, however many nodes) in the cache format of
+  fetch-ledger-activity.py
+
+The data is random but seeded, so a scale always generates the same files.
+"""
+
+import argparse
+import gzip
+import json
+import os
+
+import numpy as np
+
+from common import load_script
+
+START = np.datetime64("2021-05-13T00:00:00")
+UTC_OFFSET = "+02:00"
+DAY_SECONDS = 86400
+LEDGER_SECONDS = 5
+PAGE_LIMIT = 200
+
+POWER_HEADER = "timestamp;duration;CORE\x1c0;CPU\x1c0;DRAM\x1c0;UNCORE\x1c0;EXIT_CODE\n"
+
+
+def day_name(day):
+    return str(START.astype("datetime64[D]") + day)
+
+
+## Readings of one day: a ~1 s window followed by a 0-5 s delay, like
+## manager.sh, with the power (W) of each domain drifting around its mean
+def power_day(rng, day):
+    n = DAY_SECONDS // 3
+    offsets = np.cumsum(rng.uniform(1.0, 6.0, n))
+    offsets = offsets[offsets < DAY_SECONDS].astype("int64")
+    n = len(offsets)
+    times = np.datetime_as_string(START + np.timedelta64(day * DAY_SECONDS, "s") + offsets, unit="s")
+
+    duration = rng.integers(1000000, 1010000, n)
+    core = rng.gamma(2.0, 1.2, n)
+    cpu = core + rng.uniform(0.3, 0.5, n)
+    dram = rng.normal(1.1, 0.02, n)
+    energies = [(p * duration).astype("int64") for p in (core, cpu, dram)]
+
+    lines = [
+        "%s%s;%d;%d;%d;%d;0;0\n" % (t, UTC_OFFSET, d, c, p, r)
+        for t, d, c, p, r in zip(times, duration, *energies)
+    ]
+    return POWER_HEADER + "".join(lines)
+
+
+TOP_SAMPLE = """top - %s up 20 days, 11:50,  0 users,  load average: 1.43, 0.77, 0.64
+Tasks:   2 total,   0 running,   2 sleeping,   0 stopped,   0 zombie
+%%Cpu(s): %4.1f us, %4.1f sy,  0.0 ni, %4.1f id,  0.0 wa,  0.0 hi,  0.4 si,  0.0 st
+MiB Mem :  31900.5 total,   9772.8 free, %8.1f used,  21618.2 buff/cache
+MiB Swap:  16367.0 total,  16367.0 free,      0.0 used.  30799.5 avail Mem
+
+    PID USER      PR  NI    VIRT    RES    SHR S  %%CPU  %%MEM     TIME+ COMMAND
+ 282031 stellar   20   0 1135372 %6d  14240 S %5.1f   0.8   2469:13 stellar+
+ 282052 postgres  20   0  224060 160584 151232 S %5.1f   0.5 791:52.68 postgres
+
+"""
+
+
+## Windows of 30 one-second samples at a random time in every half hour
+def top_day(rng, day):
+    samples = []
+    for window in range(48):
+        start = window * 1800 + int(rng.integers(0, 1740))
+        for second in range(30):
+            t = start + second
+            us, sy = rng.uniform(0, 20), rng.uniform(0, 3)
+            samples.append(
+                TOP_SAMPLE
+                % (
+                    "%02d:%02d:%02d" % (t // 3600, t // 60 % 60, t % 60),
+                    us,
+                    sy,
+                    100 - us - sy,
+                    rng.uniform(500, 520),
+                    rng.integers(250000, 260000),
+                    rng.uniform(0, 40),
+                    rng.uniform(0, 10),
+                )
+            )
+    return "".join(samples)
+
+
+def vnstat_entry(i, minutes):
+    day = START.astype("datetime64[D]") + minutes // 1440
+    y, m, d = (int(v) for v in str(day).split("-"))
+    return '{"id":%d,"date":{"year":%d,"month":%d,"day":%d},"time":{"hour":%d,"minute":%d},"rx":%d,"tx":%d}' % (
+        i, y, m, d, minutes // 60 % 24, minutes % 60, 238000000 + i % 997 * 1000, 268000000 + i % 991 * 1000
+    )
+
+
+## A vnstat --json f export, written entry by entry
+def write_vnstat(fpath, days, nodes):
+    with open(fpath, "w") as f:
+        f.write('{"vnstatversion":"2.6","jsonversion":"2","interfaces":[')
+        for node in range(nodes):
+            if node:
+                f.write(",")
+            f.write('{"name":"eth%d","alias":"","traffic":{"total":{"rx":0,"tx":0},"fiveminute":[' % node)
+            f.write(",".join(vnstat_entry(i, i * 5) for i in range(days * 288)))
+            f.write("]}}")
+        f.write("]}")
+
+
+def ledger_record(sequence):
+    closed = START + np.timedelta64(sequence * LEDGER_SECONDS, "s")
+    ops = 100 + sequence * 7919 % 400
+    return {
+        "id": "%064x" % sequence,
+        "paging_token": str(sequence << 32),
+        "hash": "%064x" % (sequence * 31),
+        "prev_hash": "%064x" % ((sequence - 1) * 31),
+        "sequence": sequence,
+        "successful_transaction_count": ops // 3,
+        "failed_transaction_count": ops // 20,
+        "operation_count": ops,
+        "tx_set_operation_count": ops + ops // 10,
+        "closed_at": str(closed) + "Z",
+        "total_coins": "105443902087.3472865",
+        "fee_pool": "1807038.9150720",
+        "base_fee_in_stroops": 100,
+        "base_reserve_in_stroops": 5000000,
+        "max_tx_set_size": 1000,
+        "protocol_version": 16,
+    }
+
+
+## Pages of ledgers 1 to days' worth, newest first, in the cache of
+## fetch-ledger-activity.py for its API_URL: the page below cursor
+## (sequence << 32) holds the PAGE_LIMIT ledgers below sequence. Returns the
+## sequence above the newest
+def write_horizon_pages(cache_dir, days):
+    fetch = load_script("fetch-ledger-activity.py")
+    os.makedirs(os.path.dirname(fetch.page_path(cache_dir, fetch.API_URL, 0)), exist_ok=True)
+    top = days * DAY_SECONDS // LEDGER_SECONDS + 1
+    for sequence in range(top, 1, -PAGE_LIMIT):
+        records = [ledger_record(s) for s in range(sequence - 1, max(sequence - 1 - PAGE_LIMIT, 0), -1)]
+        page = {"_links": {}, "_embedded": {"records": records}}
+        with gzip.open(fetch.page_path(cache_dir, fetch.API_URL, sequence << 32), "wt") as f:
+            json.dump(page, f)
+    return top
+
+
+"""
+Write the synthetic data of days x nodes to output_dir, unless it was already
+generated there. Returns a description of the generated data
+"""
+def generate(output_dir, days, nodes, seed=0):
+    marker = os.path.join(output_dir, "scale.json")
+    if os.path.isfile(marker):
+        with open(marker, "r") as f:
+            return json.load(f)
+
+    rng = np.random.default_rng(seed)
+    for node in range(nodes):
+        power_dir = os.path.join(output_dir, "power-monitoring-db", "node-%d" % node)
+        top_dir = os.path.join(output_dir, "sysstat-monitoring-db", "node-%d" % node)
+        os.makedirs(power_dir, exist_ok=True)
+        os.makedirs(top_dir, exist_ok=True)
+        for day in range(days):
+            with open(os.path.join(power_dir, day_name(day) + ".csv"), "w") as f:
+                f.write(power_day(rng, day))
+            with open(os.path.join(top_dir, day_name(day) + ".top"), "w") as f:
+                f.write(top_day(rng, day))
+
+    write_vnstat(os.path.join(output_dir, "vnstat.5m.json"), days, nodes)
+    top = write_horizon_pages(os.path.join(output_dir, "horizon-pages"), days)
+
+    scale = {"days": days, "nodes": nodes, "seed": seed, "top_ledger": top}
+    with open(marker, "w") as f:
+        json.dump(scale, f)
+    return scale
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Generate synthetic input data for the benchmarks"
+    )
+    parser.add_argument("output_dir", help="directory to write the data to")
+    parser.add_argument("--days", type=int, default=7, help="(default: 7)")
+    parser.add_argument("--nodes", type=int, default=1, help="(default: 1)")
+    parser.add_argument("--seed", type=int, default=0, help="(default: 0)")
+    args = parser.parse_args()
+
+    print(generate(args.output_dir, args.days, args.nodes, args.seed))
@@ -0,0 +1,205 @@
+#!/usr/bin/env python
+
+"""
+Typed, compressed columnar (Parquet) copies of the csv files used by main.py.
+
+A csv such as data/top-stats.csv can be accompanied by data/top-stats.parquet,
+holding the same columns with the timestamps as a datetime index. main.py
+reads the parquet file instead of parsing the csv whenever it is at least as
+new as the csv. Reading and writing parquet requires pyarrow.
+
+Rows are sorted by time and stored in one row group per day, whose min/max
+timestamps are kept in the file footer. read_range() uses those to read only
+the row groups overlapping the range asked for, so reading a day costs the
+same however much history the file holds.
+"""
+
+import argparse
+import bisect
+import os
+
+import numpy as np
+import pandas as pd
+
+COLUMNAR_EXT = ".parquet"
+COMPRESSION = "zstd"
+
+# Time span of the rows in a row group
+ROW_GROUP_FREQ = "1D"
+
+
+def columnar_path(csv_path):
+    return os.path.splitext(csv_path)[0] + COLUMNAR_EXT
+
+
+"""
+True if csv_path has a columnar copy which is not older than the csv itself
+"""
+def has_fresh_columnar(csv_path):
+    path = columnar_path(csv_path)
+    if not os.path.isfile(path):
+        return False
+    if not os.path.isfile(csv_path):
+        return True
+    return os.path.getmtime(path) >= os.path.getmtime(csv_path)
+
+
+"""
+Use the timestamp column as index. Column types are kept as they are, since
+the byte counters are summed over hours and would overflow narrower integers.
+An index read_csv left as text is parsed here, and the rows whose timestamp
+doesn't parse (e.g. the '2021-05-17 ' rows of a truncated top output) dropped.
+Integer timestamps, like those of read-vnstat-db.py, are seconds since the
+epoch.
+"""
+def to_columnar_frame(df):
+    if "timestamp" in df.columns:
+        df = df.set_index("timestamp")
+    if pd.api.types.is_integer_dtype(df.index):
+        df.index = pd.to_datetime(df.index, unit="s", utc=True)
+    elif not pd.api.types.is_datetime64_any_dtype(df.index):
+        try:
+            index = pd.to_datetime(df.index, errors="coerce")
+        except ValueError:
+            # Mixed UTC offsets (e.g. a DST change) can't be stored as one column
+            index = pd.to_datetime(df.index, errors="coerce", utc=True)
+        df = df[~index.isna()]
+        df.index = index[~index.isna()]
+    return df
+
+
+"""
+Split a frame with a datetime index into consecutive frames of one freq each,
+sorting it by time first if needed
+"""
+def time_chunks(df, freq=ROW_GROUP_FREQ):
+    if not df.index.is_monotonic_increasing:
+        df = df.sort_index(kind="stable")
+    if df.empty:
+        yield df
+        return
+    edges = pd.date_range(df.index[0].floor(freq), df.index[-1], freq=freq)
+    bounds = list(df.index.searchsorted(edges[1:])) + [len(df)]
+    start = 0
+    for end in bounds:
+        if end > start:
+            yield df.iloc[start:end]
+        start = end
+
+
+def write_columnar(df, fpath):
+    write_columnar_chunks(time_chunks(to_columnar_frame(df)), fpath)
+
+
+"""
+Write an iterable of dataframes with identical columns to one parquet file,
+one row group per frame, without holding more than one frame in memory
+"""
+def write_columnar_chunks(frames, fpath):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    writer = None
+    tz = None
+    try:
+        for df in frames:
+            df = to_columnar_frame(df)
+            if writer is None:
+                tz = getattr(df.index, "tz", None)
+            elif tz is not None and df.index.tz != tz:
+                df.index = df.index.tz_convert(tz)
+            table = pa.Table.from_pandas(df, preserve_index=True)
+            if writer is None:
+                writer = pq.ParquetWriter(fpath, table.schema, compression=COMPRESSION)
+            writer.write_table(table)
+    finally:
+        if writer is not None:
+            writer.close()
+
+
+def read_columnar(fpath, columns=None):
+    return pd.read_parquet(fpath, columns=columns)
+
+
+"""
+Read the rows of a columnar file with start <= timestamp < end (either may be
+None). Only the row groups whose min/max timestamps overlap the range are
+read, which relies on the rows being sorted by time as write_columnar() and
+write_columnar_chunks() with consecutive chunks write them. Bounds without a
+timezone are taken to be in the timezone of the file
+"""
+def read_range(fpath, start=None, end=None, columns=None):
+    import pyarrow.parquet as pq
+
+    f = pq.ParquetFile(fpath)
+    tz = f.schema_arrow.field("timestamp").type.tz
+
+    def bound(value):
+        if value is None:
+            return None
+        value = pd.Timestamp(value)
+        if value.tz is None and tz is not None:
+            value = value.tz_localize(tz)
+        return value
+
+    start, end = bound(start), bound(end)
+    meta = f.metadata
+    paths = [meta.schema.column(i).path for i in range(meta.num_columns)]
+    ts_column = paths.index("timestamp")
+
+    # Row groups are in time order, so the overlapping ones are found by
+    # bisecting on their min/max timestamps, which is O(log n) in the number
+    # of row groups and leaves the rest of the footer alone
+    def stat(i, name):
+        stats = meta.row_group(i).column(ts_column).statistics
+        if stats is None or not stats.has_min_max:
+            raise LookupError
+        return pd.Timestamp(getattr(stats, name))
+
+    count = meta.num_row_groups
+    try:
+        first = 0 if start is None else bisect.bisect_left(
+            range(count), start, key=lambda i: stat(i, "max")
+        )
+        last = count if end is None else bisect.bisect_left(
+            range(count), end, key=lambda i: stat(i, "min")
+        )
+        groups = list(range(first, last))
+    except LookupError:
+        groups = list(range(count))
+
+    if columns is not None:
+        columns = list(columns) + ["timestamp"]
+    df = f.read_row_groups(groups, columns=columns).to_pandas()
+    keep = np.ones(len(df), dtype=bool)
+    if start is not None:
+        keep &= df.index >= start
+    if end is not None:
+        keep &= df.index < end
+    return df[keep]
+
+
+"""
+Convert a csv in the format read by main.py (timestamp as first column) to
+its columnar copy. The timestamps are parsed by to_columnar_frame()
+"""
+def convert_csv(csv_path, output_path=None):
+    df = pd.read_csv(csv_path, index_col=0)
+    write_columnar(df, output_path or columnar_path(csv_path))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Convert csv files with a timestamp column to columnar \
+        (parquet) copies next to them, which main.py then reads instead"
+    )
+    parser.add_argument(
+        "input_files",
+        nargs="+",
+        help="csv files to convert, e.g. data/top-stats.csv",
+    )
+    args = parser.parse_args()
+
+    for fpath in args.input_files:
+        print("Converting", fpath, "->", columnar_path(fpath))
+        convert_csv(fpath)
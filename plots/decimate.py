@@ -0,0 +1,81 @@
+"""
+Pixel-aware decimation of long time series before plotting them as lines.
+
+A line through a million readings is drawn into a few hundred pixel columns,
+so almost all of its points are lost in the rendering, yet every one of them
+is drawn and stored in the PDF. m4() keeps only the first, last, smallest and
+largest sample of every column of every pixel-wide bucket of time (M4
+aggregation). A line through those rows covers the same pixels as the full
+series, so peaks and dips are kept exactly, and plotting time and file size
+depend on the width of the plot instead of the length of the series.
+"""
+
+import numpy as np
+
+# Frames with at most this many rows per bucket are plotted as they are
+MIN_ROWS_PER_BUCKET = 4
+
+# Buckets per pixel column. The buckets span the data, which usually doesn't
+# line up with the pixels of the axes (the x limits are set after plotting),
+# so more than one per pixel keeps the extremes of every column
+BUCKETS_PER_PIXEL = 2
+
+
+"""
+Width in pixels of ax in the saved figure (at savefig.dpi, or the dpi of the
+figure if that is "figure")
+"""
+def axes_pixels(ax):
+    import matplotlib as mpl
+
+    fig = ax.get_figure()
+    dpi = mpl.rcParams["savefig.dpi"]
+    if dpi == "figure":
+        dpi = fig.dpi
+    width_inches = ax.get_position().width * fig.get_figwidth()
+    return max(int(width_inches * dpi), 1)
+
+
+## Positions of the smallest and largest non-NaN value of every bucket.
+## buckets must be sorted, as it is for a sorted index
+def extreme_positions(values, buckets):
+    idx = np.flatnonzero(~np.isnan(values))
+    if not len(idx):
+        return idx
+    order = idx[np.lexsort((values[idx], buckets[idx]))]
+    b = buckets[order]
+    change = b[1:] != b[:-1]
+    first = np.concatenate([[True], change])
+    last = np.concatenate([change, [True]])
+    return np.concatenate([order[first], order[last]])
+
+
+"""
+The rows of df (with a sorted datetime or numeric index) needed to draw its
+columns as lines into n buckets of time: the first and last row of every
+bucket, and the rows with the smallest and largest value of every column in
+it. Frames with few rows per bucket are returned as they are
+"""
+def m4(df, n):
+    if len(df) <= MIN_ROWS_PER_BUCKET * n or not df.index.is_monotonic_increasing:
+        return df
+
+    x = np.asarray(df.index.asi8 if hasattr(df.index, "asi8") else df.index, dtype="float64")
+    span = x[-1] - x[0]
+    if span <= 0:
+        return df
+    buckets = np.minimum(((x - x[0]) / span * n).astype("int64"), n - 1)
+
+    change = np.flatnonzero(buckets[1:] != buckets[:-1])
+    keep = [np.array([0, len(df) - 1]), change, change + 1]
+    for column in df.columns:
+        values = df[column].to_numpy(dtype="float64", na_value=np.nan)
+        keep.append(extreme_positions(values, buckets))
+    return df.iloc[np.unique(np.concatenate(keep))]
+
+
+"""
+df decimated with m4() to the pixel width of ax, for df.plot(ax=ax)
+"""
+def for_axes(df, ax):
+    return m4(df, axes_pixels(ax) * BUCKETS_PER_PIXEL)
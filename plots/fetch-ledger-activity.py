@@ -1,16 +1,57 @@
 #!/usr/bin/env python
 
 import argparse
+from concurrent.futures import ThreadPoolExecutor
+from collections import deque
+import csv
+import gzip
+import hashlib
+from urllib.error import HTTPError, URLError
+from urllib.parse import parse_qs, parse_qsl, urlencode, urlsplit, urlunsplit
 from urllib.request import urlopen, Request
 import json
-import csv
+import os
+import random
+import time
 
 API_URL = "https://horizon.stellar.org/ledgers?limit=200&order=desc"
 
-def fetch_data(url):
+CSV_HEADER = ["timestamp", "ops", "txs", "ftxs", "ledger"]
+
+# Rollups of the activity that can be maintained while fetching, as the
+# number of characters of a Horizon timestamp (2021-05-15T12:34:56Z) that
+# identify the bucket and the minutes per bucket
+ROLLUPS = {"1h": (13, 60), "5min": (16, 5)}
+ROLLUP_METRICS = ["ops", "txs", "ftxs"]
+ROLLUP_HEADER = (
+    ["timestamp", "ledgers"]
+    + ROLLUP_METRICS
+    + [m + "_mean" for m in ROLLUP_METRICS]
+)
+
+RETRIES = 6
+BACKOFF_SECONDS = 1.0
+RETRY_STATUS = (429, 500, 502, 503, 504)
+
+
+## Fetch a JSON document, retrying with exponential backoff (and jitter) on
+## connection errors, rate limiting and server errors
+def fetch_data(url, retries=RETRIES):
     r = Request(url, headers={"User-Agent": "Mozilla/5.0"})
-    with urlopen(r) as response:
-        return json.loads(response.read())
+    for attempt in range(retries + 1):
+        try:
+            with urlopen(r) as response:
+                return json.loads(response.read())
+        except HTTPError as e:
+            if e.code not in RETRY_STATUS or attempt == retries:
+                raise
+            delay = e.headers.get("Retry-After")
+            delay = float(delay) if delay else BACKOFF_SECONDS * 2 ** attempt
+        except URLError:
+            if attempt == retries:
+                raise
+            delay = BACKOFF_SECONDS * 2 ** attempt
+        time.sleep(delay * (1 + random.random() / 2))
 
 
 def filter_record(entry):
@@ -20,6 +61,7 @@ def filter_record(entry):
             "ops": entry["operation_count"],
             "txs": entry["successful_transaction_count"],
             "ftxs": entry["failed_transaction_count"],
+            "ledger": entry["sequence"],
         }
     )
 
@@ -29,32 +71,348 @@ def filter_records(entries):
 
 
 def record_to_list(r):
-    return [r["timestamp"], r["ops"], r["txs"], r["ftxs"]]
+    return [r["timestamp"], r["ops"], r["txs"], r["ftxs"], r["ledger"]]
 
 
-def fetch_all_items(startdate, starturl, writer):
-    url = starturl
-    start_url = ""
-    while True:
-        response = fetch_data(url)
-        print("Fetching: ", url)
-        if "status" in response or (not "_embedded" in response):
-            break
+def page_limit(url):
+    return int(parse_qs(urlsplit(url).query).get("limit", ["10"])[0])
+
+
+def with_cursor(url, cursor):
+    parts = urlsplit(url)
+    query = parse_qs(parts.query)
+    query["cursor"] = [str(cursor)]
+    return urlunsplit(parts._replace(query=urlencode(query, doseq=True)))
+
+
+## A key identifying the pages of url whatever their cursor: a hash of the
+## url without its cursor, with the query in a canonical order
+def url_key(url):
+    parts = urlsplit(url)
+    query = sorted(
+        (k, v) for k, v in parse_qsl(parts.query) if k != "cursor"
+    )
+    canonical = urlunsplit(parts._replace(query=urlencode(query), fragment=""))
+    return hashlib.sha256(canonical.encode()).hexdigest()[:16]
+
+
+## Path of the cached page of url below cursor in cache_dir
+def page_path(cache_dir, url, cursor):
+    return os.path.join(cache_dir, url_key(url), "%d.json.gz" % cursor)
+
+
+## Horizon's paging token for a ledger is its sequence shifted 32 bits left.
+## Paging with order=desc from the token of ledger L returns the ledgers
+## below L, so the cursor of every page can be computed up front
+def ledger_cursor(sequence):
+    return sequence << 32
+
+
+"""
+Fetch pages of /ledgers through a cache of raw responses on disk, keyed by
+the url (see url_key()) and cursor, so pages of another server or with
+another limit are never mixed up. Pages below the head of the ledger are
+immutable, so cached pages never need to be refetched.
+"""
+def fetch_page(url, cursor, cache_dir):
+    fpath = page_path(cache_dir, url, cursor)
+    if os.path.isfile(fpath):
+        with gzip.open(fpath, "rt") as f:
+            return json.load(f)
+
+    response = fetch_data(with_cursor(url, cursor))
+    os.makedirs(os.path.dirname(fpath), exist_ok=True)
+    tmp = fpath + ".tmp"
+    with gzip.open(tmp, "wt") as f:
+        json.dump(response, f)
+    os.replace(tmp, fpath)
+    return response
+
+
+def page_records(response):
+    if "status" in response or (not "_embedded" in response):
+        return []
+    return response["_embedded"]["records"]
+
+
+## Fetch the pages below the paging tokens in cursors (highest
+## first) with a bounded number of concurrent requests, yielding the records
+## of every page in order. Stops requesting pages once the consumer stops
+## iterating
+def fetch_pages(url, cursors, cache_dir, concurrency):
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        pending = deque()
+        try:
+            for cursor in cursors:
+                pending.append(pool.submit(fetch_page, url, cursor, cache_dir))
+                if len(pending) >= 2 * concurrency:
+                    yield page_records(pending.popleft().result())
+            while pending:
+                yield page_records(pending.popleft().result())
+        finally:
+            for future in pending:
+                future.cancel()
+
+
+def page_sequences(top, bottom, limit):
+    sequence = top
+    while sequence > bottom:
+        yield sequence
+        sequence -= limit
+
+
+def read_state(fpath):
+    if not os.path.isfile(fpath):
+        return None
+    with open(fpath, "r") as f:
+        return json.load(f)
+
+
+def write_state(fpath, state):
+    tmp = fpath + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(state, f, indent=2)
+    os.replace(tmp, fpath)
+
+
+"""
+Rewrite a csv of the earlier version of this script, which had no header and
+no ledger column, in the current format. The rows are kept in their order,
+with an empty ledger, and duplicates (of runs which fetched the same ledgers
+again) are dropped.
+"""
+def migrate_headerless(fpath):
+    print("Migrating", fpath, "to the columns", ",".join(CSV_HEADER))
+    tmp = fpath + ".tmp"
+    seen = set()
+    with open(fpath, "r") as f, open(tmp, "w") as out:
+        writer = csv.writer(out, delimiter=",")
+        writer.writerow(CSV_HEADER)
+        for row in csv.reader(f):
+            if row and row[0] not in seen:
+                seen.add(row[0])
+                writer.writerow(row[:4] + [""])
+    os.replace(tmp, fpath)
+
+
+"""
+The ledgers already in the output csv, by sequence, or by close time for rows
+migrated from the headerless format (see migrate_headerless()), which have no
+sequence
+"""
+def read_known_ledgers(fpath):
+    if not os.path.isfile(fpath) or os.path.getsize(fpath) == 0:
+        return set()
+    with open(fpath, "r") as f:
+        header = next(csv.reader(f))
+    if len(header) == 4 and header[0] != "timestamp":
+        migrate_headerless(fpath)
+    elif header != CSV_HEADER:
+        raise ValueError(
+            "%s has columns %s, expected %s" % (fpath, header, CSV_HEADER)
+        )
+
+    with open(fpath, "r") as f:
+        reader = csv.reader(f)
+        next(reader)
+        return {int(row[4]) if row[4] else row[0] for row in reader}
+
+
+## Append the records of ledgers which are not in known (see
+## read_known_ledgers()) to the csv output. Returns the rows that were written
+def write_records(writer, known, records):
+    rows = [
+        record_to_list(r)
+        for r in filter_records(records)
+        if r["ledger"] not in known and r["timestamp"] not in known
+    ]
+    known.update(r[4] for r in rows)
+    writer.writerows(rows)
+    return rows
 
-        entries = filter_records(response["_embedded"]["records"])
-        entries = list(map(record_to_list, entries))
 
-        writer.writerows(entries)
+def rollup_path(output_fpath, freq):
+    base, ext = os.path.splitext(output_fpath)
+    return base + "." + freq + ext
 
-        beg_date = entries[0][0]
-        if beg_date.startswith(startdate):
+
+## Start of the bucket of a Horizon timestamp, in the same format
+def rollup_bucket(timestamp, freq):
+    width, minutes = ROLLUPS[freq]
+    if minutes == 60:
+        return timestamp[:width] + ":00:00Z"
+    minute = int(timestamp[14:16]) // minutes * minutes
+    return timestamp[:14] + "%02d:00Z" % minute
+
+
+## Add rows in the format of CSV_HEADER to a rollup, which maps the start of
+## each bucket to [ledgers, ops, txs, ftxs]
+def add_to_rollup(rollup, rows, freq):
+    for row in rows:
+        bucket = rollup_bucket(row[0], freq)
+        totals = rollup.get(bucket)
+        if totals is None:
+            totals = rollup[bucket] = [0, 0, 0, 0]
+        totals[0] += 1
+        totals[1] += int(row[1])
+        totals[2] += int(row[2])
+        totals[3] += int(row[3])
+
+
+def read_rollup(fpath):
+    rollup = {}
+    if not os.path.isfile(fpath):
+        return rollup
+    with open(fpath, "r") as f:
+        reader = csv.reader(f)
+        next(reader)
+        for row in reader:
+            rollup[row[0]] = [int(v) for v in row[1:5]]
+    return rollup
+
+
+def write_rollup(fpath, rollup):
+    tmp = fpath + ".tmp"
+    with open(tmp, "w") as f:
+        writer = csv.writer(f, delimiter=",")
+        writer.writerow(ROLLUP_HEADER)
+        for bucket in sorted(rollup):
+            n, ops, txs, ftxs = rollup[bucket]
+            writer.writerow(
+                [bucket, n, ops, txs, ftxs]
+                + ["%.6g" % (v / n) for v in (ops, txs, ftxs)]
+            )
+    os.replace(tmp, fpath)
+
+
+def rebuild_rollup(output_fpath, freq):
+    rollup = {}
+    if os.path.isfile(output_fpath) and os.path.getsize(output_fpath) > 0:
+        with open(output_fpath, "r") as f:
+            reader = csv.reader(f)
+            next(reader)
+            add_to_rollup(rollup, reader, freq)
+    return rollup
+
+
+"""
+Load the rollups of output_fpath. A rollup that doesn't cover exactly the
+ledgers in the output (e.g. after the fetcher was killed before it could
+save the rollups) is rebuilt from the output.
+"""
+def load_rollups(output_fpath, freqs, n_ledgers):
+    rollups = {}
+    for freq in freqs:
+        rollup = read_rollup(rollup_path(output_fpath, freq))
+        if sum(totals[0] for totals in rollup.values()) != n_ledgers:
+            print("Rebuilding", rollup_path(output_fpath, freq), "...")
+            rollup = rebuild_rollup(output_fpath, freq)
+        rollups[freq] = rollup
+    return rollups
+
+
+"""
+Fetch the ledgers from top (exclusive) down to bottom (exclusive), or down to
+the first ledger closed before end_date if bottom is None. After every page,
+checkpoint (if given) is called with the lowest ledger written so far.
+Returns the lowest ledger written.
+"""
+def fetch_range(
+    url, top, bottom, end_date, write, cache_dir, concurrency, checkpoint=None
+):
+    limit = page_limit(url)
+    lowest = top
+    cursors = map(ledger_cursor, page_sequences(top, bottom or 0, limit))
+    for records in fetch_pages(url, cursors, cache_dir, concurrency):
+        if bottom is None:
+            kept = [r for r in records if r["closed_at"] >= end_date]
+        else:
+            kept = [r for r in records if r["sequence"] > bottom]
+
+        if kept:
+            n = write(kept)
+            lowest = kept[-1]["sequence"]
+            print("Fetched ledgers %d-%d (%d new)" % (lowest, kept[0]["sequence"], n))
+            if checkpoint:
+                checkpoint(lowest)
+
+        # An empty or partially kept page means the end of the range
+        if not kept or len(kept) < len(records):
             break
-        if url == API_URL:
-            start_url = response["_links"]["next"]["href"]
-        url = response["_links"]["next"]["href"]
+    return lowest
 
-    print("Started on " + start_url)
-    print("Stopped on " + url)
+
+"""
+Bring the output up to date: first fetch the ledgers closed since the last
+run (above the checkpointed range), then continue backwards from the bottom
+of the checkpointed range until end_date. The checkpoint in state_path is
+updated as the range grows, so an interrupted run resumes where it stopped
+and only refetches pages that are not in the cache. The rollups of the
+activity (see ROLLUPS) are updated with every page and saved at the end.
+Rows are appended as they are fetched, so the newer ledgers end up after the
+older ones fetched by earlier runs and the output isn't sorted by time.
+"""
+def fetch_all_items(
+    end_date, url, output_fpath, state_path, cache_dir, concurrency, rollups=("1h",)
+):
+    os.makedirs(cache_dir, exist_ok=True)
+    state = read_state(state_path)
+    if state is not None and state["end_date"] != end_date:
+        state = None
+
+    head = page_records(fetch_data(url))
+    if not head:
+        print("No ledgers returned from", url)
+        return
+    head_sequence = head[0]["sequence"]
+
+    known = read_known_ledgers(output_fpath)
+    rollups = load_rollups(output_fpath, rollups, len(known))
+    write_header = not os.path.isfile(output_fpath) or os.path.getsize(output_fpath) == 0
+    with open(output_fpath, "a") as f:
+        writer = csv.writer(f, delimiter=",")
+        if write_header:
+            writer.writerow(CSV_HEADER)
+
+        def write(records):
+            rows = write_records(writer, known, records)
+            f.flush()
+            for freq, rollup in rollups.items():
+                add_to_rollup(rollup, rows, freq)
+            return len(rows)
+
+        def checkpoint(low):
+            state["low"] = low
+            write_state(state_path, state)
+
+        try:
+            if state is None:
+                state = {
+                    "end_date": end_date,
+                    "high": head_sequence,
+                    "low": head_sequence + 1,
+                }
+            elif head_sequence > state["high"]:
+                fetch_range(
+                    url, head_sequence + 1, state["high"], end_date, write,
+                    cache_dir, concurrency,
+                )
+                state["high"] = head_sequence
+            write_state(state_path, state)
+
+            if not state.get("done"):
+                fetch_range(
+                    url, state["low"], None, end_date, write, cache_dir,
+                    concurrency, checkpoint,
+                )
+                state["done"] = True
+                write_state(state_path, state)
+        finally:
+            f.flush()
+            for freq, rollup in rollups.items():
+                write_rollup(rollup_path(output_fpath, freq), rollup)
+
+    print("Ledgers %d-%d fetched" % (state["low"], state["high"]))
 
 
 if __name__ == "__main__":
@@ -63,32 +421,61 @@ if __name__ == "__main__":
                                      activity. Saves in csv-format with \
                                      headers:\n \
                                      timestamp,operations,successful \
-                                     transactions,failed transactions"
+                                     transactions,failed transactions,ledger"
     )
     parser.add_argument(
         "output_fpath", type=str, help="path to file where to store results"
     )
     parser.add_argument(
         "--url",
-        nargs=1,
         default=API_URL,
         required=False,
-        help="url to start fetching activity from",
+        help="url of the Horizon /ledgers endpoint to fetch activity from, \
+        with order=desc (default: %s)" % API_URL,
     )
     parser.add_argument(
         "--end-date",
         dest="end_date",
-        nargs=1,
         required=False,
         default="2021-05-15T12",
         help="Datestamp at which to \
-                        stop fetching ledger activity. Note that this is done \
-                        using a simple startswith(), so it is necessary to \
-                        follow the format of the Horizon JSON timestamps (e.g. \
-                        2021-05-15T12)",
+                        stop fetching ledger activity. Compared as a string \
+                        against the Horizon JSON timestamps, so it has to \
+                        follow their format (e.g. 2021-05-15T12)",
+    )
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=4,
+        help="number of pages to request concurrently (default: 4)",
+    )
+    parser.add_argument(
+        "--cache-dir",
+        help="directory where raw page responses are cached (default: \
+        OUTPUT_FPATH.pages)",
+    )
+    parser.add_argument(
+        "--state",
+        help="path to the checkpoint used to resume fetching (default: \
+        OUTPUT_FPATH.state.json)",
+    )
+    parser.add_argument(
+        "--rollups",
+        nargs="*",
+        choices=list(ROLLUPS),
+        default=["1h"],
+        help="rollups of the activity per bucket (ledger count, sums and \
+        means of ops/txs/ftxs) to maintain next to the output, e.g. \
+        ledger-activity.1h.csv (default: 1h)",
     )
 
     args = parser.parse_args()
-    with open(args.output_fpath, "a+") as f:
-        writer = csv.writer(f, delimiter=",")
-        data = fetch_all_items(args.end_date, args.url, writer)
+    fetch_all_items(
+        args.end_date,
+        args.url,
+        args.output_fpath,
+        args.state or args.output_fpath + ".state.json",
+        args.cache_dir or args.output_fpath + ".pages",
+        args.concurrency,
+        args.rollups,
+    )
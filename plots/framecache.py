@@ -0,0 +1,91 @@
+"""
+Memoized access to the datasets used by main.py.
+
+Datasets are registered once. Resampled aggregations (e.g. hourly means) are
+computed once per dataset, frequency and aggregation over the whole dataset,
+and date ranges are sliced out of that, so the million-row RAPL readings are
+aggregated once per frequency however many plots use them. Besides the
+aggregations of DataFrame.resample, TIME_MEAN averages the samples weighted
+by the time they cover (see align.py), holding each for at most the max_gap
+the dataset was registered with.
+
+Frames are handed out as shallow copies. With copy-on-write, which pandas 3
+always uses (main.py switches it on for older versions), callers can add
+columns or assign to them without touching the cached frames.
+"""
+
+from collections import OrderedDict
+
+import align
+
+DEFAULT_MAX_BYTES = 1 << 30
+TIME_MEAN = "time_mean"
+
+
+def frame_bytes(df):
+    return int(df.memory_usage(index=True).sum())
+
+
+class FrameCache:
+    """
+    Datasets registered by name, and derived frames keyed by (name, freq,
+    how, start, end). Derived frames are evicted least recently used first
+    when they take up more than max_bytes; registered datasets are never
+    evicted.
+    """
+
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.datasets = {}
+        self.max_gaps = {}
+        self.derived = OrderedDict()
+        self.used_bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def register(self, name, df, max_gap=None):
+        self.datasets[name] = df
+        self.max_gaps[name] = max_gap
+        for key in [k for k in self.derived if k[0] == name]:
+            self.used_bytes -= frame_bytes(self.derived.pop(key))
+
+    def get(self, name, freq=None, how=None, start=None, end=None):
+        """
+        The dataset name, resampled to freq with the aggregation how (e.g.
+        "1h", "mean" or TIME_MEAN) if freq is given, and restricted to
+        .loc[start:end] if start or end is given
+        """
+        if freq is None and start is None and end is None:
+            return self.datasets[name].copy(deep=False)
+
+        key = (name, freq, how, start, end)
+        df = self.derived.get(key)
+        if df is not None:
+            self.hits += 1
+            self.derived.move_to_end(key)
+            return df.copy(deep=False)
+
+        self.misses += 1
+        if start is None and end is None:
+            df = self.resample(name, freq, how)
+        elif freq is None:
+            df = self.datasets[name].loc[start:end]
+        else:
+            df = self.get(name, freq, how).loc[start:end]
+        self.store(key, df)
+        return df.copy(deep=False)
+
+    def resample(self, name, freq, how):
+        df = self.datasets[name]
+        if how == TIME_MEAN:
+            return align.resample_mean(df, freq, max_gap=self.max_gaps[name])
+        return df.resample(freq).agg(how)
+
+    def store(self, key, df):
+        size = frame_bytes(df)
+        while self.derived and self.used_bytes + size > self.max_bytes:
+            _, evicted = self.derived.popitem(last=False)
+            self.used_bytes -= frame_bytes(evicted)
+        if size <= self.max_bytes:
+            self.derived[key] = df
+            self.used_bytes += size
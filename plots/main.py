@@ -1,40 +1,252 @@
 #!/usr/bin/env python
 
 import argparse
+import contextlib
+import glob
+import hashlib
+import inspect
+import io
+import json
 import os
 import sys
 
-from cycler import cycler
-import matplotlib.pyplot as plt
+import numpy as np
 import pandas as pd
 
+import align
+import datastore
+import decimate
+import parallel
+import powerdb
+import profiling
+import sketches
+import sweep
+from framecache import FrameCache, TIME_MEAN
+
 EXT = "pdf" # Change to png to export bitmaps instead
 DEFAULT_OUTPUT_DIR = "./figures"
 
+# Days of RAPL readings used for the plots and tables
+RAPL_START = "2021-05-13"
+RAPL_END = "2021-06-01"
+
+# Days of system and ledger activity plotted next to the RAPL readings
+ACTIVITY_START = "2021-05-23"
+ACTIVITY_END = RAPL_END
+
+# RAPL domains as named in the power-monitoring data, and in the tables/plots
+RAPL_COLUMNS = {"CPU": "CPU", "DRAM": "RAM"}
+
+SUMMARY_ROWS = ["q10", "mean", "q90"]
+
+# How long a sample holds, at most, when averaging over time (see align.py):
+# manager.sh measures 1 s windows 0-5 s apart, and top samples every second
+# in bursts
+RAPL_MAX_GAP = "6s"
+SYSSTAT_MAX_GAP = "2s"
+
+# Seconds of traffic counted by the rows of the vnstat day and fiveminute
+# tables
+NETWORK_DAILY_SECONDS = 24 * 3600
+NETWORK_5M_SECONDS = 5 * 60
+
+# Power usage effectiveness of the data center, power of the storage (W) per
+# node and number of nodes, for the estimates of the tables and figures
+PUE = 1.67
+STORAGE_W = 6.5
+NODES = 132
+
+# Those parameters by the name the tables and plots take them as. The tables,
+# figures, figure and all commands take other values as options
+ESTIMATES = {"pue": PUE, "storage": STORAGE_W, "nodes": NODES}
+
+# UTC offset of the monitored node (CEST). Traffic read from vnstat.db with
+# read-vnstat-db.py, stamped in seconds since the epoch, is shown in it, so
+# that its days start at midnight on the node like those of the other data
+NODE_UTC_OFFSET = "+02:00"
+
+# Energy intensity of network traffic
+GB_TO_KWH = 0.06
+
+# Kept in the output directory: the hash of the inputs of every figure
+# rendered there, and what it printed
+FIGURES_STATE = ".figures.json"
+
 PATHS = {
     "POWER_READINGS": "data/cpu-ram.csv",
+    "POWER_RECORDS": "data/power-monitoring-db",
+    "POWER_STATS": "data/power-stats.json",
     "NETWORK_TRAFFIC_DAILY": "data/network-traffic.csv",
     "NETWORK_TRAFFIC_FIVEMINUTE": "data/network-traffic-5m.csv",
     "TOP_STATS": "data/top-stats.csv",
     "LEDGER_ACTIVITY": "data/ledger/ledger-activity.csv",
+    "LEDGER_ACTIVITY_HOURLY": "data/ledger/ledger-activity.1h.csv",
 }
 
 """
-Load CSV-file as dataframe, with the first column (timestamps) as index
+Load CSV-file as dataframe, with the first column (timestamps) as index,
+restricted to the days first_day to last_day (inclusive, like .loc) if given.
+If the csv has an up-to-date columnar copy (see datastore.py), that is read
+instead, which skips parsing the timestamps, arrives already typed, and only
+reads the rows of the days asked for.
+"""
+def read_csv(filepath, first_day=None, last_day=None):
+    if datastore.has_fresh_columnar(filepath):
+        end = None
+        if last_day is not None:
+            end = pd.Timestamp(last_day) + pd.Timedelta(days=1)
+        return datastore.read_range(datastore.columnar_path(filepath), first_day, end)
+
+    df = pd.read_csv(filepath, index_col=0, parse_dates=["timestamp"])
+    # Some files, like the ledger activity, are appended to out of time order
+    if not df.index.is_monotonic_increasing:
+        df = df.sort_index(kind="stable")
+    if first_day is None and last_day is None:
+        return df
+    return df.loc[first_day:last_day]
+
+
+"""
+Load network traffic (bytes received and sent, rx and tx) from the csv of
+parse-vnstat-data.py or parse-vnstat-data-finegrained.py (timestamp, rx, tx)
+or from that of read-vnstat-db.py (timestamp in seconds since the epoch,
+interface, rx, tx). The traffic of every interface of the latter is summed
 """
-def read_csv(filepath):
-    return pd.read_csv(filepath, index_col=0, parse_dates=["timestamp"])
+def read_network_data(filepath):
+    if not datastore.has_fresh_columnar(filepath) and "interface" in pd.read_csv(filepath, nrows=0).columns:
+        df = pd.read_csv(filepath, index_col=0)
+        df.index = pd.to_datetime(df.index, unit="s", utc=True)
+    else:
+        df = read_csv(filepath)
+    if "interface" in df.columns:
+        df = df.groupby(level=0)[["rx", "tx"]].sum()
+        df.index = df.index.tz_convert(NODE_UTC_OFFSET)
+    return df
 
 
-def gbToW(gb, hours):
-    GB_TO_KWH = 0.06
-    return gb * GB_TO_KWH * 1000 / hours
+"""
+Load the power readings (W) of the given RAPL domains, from first_day to
+last_day. Days for which the collector wrote binary records (see powerdb.py)
+are memory-mapped and normalized directly, and the other days are read from
+the csv written by parse-and-normalize-power-data.py.
+"""
+def read_power_readings(domains, first_day, last_day):
+    files = {
+        os.path.basename(fpath).split(".")[0]: fpath
+        for fpath in glob.glob(os.path.join(PATHS["POWER_RECORDS"], "*" + powerdb.RECORD_EXT))
+        if first_day <= os.path.basename(fpath).split(".")[0] <= last_day
+    }
+    if not files:
+        return read_csv(PATHS["POWER_READINGS"], first_day, last_day)[domains]
+
+    frames = []
+    for day in sorted(files):
+        records, utc_offset = powerdb.open_records(files[day])
+        df = powerdb.power_frame(records, utc_offset, domains).set_index("timestamp")
+        if frames:
+            # Days with another UTC offset (DST) can't share one index as is
+            df.index = df.index.tz_convert(frames[0].index.tz)
+        frames.append(df)
+
+    days = pd.date_range(first_day, last_day, freq="D").strftime("%Y-%m-%d")
+    csv_path = PATHS["POWER_READINGS"]
+    has_csv = os.path.isfile(csv_path) or datastore.has_fresh_columnar(csv_path)
+    if has_csv and not days.isin(list(files)).all():
+        df = read_csv(csv_path, first_day, last_day)[domains]
+        df = df[~df.index.strftime("%Y-%m-%d").isin(list(files))]
+        df.index = df.index.tz_convert(frames[0].index.tz)
+        frames.append(df)
+
+    df = pd.concat(frames)
+    if not df.index.is_monotonic_increasing:
+        df = df.sort_index(kind="stable")
+    return df
+
+
+"""
+The 10 % quantile, mean and 90 % quantile of every column of df, as a frame
+indexed by SUMMARY_ROWS
+"""
+def summarize(df):
+    q = df.quantile([0.1, 0.9])
+    return pd.DataFrame([q.loc[0.1], df.mean(), q.loc[0.9]], index=SUMMARY_ROWS)
+
+
+"""
+The sketches kept by parse-and-normalize-power-data.py --output-stats of the
+daily files from RAPL_START to RAPL_END, and the alpha they were kept with.
+None if there are none, or if they miss any of those days or RAPL domains,
+since the tables would then silently leave out readings
+"""
+def rapl_day_stats():
+    if not os.path.isfile(PATHS["POWER_STATS"]):
+        return None
+
+    with open(PATHS["POWER_STATS"], "r") as f:
+        stats = json.load(f)
+    days = {}
+    for name, entry in stats["files"].items():
+        day = os.path.splitext(name)[0]
+        if RAPL_START <= day <= RAPL_END and set(RAPL_COLUMNS) <= set(entry["columns"]):
+            days.setdefault(day, []).append(entry["columns"])
+    expected = pd.date_range(RAPL_START, RAPL_END, freq="D").strftime("%Y-%m-%d")
+    if not set(expected) <= set(days):
+        return None
+    return [columns for day in sorted(days) for columns in days[day]], stats["alpha"]
+
+
+"""
+Summary (see summarize()) of the RAPL readings for the tables. If
+parse-and-normalize-power-data.py --output-stats has kept sketches of every
+daily file from RAPL_START to RAPL_END (see rapl_day_stats()), they are
+merged without loading any readings, with quantiles within the relative
+error alpha stored with them (see sketches.py). Otherwise it is computed
+from the readings in data.
+"""
+def rapl_summary(data):
+    day_stats = rapl_day_stats()
+    if day_stats is None:
+        return summarize(data.get("rapl"))
+
+    days, alpha = day_stats
+    columns = {}
+    for domain, column in RAPL_COLUMNS.items():
+        summary = sketches.merge_all(
+            [sketches.Summary.from_dict(day[domain]) for day in days], alpha
+        )
+        columns[column] = [summary.quantile(0.1), summary.mean(), summary.quantile(0.9)]
+    return pd.DataFrame(columns, index=SUMMARY_ROWS)
+
+
+"""
+Load ledger activity (ops, txs, ftxs) as a pair of frames: the sums per hour
+and the means per ledger in each hour. Uses the hourly rollup kept by
+fetch-ledger-activity.py if there is one. Otherwise both frames are the
+per-ledger readings, which the plots resample themselves. Either is
+restricted to the days first_day to last_day if given.
+"""
+def read_ledger_activity(first_day=None, last_day=None):
+    cols = ["ops", "txs", "ftxs"]
+    hourly_path = PATHS["LEDGER_ACTIVITY_HOURLY"]
+    if os.path.isfile(hourly_path) or datastore.has_fresh_columnar(hourly_path):
+        hourly = read_csv(hourly_path, first_day, last_day)
+        sums = hourly[cols]
+        return sums, sums.div(hourly["ledgers"], axis=0)
+
+    readings = read_csv(PATHS["LEDGER_ACTIVITY"], first_day, last_day)[cols]
+    return readings, readings
+
+
+def gbToW(gb, hours, gb_to_kwh=GB_TO_KWH):
+    return gb * gb_to_kwh * 1000 / hours
 
 
 """
 Plot network traffic as x=time vs y=(GB, W) (double axes)
 """
 def plot_network_traffic(network_df, output_dir, enddate="2021-06-01"):
+    import matplotlib.pyplot as plt
+
     startdate = "2021-05-14"
 
     fig, ax1 = plt.subplots()
@@ -47,7 +259,7 @@ def plot_network_traffic(network_df, output_dir, enddate="2021-06-01"):
     ax1.set_ylabel("Data (GB)")
     ax2.set_ylabel("Power (W)")
 
-    df.plot(kind="line", ax=ax1, xlabel="")
+    decimate.for_axes(df, ax1).plot(kind="line", ax=ax1, xlabel="")
     fig.tight_layout()
 
     ax1.set_ylim([0, None])
@@ -63,12 +275,15 @@ def plot_network_traffic(network_df, output_dir, enddate="2021-06-01"):
 """
 Plot RAPL readings
 """
-def plot_rapl_readings(df, output_dir):
+def plot_rapl_readings(data, output_dir):
+    import matplotlib.pyplot as plt
+
     fig, (ax1, ax2) = plt.subplots(2, 1, figsize=(6, 6))
 
-    df.drop(columns=["RAM"]).plot(kind="line", ax=ax2, xlabel="")
-    df = df.resample("1h").mean()
-    df.plot(kind="line", ax=ax1, xlabel="")
+    # The raw readings are decimated to what the axes can show, see decimate.py
+    rapl = data.get("rapl").drop(columns=["RAM"])
+    decimate.for_axes(rapl, ax2).plot(kind="line", ax=ax2, xlabel="")
+    decimate.for_axes(data.get("rapl", "1h", TIME_MEAN), ax1).plot(kind="line", ax=ax1, xlabel="")
 
     ax1.set_title("Power consumption from RAPL measurements")
     ax1.set_ylabel("Power, hourly average (W)")
@@ -85,16 +300,14 @@ def plot_rapl_readings(df, output_dir):
 """
 Print LaTeX table for RAPL measurements
 """
-def print_rapl_table(df):
-    mu = df.mean()
-    q = df.quantile([0.1, 0.9])
+def print_rapl_table(rapl):
     thead = " " * 14 + " & CPU     & RAM\\\\\\toprule\n"
     tbody = ""
-    tbody += "10~\\%% quantile & %.3f W & %.3f W \\\\\n" % (q.at[0.1, "CPU"], q.at[0.1, "RAM"])
-    tbody += "Mean           & %.3f W & %.3f W \\\\\n" % (mu["CPU"], mu["RAM"])
+    tbody += "10~\\%% quantile & %.3f W & %.3f W \\\\\n" % (rapl.at["q10", "CPU"], rapl.at["q10", "RAM"])
+    tbody += "Mean           & %.3f W & %.3f W \\\\\n" % (rapl.at["mean", "CPU"], rapl.at["mean", "RAM"])
     tbody += "90~\\%% quantile & %.3f W & %.3f W \\\\\\bottomrule\n" % (
-        q.at[0.9, "CPU"],
-        q.at[0.9, "RAM"],
+        rapl.at["q90", "CPU"],
+        rapl.at["q90", "RAM"],
     )
 
     print("\n" + thead + tbody + "\n")
@@ -103,7 +316,9 @@ def print_rapl_table(df):
 """
 Plot 4x1 subplots with rapl measurements and associated factors
 """
-def plot_rapl_with_others(rapl_df, sysstat_df, activity_df, network_df, output_dir):
+def plot_rapl_with_others(data, output_dir):
+    import matplotlib.pyplot as plt
+
     fig, (ax1, ax2, ax3, ax4) = plt.subplots(4, 1, figsize=(5, 5))
     # fig.figsize = (4, 6)
     fig.tight_layout(h_pad=3)
@@ -112,28 +327,28 @@ def plot_rapl_with_others(rapl_df, sysstat_df, activity_df, network_df, output_d
     startdate = "2021-05-23"
     enddate = "2021-06-01"
 
-    df1 = rapl_df.resample("1h").mean().loc[startdate:enddate]
-    df_sysstat = sysstat_df.resample("1h").mean().loc[startdate:enddate]
+    df1 = data.get("rapl", "1h", TIME_MEAN, startdate, enddate)
+    df_sysstat = data.get("sysstat", "1h", TIME_MEAN, startdate, enddate)
 
     df_sysstat["Stellar CPU%"] = df_sysstat["Stellar CPU%"] / 8
     df_sysstat["PGSQL CPU%"] = df_sysstat["PGSQL CPU%"] / 8
 
     ax1.set_title("RAPL power readings (W)")
-    df1.plot(kind="line", ax=ax1, xlabel="")
+    decimate.for_axes(df1, ax1).plot(kind="line", ax=ax1, xlabel="")
 
     ax2.set_title("System resource usage (\\%)")
     df2 = df_sysstat[["CPU US", "CPU SY", "Stellar CPU%", "PGSQL CPU%"]]
     df2.columns = ["CPU, User", "CPU, System", "stellar-core CPU\\%", "postgres CPU\\%"]
-    df2.plot(kind="line", ax=ax2, xlabel="")
+    decimate.for_axes(df2, ax2).plot(kind="line", ax=ax2, xlabel="")
 
     ax3.set_title("Payment network activity per consensus round")
-    df3 = activity_df.resample("1h").mean().loc[startdate:enddate]
+    df3 = data.get("ledger_means", "1h", "mean", startdate, enddate)
     df3.columns = ["Operations", "Successful txs", "Failed txs"]
-    df3.plot(kind="line", ax=ax3, xlabel="")
+    decimate.for_axes(df3, ax3).plot(kind="line", ax=ax3, xlabel="")
 
     ax4.set_title("Network power consumption estimate (W)")
-    df4 = gbToW(network_df.loc[startdate:enddate].copy() * 1e-9, 1)
-    df4.plot(kind="line", ax=ax4, xlabel="")
+    df4 = gbToW(data.get("network_patched", start=startdate, end=enddate) * 1e-9, 1)
+    decimate.for_axes(df4, ax4).plot(kind="line", ax=ax4, xlabel="")
 
     for ax in (ax1, ax2, ax3, ax4):
         ax.set_ylim([0, None])
@@ -143,7 +358,34 @@ def plot_rapl_with_others(rapl_df, sysstat_df, activity_df, network_df, output_d
     fig.savefig(os.path.join(output_dir, "rapl-vs-sysstat." + EXT))
 
 
-def plot_cpu_vs_ops(rapl_df, activity_df, pue, output_dir):
+"""
+The hourly activity (sums of ops, txs, ftxs and txs_tot) from startdate to
+enddate, joined with the time-weighted mean RAPL power (W) and the network
+traffic (bytes, rx and tx) of the same hours. The readings are put on the
+hours of the activity with align.py, so an hour without readings gets NaN
+instead of lining up with a neighbouring one
+"""
+def hourly_activity(data, startdate, enddate):
+    activity_df = data.get("ledger_sums", "1h", "sum", startdate, enddate)
+    activity_df["txs_tot"] = activity_df["txs"] + activity_df["ftxs"]
+    hours = activity_df.index
+
+    rapl_df = data.get("rapl", "1h", TIME_MEAN, startdate, enddate)
+    network_df = align.interval_sum(
+        data.get("network_5m", start=startdate, end=enddate),
+        align.time_grid(hours, "1h"),
+        NETWORK_5M_SECONDS,
+    )
+    for df in [rapl_df, network_df]:
+        aligned = align.asof(df, hours, tolerance="0s")
+        for column in df.columns:
+            activity_df[column] = aligned[column].to_numpy()
+    return activity_df
+
+
+def plot_cpu_vs_ops(data, pue, output_dir):
+    import matplotlib.pyplot as plt
+
     fig, ax = plt.subplots()
     # fig.figsize = (4, 6)
     fig.tight_layout(h_pad=3)
@@ -152,13 +394,13 @@ def plot_cpu_vs_ops(rapl_df, activity_df, pue, output_dir):
     startdate = "2021-05-26"
     enddate = "2021-06-01"
 
-    rapl_df = rapl_df.loc[startdate:enddate].resample("1h").mean()
-
-    activity_df = activity_df.loc[startdate:enddate].resample("1h").sum()
+    activity_df = data.get("ledger_sums", "1h", "sum", startdate, enddate)
     activity_df["txs_tot"] = activity_df["txs"] + activity_df["ftxs"]
+    rapl_df = data.get("rapl", "1h", TIME_MEAN, startdate, enddate)
+    activity_df["CPU"] = align.asof(rapl_df, activity_df.index, tolerance="0s")["CPU"].to_numpy()
 
     # Add storage (6.5) and multply with PUE (1.67), and then add network
-    activity_df["power"] = (rapl_df["CPU"]) * pue
+    activity_df["power"] = activity_df["CPU"] * pue
 
     ax.scatter(
         activity_df["txs"],
@@ -201,7 +443,9 @@ def plot_cpu_vs_ops(rapl_df, activity_df, pue, output_dir):
     fig.savefig(os.path.join(output_dir, "cpu-vs-transactions." + EXT))
 
 
-def plot_power_per_transaction(rapl_df, activity_df, network_df, pue, output_dir):
+def plot_power_per_transaction(data, pue, storage, nodes, output_dir):
+    import matplotlib.pyplot as plt
+
     fig, ax = plt.subplots()
     # fig.figsize = (4, 6)
     fig.tight_layout(h_pad=3)
@@ -210,26 +454,11 @@ def plot_power_per_transaction(rapl_df, activity_df, network_df, pue, output_dir
     startdate = "2021-05-26"
     enddate = "2021-06-01"
 
-    rapl_df["sum"] = rapl_df["CPU"] + rapl_df["RAM"]
-    rapl_df = (
-        rapl_df.loc[startdate:enddate]
-        .drop(columns=["CPU", "RAM"])
-        .resample("1h")
-        .mean()
-    )
-
-    network_power_df = network_df
-    network_power_df["avg"] = (network_power_df["tx"] + network_power_df["rx"]) / 2
-    network_power_df = network_power_df.drop(columns=["tx", "rx"])
-    network_power_df = gbToW(
-        network_df.resample("1h").sum().loc[startdate:enddate] * 1e-9, 1
-    )
-
-    activity_df = activity_df.loc[startdate:enddate].resample("1h").sum()
-    activity_df["txs_tot"] = activity_df["txs"] + activity_df["ftxs"]
+    activity_df = hourly_activity(data, startdate, enddate)
+    network_power = gbToW((activity_df["tx"] + activity_df["rx"]) / 2 * 1e-9, 1)
 
-    # Add storage (6.5) and multply with PUE (1.67), and then add network
-    activity_df["power"] = (rapl_df["sum"] + 6.5) * pue + network_power_df["avg"]
+    # Add storage and multply with PUE, and then add network
+    activity_df["power"] = (activity_df["CPU"] + activity_df["RAM"] + storage) * pue + network_power
 
     ax.scatter(
         activity_df["txs"],
@@ -269,23 +498,26 @@ def plot_power_per_transaction(rapl_df, activity_df, network_df, pue, output_dir
     ax.set_xlabel("Transactions or operations per hour")
     fig.tight_layout()
 
-    n_nodes = 132
+    # Hours without any transactions (or operations) are left out of their
+    # average, like in sweep.unit_coefficients()
     avgs = activity_df.copy()
-    avgs["avg"] = activity_df["power"] / activity_df["txs_tot"]
-    avgs["avg_op"] = activity_df["power"] / activity_df["ops"]
-    avgs["avg_txs"] = activity_df["power"] / activity_df["txs"]
+    for avg, column in [("avg", "txs_tot"), ("avg_op", "ops"), ("avg_txs", "txs")]:
+        count = activity_df[column]
+        avgs[avg] = activity_df["power"] / count.where(count > 0)
     print("\n")
     print("Average per node: %.5f W" % avgs.mean()["avg"])
     print("Average per node (ops): %.5f W" % avgs.mean()["avg_op"])
     print("Average per node (ops): %.5f W" % avgs.mean()["avg_txs"])
-    print("Average total: %.3f W" % (n_nodes * avgs.mean()["avg"]))
-    print("Average total (ops): %.3f W" % (n_nodes * avgs.mean()["avg_op"]))
-    print("Average total (succ): %.3f W" % (n_nodes * avgs.mean()["avg_txs"]))
+    print("Average total: %.3f W" % (nodes * avgs.mean()["avg"]))
+    print("Average total (ops): %.3f W" % (nodes * avgs.mean()["avg_op"]))
+    print("Average total (succ): %.3f W" % (nodes * avgs.mean()["avg_txs"]))
 
     fig.savefig(os.path.join(output_dir, "power-vs-transactions." + EXT))
 
 
 def plot_piegraph(network_traffic, rapl, storage, output_dir):
+    import matplotlib.pyplot as plt
+
     network_power = gbToW(network_traffic * 1e-9, 24)
     network_avg_power = (network_power["tx"] + network_power["rx"]) / 2
     network_power_mean = network_avg_power.mean()
@@ -323,13 +555,13 @@ def plot_piegraph(network_traffic, rapl, storage, output_dir):
     fig.savefig(os.path.join(output_dir, "comparison-pie." + EXT))
 
 
-def print_summary_table(rapl_df, network_df_raw, storage):
+def print_summary_table(rapl, network_df_raw, storage):
     network_df = gbToW(network_df_raw * 1e-9, 24)
     network_avg = (network_df["rx"] + network_df["tx"]) / 2
 
-    rq = rapl_df.quantile([0.1, 0.9])
+    rq = rapl.loc[["q10", "q90"]].set_axis([0.1, 0.9])
     nq = network_avg.quantile([0.1, 0.9])
-    rmu = rapl_df.mean()
+    rmu = rapl.loc["mean"]
     nmu = network_avg.mean()
     total = {
         "q10": rq.at[0.1, "CPU"] + rq.at[0.1, "RAM"] + nq.at[0.1] + storage,
@@ -352,17 +584,27 @@ def print_summary_table(rapl_df, network_df_raw, storage):
 
     print(header + body)
 
-def print_total_power_table(rapl_df, network_df_raw, pue, nodes, storage):
+# Printed above the total power table, as a LaTeX comment
+TOTAL_POWER_NOTE = (
+    "% PUE * (CPU + RAM + storage) + network. Tables printed before this\n"
+    "% formula applied the PUE twice to the quantiles of CPU and RAM and\n"
+    "% differ from it, so don't compare them (see plots/README.md).\n"
+)
+
+
+def print_total_power_table(rapl, network_df_raw, pue, nodes, storage):
     network_df = gbToW(network_df_raw * 1e-9, 24)
     network_avg = (network_df["rx"] + network_df["tx"]) / 2
 
-    rq = rapl_df.quantile([0.1, 0.9]) * pue
+    rq = rapl.loc[["q10", "q90"]].set_axis([0.1, 0.9])
     nq = network_avg.quantile([0.1, 0.9])
-    rmu = rapl_df.mean() * pue
+    rmu = rapl.loc["mean"]
     nmu = network_avg.mean()
+    # The PUE applies to what the node draws inside the data center, not to
+    # the network, as in sweep.evaluate()
     total = {
         "q10":  pue * (rq.at[0.1, "CPU"] + rq.at[0.1, "RAM"] + storage) + nq.at[0.1],
-        "mean": pue * (rmu["CPU"] + rmu["RAM"]) + nmu + 6.5,
+        "mean": pue * (rmu["CPU"] + rmu["RAM"] + storage) + nmu,
         "q90":  pue * (rq.at[0.9, "CPU"] + rq.at[0.9, "RAM"] + storage) + nq.at[0.9],
     }
 
@@ -381,13 +623,357 @@ def print_total_power_table(rapl_df, network_df_raw, pue, nodes, storage):
     header = " & ".join(cols) + "\\\\\\toprule\n"
     body = "\\\\\n".join(rows) + "\\\\\\bottomrule\n"
 
-    print(header + body)
+    print(TOTAL_POWER_NOTE + header + body)
+
+
+"""
+Hourly network traffic (bytes) from 2021-05-23 to 2021-06-01: spread evenly
+over the hours of the day from the daily traffic until the 5-minute traffic
+starts, and summed from that after (see align.interval_sum())
+"""
+def patched_network_data(data):
+    daily = data.get("network_daily", start="2021-05-23", end="2021-05-25")
+    # vnstat days are stamped at noon by parse-vnstat-data.py
+    daily.index = daily.index.floor("D")
+    fine = data.get("network_5m", start="2021-05-26", end="2021-06-01")
+    durations = np.concatenate([
+        np.full(len(daily), NETWORK_DAILY_SECONDS),
+        np.full(len(fine), NETWORK_5M_SECONDS),
+    ])
+    traffic = pd.concat([daily, fine])
+    return align.interval_sum(traffic, align.time_grid(traffic.index, "1h"), durations)
+
+
+"""
+The figures, as targets rendered by plot with params, and with the estimate
+parameters (see ESTIMATES) it names in estimates. A target either gets
+frames (argument name -> dataset) or the whole FrameCache as data, in which
+case it declares the (dataset, start, end) ranges it reads from it as inputs.
+A figure is only rendered again when its inputs change (see figure_hash())
+"""
+FIGURES = {
+    "cpu-vs-transactions": {
+        "plot": plot_cpu_vs_ops,
+        "params": {},
+        "estimates": ["pue"],
+        "inputs": [(ds, "2021-05-26", "2021-06-01") for ds in ["rapl", "ledger_sums"]],
+    },
+    "power-vs-transactions": {
+        "plot": plot_power_per_transaction,
+        "params": {},
+        "estimates": ["pue", "storage", "nodes"],
+        "inputs": [(ds, "2021-05-26", "2021-06-01") for ds in ["rapl", "network_5m", "ledger_sums"]],
+    },
+    "rapl-readings": {
+        "plot": plot_rapl_readings,
+        "params": {},
+        "inputs": [("rapl", None, None)],
+    },
+    "network-traffic": {
+        "plot": plot_network_traffic,
+        "frames": {"network_df": "network_daily"},
+        "params": {"enddate": "2021-06-01"},
+    },
+    "comparison-pie": {
+        "plot": plot_piegraph,
+        "frames": {"network_traffic": "network_daily", "rapl": "rapl"},
+        "params": {},
+        "estimates": ["storage"],
+    },
+    "rapl-vs-sysstat": {
+        "plot": plot_rapl_with_others,
+        "params": {},
+        "inputs": [
+            (ds, "2021-05-23", "2021-06-01")
+            for ds in ["rapl", "sysstat", "ledger_means", "network_patched"]
+        ],
+    },
+}
+
+
+## The parameters the figure name is rendered with, taking the estimate
+## parameters it uses from estimates
+def figure_params(name, estimates=ESTIMATES):
+    target = FIGURES[name]
+    return dict(target["params"], **{k: estimates[k] for k in target.get("estimates", [])})
+
 
+def figure_inputs(target):
+    if "frames" in target:
+        return [(ds, None, None) for ds in target["frames"].values()]
+    return target["inputs"]
 
-def patched_network_data(network_d_df, network_t_df):
-    network_d_df = network_d_df.loc["2021-05-23":"2021-05-25"] / 24
-    network_t_df = network_t_df.loc["2021-05-26":"2021-06-01"].resample("1h").sum()
-    return pd.concat([network_d_df, network_t_df])
+
+## The source of fn, and of the functions and modules of this directory
+## (e.g. decimate) it calls
+def plot_sources(fn):
+    sources = [inspect.getsource(fn)]
+    here = os.path.dirname(os.path.abspath(__file__))
+    for name in fn.__code__.co_names:
+        obj = fn.__globals__.get(name)
+        if inspect.isfunction(obj) or (
+            inspect.ismodule(obj)
+            and os.path.dirname(os.path.abspath(getattr(obj, "__file__", None) or "/")) == here
+        ):
+            sources.append(inspect.getsource(obj))
+    return sources
+
+
+"""
+Content hash of everything the figure name is rendered from: the rows of its
+inputs, its parameters (params, see figure_params()), the source of its plot function and what it calls
+(see plot_sources()), the matplotlib style and the versions of pandas and
+matplotlib
+"""
+def figure_hash(data, name, params):
+    import matplotlib
+    import matplotlib.pyplot as plt
+
+    target = FIGURES[name]
+    style = sorted((k, v) for k, v in plt.rcParams.items() if k != "backend")
+    h = hashlib.sha256()
+    for part in [
+        name,
+        EXT,
+        json.dumps(params, sort_keys=True),
+        *plot_sources(target["plot"]),
+        repr(style),
+        pd.__version__,
+        matplotlib.__version__,
+    ]:
+        h.update(part.encode())
+    for dataset, start, end in figure_inputs(target):
+        df = data.get(dataset, start=start, end=end)
+        h.update(repr((dataset, start, end, list(df.columns), list(df.dtypes.astype(str)))).encode())
+        h.update(pd.util.hash_pandas_object(df).to_numpy().tobytes())
+    return h.hexdigest()
+
+
+## Switch on copy-on-write on pandas < 3 (which always uses it), so the
+## shallow copies handed out by FrameCache can be modified safely
+def enable_copy_on_write():
+    if int(pd.__version__.split(".")[0]) < 3:
+        try:
+            pd.set_option("mode.copy_on_write", True)
+        except (KeyError, pd.errors.OptionError):
+            pass
+
+
+# The datasets of the process rendering figures, see init_renderer()
+renderer_data = None
+
+
+def init_renderer(data):
+    import matplotlib
+
+    global renderer_data
+    enable_copy_on_write()
+    renderer_data = data
+    matplotlib.use("Agg")
+    setup_mathplotlib()
+
+
+"""
+Render the figure name to output_dir with params, in a process set up by
+init_renderer(). Returns what it printed
+"""
+def render_figure(name, output_dir, params):
+    import matplotlib.pyplot as plt
+
+    target = FIGURES[name]
+    if "frames" in target:
+        kwargs = {arg: renderer_data.get(ds) for arg, ds in target["frames"].items()}
+    else:
+        kwargs = {"data": renderer_data}
+
+    out = io.StringIO()
+    with contextlib.redirect_stdout(out):
+        target["plot"](output_dir=output_dir, **kwargs, **params)
+    plt.close("all")
+    return out.getvalue()
+
+
+def read_figures_state(output_dir):
+    fpath = os.path.join(output_dir, FIGURES_STATE)
+    if not os.path.isfile(fpath):
+        return {}
+    with open(fpath, "r") as f:
+        return json.load(f)
+
+
+def write_figures_state(output_dir, state):
+    fpath = os.path.join(output_dir, FIGURES_STATE)
+    tmp = fpath + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(state, f, indent=2)
+    os.replace(tmp, fpath)
+
+
+"""
+Render the figures names to output_dir, skipping those already rendered there
+from the same inputs and parameters (see figure_hash()) unless force. The
+estimate parameters are taken from estimates (see ESTIMATES). The stale ones
+are rendered by up to jobs processes (0 for one per CPU). What the figures
+print is printed in the order of names, as printed by the last render of
+each. Returns the names of the figures rendered
+"""
+def render_figures(data, names, output_dir, jobs=1, force=False, profiler=None, estimates=ESTIMATES):
+    profiler = profiler or profiling.Profiler()
+    params = {name: figure_params(name, estimates) for name in names}
+    state = read_figures_state(output_dir)
+    # The hashes cover the style, so it is set up here already
+    init_renderer(data)
+    with profiler.stage("hash-figures"):
+        hashes = {name: figure_hash(data, name, params[name]) for name in names}
+    stale = [
+        name
+        for name in names
+        if force
+        or state.get(name, {}).get("hash") != hashes[name]
+        or not os.path.isfile(os.path.join(output_dir, name + "." + EXT))
+    ]
+    if len(stale) < len(names):
+        print(
+            "Up to date: %s" % ", ".join(n for n in names if n not in stale),
+            file=sys.stderr,
+        )
+
+    jobs = min(parallel.resolve_jobs(jobs), len(stale))
+    if jobs > 1:
+        with profiler.stage("plot-figures"):
+            tasks = [(name, output_dir, params[name]) for name in stale]
+            outputs = list(parallel.ordered_map(render_figure, tasks, jobs, init_renderer, (data,)))
+    else:
+        outputs = []
+        for name in stale:
+            with profiler.stage("plot-" + name):
+                outputs.append(render_figure(name, output_dir, params[name]))
+
+    for name, printed in zip(stale, outputs):
+        state[name] = {"hash": hashes[name], "stdout": printed}
+    if stale:
+        write_figures_state(output_dir, state)
+
+    for name in names:
+        sys.stdout.write(state[name]["stdout"])
+    return stale
+
+
+def load_rapl(data):
+    rapl_readings = read_power_readings(list(RAPL_COLUMNS), RAPL_START, RAPL_END)
+    rapl_readings.columns = list(RAPL_COLUMNS.values())
+    data.register("rapl", rapl_readings.loc[RAPL_START:RAPL_END], max_gap=RAPL_MAX_GAP)
+
+
+def load_network_daily(data):
+    data.register("network_daily", read_network_data(PATHS["NETWORK_TRAFFIC_DAILY"]))
+
+
+def load_network_5m(data):
+    data.register("network_5m", read_network_data(PATHS["NETWORK_TRAFFIC_FIVEMINUTE"]))
+    data.register("network_patched", patched_network_data(data))
+
+
+def load_sysstat(data):
+    data.register(
+        "sysstat",
+        read_csv(PATHS["TOP_STATS"], ACTIVITY_START, ACTIVITY_END),
+        max_gap=SYSSTAT_MAX_GAP,
+    )
+
+
+def load_ledger(data):
+    ledger_sums, ledger_means = read_ledger_activity(ACTIVITY_START, ACTIVITY_END)
+    data.register("ledger_sums", ledger_sums)
+    data.register("ledger_means", ledger_means)
+
+
+# How the datasets are loaded: loader -> (function, datasets it registers,
+# loaders it needs to run first)
+LOADERS = {
+    "rapl": (load_rapl, ["rapl"], []),
+    "network": (load_network_daily, ["network_daily"], []),
+    "network-5m": (load_network_5m, ["network_5m", "network_patched"], ["network"]),
+    "sysstat": (load_sysstat, ["sysstat"], []),
+    "ledger": (load_ledger, ["ledger_sums", "ledger_means"], []),
+}
+
+
+"""
+Load the datasets names (all if None), and those they are made from, into a
+FrameCache, from which the tables and plots get the (resampled) frames they
+need. Each loader runs as a stage "load-<loader>" of profiler
+"""
+def load_datasets(names=None, profiler=None):
+    profiler = profiler or profiling.Profiler()
+    data = FrameCache()
+
+    needed = set()
+    for loader, (_, provides, requires) in LOADERS.items():
+        if names is None or set(provides) & set(names):
+            needed.update([loader, *requires])
+    for loader, (load, _, _) in LOADERS.items():
+        if loader in needed:
+            with profiler.stage("load-" + loader):
+                load(data)
+    return data
+
+
+## The datasets the tables are computed from
+def table_datasets():
+    if rapl_day_stats() is not None:
+        return ["network_daily"]
+    return ["rapl", "network_daily"]
+
+
+## The datasets the sweep is computed from
+def sweep_datasets():
+    return sorted(set(table_datasets()) | {"rapl", "network_5m", "ledger_sums"})
+
+
+## The datasets the figures names are plotted from
+def figure_datasets(names):
+    return sorted({ds for name in names for ds, _, _ in figure_inputs(FIGURES[name])})
+
+
+"""
+The data the estimates are swept over (see sweep.evaluate()): the 10 % quantile,
+mean and 90 % quantile of CPU + RAM power and of the daily network traffic
+(GB, mean of received and sent), and the hourly power, network traffic and
+activity of the period of plot_power_per_transaction()
+"""
+def sweep_inputs(data):
+    rapl = rapl_summary(data)
+    rapl_w = rapl["CPU"] + rapl["RAM"]
+
+    network = data.get("network_daily") * 1e-9
+    network = (network["rx"] + network["tx"]) / 2
+    q = network.quantile([0.1, 0.9])
+    network_gb = pd.Series([q.loc[0.1], network.mean(), q.loc[0.9]], index=SUMMARY_ROWS)
+
+    startdate = "2021-05-26"
+    enddate = "2021-06-01"
+    hourly = hourly_activity(data, startdate, enddate)
+    hourly["rapl_w"] = hourly["CPU"] + hourly["RAM"]
+    hourly["network_gb"] = (hourly["rx"] + hourly["tx"]) / 2 * 1e-9
+    return rapl_w, network_gb, hourly
+
+
+def print_tables(data, profiler=None, estimates=ESTIMATES):
+    profiler = profiler or profiling.Profiler()
+    with profiler.stage("table-rapl"):
+        rapl = rapl_summary(data)
+        print_rapl_table(rapl)
+    with profiler.stage("table-summary"):
+        print_summary_table(rapl, data.get("network_daily"), estimates["storage"])
+
+    with profiler.stage("table-total-power"):
+        print_total_power_table(
+            rapl=rapl,
+            network_df_raw=data.get("network_daily"),
+            pue=estimates["pue"],
+            nodes=estimates["nodes"],
+            storage=estimates["storage"])
 
 
 def get_output_dir(dirpath):
@@ -398,7 +984,23 @@ def get_output_dir(dirpath):
     return dirpath
 
 
+## The arguments of the command line main.py had before its commands, a
+## single OUTPUT_DIR, as those of "all -o OUTPUT_DIR", so that existing
+## scripts keep working
+def legacy_args(argv, commands):
+    if len(argv) == 1 and argv[0] not in commands and not argv[0].startswith("-"):
+        print(
+            "main.py OUTPUT_DIR is deprecated, use main.py all -o %s" % argv[0],
+            file=sys.stderr,
+        )
+        return ["all", "-o", argv[0]]
+    return argv
+
+
 def setup_mathplotlib():
+    from cycler import cycler
+    import matplotlib.pyplot as plt
+
     plt.style.use(["science", "grid"])
     plt.rcParams["figure.figsize"] = (6, 4)
     colors = [
@@ -415,58 +1017,149 @@ def setup_mathplotlib():
 
 
 if __name__ == "__main__":
-    setup_mathplotlib()
-
-    pue = 1.67
-
     parser = argparse.ArgumentParser(
-        "Main plotting script. Make sure to configure the paths of \
+        description="Main plotting script. Make sure to configure the paths of \
         input-files inside the source-code."
     )
-
-    rapl_readings = read_csv(PATHS["POWER_READINGS"]).drop(columns=["CORE"])
-    rapl_readings.columns = ["CPU", "RAM"]
-    rapl_readings = rapl_readings.loc["2021-05-13":"2021-06-01"]
-
-    network_traffic_readings = read_csv(PATHS["NETWORK_TRAFFIC_DAILY"])
-    network_traffic_5m_readings = read_csv(PATHS["NETWORK_TRAFFIC_FIVEMINUTE"])
-
-    sysstat_readings = read_csv(PATHS["TOP_STATS"])
-    ledger_readings = read_csv(PATHS["LEDGER_ACTIVITY"])
-
-    output_dir = get_output_dir(sys.argv[1])
-
-    # Printing rapl table
-    print_rapl_table(rapl_readings.copy())
-    print_summary_table(rapl_readings.copy(), network_traffic_readings.copy(), 6.5)
-
-    print_total_power_table(
-        rapl_df=rapl_readings.copy(),
-        network_df_raw=network_traffic_readings.copy(),
-        pue=1.67,
-        nodes=132,
-        storage=6.5)
-
-    plot_cpu_vs_ops(rapl_readings.copy(), ledger_readings.copy(), pue, output_dir)
-    plot_power_per_transaction(
-        rapl_readings.copy(),
-        ledger_readings.copy(),
-        network_traffic_5m_readings.copy(),
-        pue,
-        output_dir,
+    # Options of every command
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument(
+        "--profile",
+        metavar="REPORT",
+        help="write the wall time, CPU time and memory of every load, table \
+        and plot stage to REPORT as json",
     )
-    plot_rapl_readings(rapl_readings.copy(), output_dir)
-    plot_network_traffic(
-        network_traffic_readings.copy(), output_dir, enddate="2021-06-01"
+    common.add_argument(
+        "--profile-dir",
+        help="also dump a cProfile of every stage to <stage>.prof in this \
+        directory",
     )
-    plot_piegraph(
-        network_traffic_readings.copy(), rapl_readings.copy(), 6.5, output_dir
+    # Options of the commands printing tables or rendering figures: the
+    # parameters of the estimates, one value each (see sweep for several)
+    estimate = argparse.ArgumentParser(add_help=False)
+    for option, type_, default, what in [
+        ("--pue", float, PUE, "PUE of the data center"),
+        ("--storage", float, STORAGE_W, "power of the storage of a node (W)"),
+        ("--nodes", int, NODES, "number of nodes"),
+    ]:
+        estimate.add_argument(
+            option, type=type_, default=default, help="%s (default: %s)" % (what, default)
+        )
+    commands = parser.add_subparsers(dest="command", metavar="COMMAND")
+    commands.add_parser(
+        "tables",
+        parents=[common, estimate],
+        help="print the LaTeX tables only, without loading matplotlib or the \
+        datasets that are only plotted",
     )
-
-    plot_rapl_with_others(
-        rapl_readings.copy(),
-        sysstat_readings.copy(),
-        ledger_readings.copy(),
-        patched_network_data(network_traffic_readings, network_traffic_5m_readings),
-        output_dir,
+    sweep_parser = commands.add_parser(
+        "sweep",
+        parents=[common],
+        help="evaluate the power estimates over a grid of parameters, as csv \
+        with a row per combination",
+    )
+    for option, default, what in [
+        ("--pue", PUE, "PUE of the data center"),
+        ("--storage", STORAGE_W, "power of the storage of a node (W)"),
+        ("--nodes", NODES, "number of nodes"),
+        ("--gb-to-kwh", GB_TO_KWH, "energy intensity of the network (kWh/GB)"),
+    ]:
+        sweep_parser.add_argument(
+            option,
+            nargs="+",
+            type=sweep.parse_values,
+            default=[[default]],
+            metavar="VALUES",
+            help="%s, as numbers or start:stop:num ranges (default: %s)" % (what, default),
+        )
+    sweep_parser.add_argument(
+        "--output-file",
+        default="-",
+        help="csv file to write the scenarios to (default: stdout)",
+    )
+    render_parsers = [
+        commands.add_parser("figures", parents=[common, estimate], help="render every figure"),
+        commands.add_parser(
+            "figure", parents=[common, estimate], help="render the figures given by name"
+        ),
+        commands.add_parser(
+            "all",
+            parents=[common, estimate],
+            help="print the tables and render every figure (default)",
+        ),
+    ]
+    render_parsers[1].add_argument(
+        "names",
+        nargs="+",
+        choices=list(FIGURES),
+        metavar="NAME",
+        help="figures to render: %s" % ", ".join(FIGURES),
     )
+    for render_parser in render_parsers:
+        render_parser.add_argument(
+            "-o",
+            "--output-dir",
+            help="directory to write the figures to (default: %s)" % DEFAULT_OUTPUT_DIR,
+        )
+        render_parser.add_argument(
+            "--jobs",
+            type=int,
+            default=0,
+            help="number of processes rendering figures in parallel \
+            (default: 0, one per CPU)",
+        )
+        render_parser.add_argument(
+            "--force",
+            action="store_true",
+            help="render the figures even if their inputs haven't changed \
+            since they were last rendered",
+        )
+    args = parser.parse_args(legacy_args(sys.argv[1:], commands.choices))
+    enable_copy_on_write()
+    command = args.command or "all"
+    with_tables = command in ("tables", "all")
+    with_figures = command in ("figures", "figure", "all")
+    names = getattr(args, "names", list(FIGURES))
+    estimates = {k: getattr(args, k, v) for k, v in ESTIMATES.items()}
+
+    profile = getattr(args, "profile", None)
+    profiler = profiling.Profiler(profile is not None, getattr(args, "profile_dir", None))
+
+    datasets = []
+    if with_tables:
+        datasets += table_datasets()
+    if with_figures:
+        datasets += figure_datasets(names)
+    if command == "sweep":
+        datasets += sweep_datasets()
+    data = load_datasets(datasets, profiler)
+
+    if with_tables:
+        print_tables(data, profiler, estimates)
+
+    if with_figures:
+        render_figures(
+            data,
+            names,
+            get_output_dir(getattr(args, "output_dir", None)),
+            getattr(args, "jobs", 0),
+            getattr(args, "force", False),
+            profiler,
+            estimates,
+        )
+
+    if command == "sweep":
+        with profiler.stage("sweep"):
+            grid = sweep.scenarios(
+                np.concatenate(args.pue),
+                np.concatenate(args.storage),
+                np.concatenate(args.nodes),
+                np.concatenate(args.gb_to_kwh),
+            )
+            results = sweep.evaluate(grid, *sweep_inputs(data))
+        results.to_csv(sys.stdout if args.output_file == "-" else args.output_file, index=False)
+
+    if profiler.enabled:
+        print(profiler.format_table(), file=sys.stderr)
+    if profile:
+        profiler.write(profile)
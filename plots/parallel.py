@@ -0,0 +1,30 @@
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import os
+
+
+def resolve_jobs(jobs):
+    return jobs if jobs > 0 else os.cpu_count()
+
+
+## Call fn with every tuple of arguments in tasks, yielding the results in
+## order. With more than one job the calls are spread over a process pool,
+## keeping at most 2 * jobs tasks in flight so that finished results don't
+## pile up while waiting for an earlier one. initializer(*initargs) is called
+## once in every process running tasks (e.g. to set up state shared by tasks)
+def ordered_map(fn, tasks, jobs, initializer=None, initargs=()):
+    if jobs <= 1:
+        if initializer:
+            initializer(*initargs)
+        for args in tasks:
+            yield fn(*args)
+        return
+
+    with ProcessPoolExecutor(max_workers=jobs, initializer=initializer, initargs=initargs) as pool:
+        pending = deque()
+        for args in tasks:
+            pending.append(pool.submit(fn, *args))
+            if len(pending) >= 2 * jobs:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
@@ -1,38 +1,367 @@
 #!/usr/bin/env python
 
 import argparse
+import io
+import json
+import os
 from pathlib import Path
+import numpy
 import pandas
 
-def normalize_power_consumption(series):
-    duration = series["duration"]
+import datastore
+import powerdb
+import sketches
+from parallel import ordered_map, resolve_jobs
 
-    def normalizer(elem):
-        if isinstance(elem, int):
-            return elem / duration
+CSV_DELIMITER = ";"
+
+# manager.sh joins domain name and package index with awk's SUBSEP, so the
+# header reads e.g. "CORE\x1c0" rather than "CORE0"
+DOMAIN_SUBSEP = "\x1c"
+NON_ENERGY_COLUMNS = ["timestamp", "duration", "EXIT_CODE"]
+DEFAULT_DOMAINS = ["CORE", "CPU", "DRAM"]
+
+
+## Map a raw header field to a domain name. Package 0 keeps the bare name
+## (CORE, CPU, ...), other packages get their index appended (CPU1, ...)
+def domain_name(field):
+    name = field.strip().replace(DOMAIN_SUBSEP, "")
+    base = name.rstrip("0123456789")
+    if name[len(base):] in ("", "0"):
+        return base
+    return name
+
+
+## Return the header of a power-monitoring csv as a list of column names,
+## with the energy columns renamed through domain_name()
+def read_header(fpath):
+    with open(fpath, "r") as f:
+        fields = f.readline().rstrip("\n").split(CSV_DELIMITER)
+    return [f if f in NON_ENERGY_COLUMNS else domain_name(f) for f in fields]
+
+
+## Parse ISO-8601 timestamps. The collector writes one UTC offset per file
+## (except on DST changes), so the local part is parsed with a fixed format
+## and the offset attached afterwards, which is much faster than letting
+## pandas parse the offset of every row. A file crossing a DST change is
+## parsed as UTC and converted to the offset of its first row, so the column
+## keeps a single zone
+def parse_timestamps(strings):
+    zone = pandas.Timestamp(strings.iloc[0]).tzinfo
+    offsets = strings.str.slice(19)
+    if offsets.nunique() != 1:
+        return pandas.to_datetime(strings, utc=True).dt.tz_convert(zone)
+    local = pandas.to_datetime(strings.str.slice(0, 19), format="%Y-%m-%dT%H:%M:%S")
+    return local.dt.tz_localize(zone)
+
+
+def energy_columns(header):
+    return [c for c in header if c not in NON_ENERGY_COLUMNS]
+
+
+## Convert energy readings (uJ) to power (W) by dividing every energy column
+## by the duration (us) of its sample, in a single columnar operation
+def normalize_power_consumption(df, columns):
+    duration = df["duration"].to_numpy(dtype="float64")
+    power = df[columns].to_numpy(dtype="float64") / duration[:, None]
+    out = df[["timestamp"]].copy()
+    out[columns] = power
+    return out
+
+
+## Map the binary records (see powerdb.py) of a daily file from byte offset
+## on, like read_power_tail() does for csv files
+def read_records_tail(fpath, offset=0, domains=DEFAULT_DOMAINS):
+    available, _, header_size = powerdb.read_header(fpath)
+    columns = available if domains is None else [d for d in domains if d in available]
+    itemsize = powerdb.record_dtype(available).itemsize
+    start = max(offset - header_size, 0) // itemsize
+
+    records, utc_offset = powerdb.open_records(fpath, start)
+    end = header_size + (start + len(records)) * itemsize
+    return powerdb.power_frame(records, utc_offset, columns), end
+
+
+## Parse the complete lines of a power-monitoring csv from byte offset on.
+## Returns the normalized readings and the offset right after the last
+## complete line, where the next incremental read should continue
+def read_power_tail(fpath, offset=0, domains=DEFAULT_DOMAINS):
+    if Path(fpath).suffix == powerdb.RECORD_EXT:
+        return read_records_tail(fpath, offset, domains)
+
+    header = read_header(fpath)
+    available = energy_columns(header)
+    columns = available if domains is None else [d for d in domains if d in available]
+
+    with open(fpath, "rb") as f:
+        f.seek(offset)
+        data = f.read()
+    end = data.rfind(b"\n") + 1
+    if end == 0:
+        return pandas.DataFrame(columns=["timestamp"] + columns), offset
+
+    df = pandas.read_csv(
+        io.BytesIO(data[:end]),
+        sep=CSV_DELIMITER,
+        header=0 if offset == 0 else None,
+        names=header,
+        usecols=["timestamp", "duration"] + columns,
+    )
+    df["timestamp"] = parse_timestamps(df["timestamp"])
+    return normalize_power_consumption(df, columns), offset + end
+
+
+def read_power_file(fpath, domains=DEFAULT_DOMAINS):
+    return read_power_tail(fpath, 0, domains)[0]
+
+
+## The daily files in basepath, csv or binary records. If a day has both, the
+## records are read
+def input_files(basepath):
+    days = {p.stem: p for p in Path(basepath).glob("*.csv")}
+    days.update((p.stem, p) for p in Path(basepath).glob("*" + powerdb.RECORD_EXT))
+    return [days[day] for day in sorted(days)]
+
+
+def read_sorted_power_file(fpath, domains=DEFAULT_DOMAINS):
+    print("Reading", fpath.name, "...")
+    return read_power_file(fpath, domains).sort_values("timestamp", kind="stable")
+
+
+## Parse a daily file from offset and render it as csv rows (without header).
+## Formatting the output costs as much as parsing the input, so both are done
+## in the worker when running with several jobs. With keep_frame, the parsed
+## frame is returned as well (e.g. for a columnar copy), otherwise None
+def parse_to_csv_chunk(fpath, domains=DEFAULT_DOMAINS, offset=0, keep_frame=False):
+    if offset:
+        print("Reading", fpath.name, "from byte", offset, "...")
+    else:
+        print("Reading", fpath.name, "...")
+    df, end = read_power_tail(fpath, offset, domains)
+    df = df.sort_values("timestamp", kind="stable")
+    body = df.to_csv(index=False, header=False)
+    return list(df.columns), body, end, df if keep_frame else None
+
+
+## Read all CSVs in basepath, and concatenate in a single dataframe
+def read_and_parse_csv(basepath, domains=DEFAULT_DOMAINS, jobs=1):
+    tasks = [(p, domains) for p in input_files(basepath)]
+    return pandas.concat(ordered_map(read_sorted_power_file, tasks, jobs), ignore_index=True)
+
+
+## Write csv chunks to f, checking that they all have the same columns.
+## Returns the columns, or None if there were no chunks
+def write_chunks(f, chunks, header=None, write_header=True):
+    for columns, body in chunks:
+        if header is None:
+            header = columns
+            if write_header:
+                f.write(",".join(header) + "\n")
+        elif columns != header:
+            raise ValueError("Expected columns %s, got %s" % (header, columns))
+        f.write(body)
+    return header
+
+
+## Parse all CSVs in basepath and write them to a single csv file, one daily
+## file at a time, so that the whole dataset is never held in memory. With
+## output_parquet, the same frames are written to a columnar copy as well,
+## without parsing the files again. Returns the manifest describing what was
+## read
+def write_parsed_csv(basepath, output_csv, domains=DEFAULT_DOMAINS, jobs=1, output_parquet=None):
+    files = input_files(basepath)
+    manifest = {"domains": domains, "columns": None, "files": {}}
+    tasks = [(p, domains, 0, output_parquet is not None) for p in files]
+
+    with open(output_csv, "w") as f:
+
+        def frames():
+            results = ordered_map(parse_to_csv_chunk, tasks, jobs)
+            for fpath, (columns, body, end, df) in zip(files, results):
+                manifest["files"][fpath.name] = file_entry(fpath, end)
+                manifest["columns"] = write_chunks(f, [(columns, body)], manifest["columns"])
+                yield df
+
+        if output_parquet:
+            datastore.write_columnar_chunks(frames(), output_parquet)
         else:
-            return elem
-
-    return series.drop(labels=["duration"]).apply(normalizer, duration)
-
-
-## Read all CSVs in basepath, and concatenate in a single csv file
-def read_and_parse_csv(basepath):
-    dfs = []
-    header_names = ["timestamp", "duration", "CORE", "CPU", "DRAM"]
-    for p in Path(basepath).glob("*.csv"):
-        print("Reading", p.name, "...")
-        with p.open("r") as csv_file:
-            df = pandas.read_csv(
-                csv_file,
-                sep=";",
-                header=0,
-                names=header_names,
-                usecols=[0, 1, 2, 3, 4],
-                parse_dates=[0],
-            ).apply(normalize_power_consumption, axis=1)
-            dfs.append(df)
-    return pandas.concat(dfs)
+            for _ in frames():
+                pass
+    return manifest
+
+
+## Parse all CSVs in basepath into a single columnar (parquet) file, with one
+## row group per daily file
+def write_parsed_columnar(basepath, output_path, domains=DEFAULT_DOMAINS, jobs=1):
+    tasks = [(p, domains) for p in input_files(basepath)]
+    datastore.write_columnar_chunks(
+        ordered_map(read_sorted_power_file, tasks, jobs), output_path
+    )
+
+
+def file_entry(fpath, offset):
+    stat = fpath.stat()
+    return {"size": stat.st_size, "mtime": stat.st_mtime, "offset": offset}
+
+
+def default_manifest_path(output_csv):
+    return output_csv + ".manifest.json"
+
+
+def read_manifest(fpath):
+    if not os.path.isfile(fpath):
+        return None
+    with open(fpath, "r") as f:
+        return json.load(f)
+
+
+def write_manifest(fpath, manifest):
+    tmp = fpath + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp, fpath)
+
+
+## Work out which files need reading to bring the output up to date with the
+## manifest, as a list of (path, offset) pairs. Returns None if the output
+## can't be appended to and has to be rebuilt: a file already read shrank or
+## vanished, or a new file sorts before one that was already read
+def pending_reads(files, manifest, domains):
+    if manifest is None or manifest["domains"] != domains:
+        return None
+
+    seen = manifest["files"]
+    names = [p.name for p in files]
+    if any(name not in names for name in seen):
+        return None
+
+    last_seen = max(seen) if seen else ""
+    reads = []
+    for fpath in files:
+        entry = seen.get(fpath.name)
+        if entry is None:
+            if fpath.name < last_seen:
+                return None
+            reads.append((fpath, 0))
+            continue
+
+        stat = fpath.stat()
+        if stat.st_size < entry["offset"]:
+            return None
+        if stat.st_size != entry["size"] or stat.st_mtime != entry["mtime"]:
+            reads.append((fpath, entry["offset"]))
+    return reads
+
+
+## Bring output_csv up to date by only parsing what was appended to the input
+## files since the last run, as recorded in the manifest. Falls back to a full
+## rebuild when that is not possible
+def update_parsed_csv(
+    basepath, output_csv, manifest_path, domains=DEFAULT_DOMAINS, jobs=1
+):
+    files = input_files(basepath)
+    manifest = read_manifest(manifest_path)
+    reads = None
+    if os.path.isfile(output_csv):
+        reads = pending_reads(files, manifest, domains)
+
+    if reads is None:
+        print("Rebuilding", output_csv, "from scratch ...")
+        manifest = write_parsed_csv(basepath, output_csv, domains, jobs)
+    elif reads:
+        tasks = [(p, domains, offset) for p, offset in reads]
+        results = ordered_map(parse_to_csv_chunk, tasks, jobs)
+
+        def chunks():
+            for (fpath, _), (columns, body, end, _) in zip(reads, results):
+                manifest["files"][fpath.name] = file_entry(fpath, end)
+                yield columns, body
+
+        with open(output_csv, "a") as f:
+            header = manifest["columns"]
+            manifest["columns"] = write_chunks(f, chunks(), header, header is None)
+    else:
+        print(output_csv, "is up to date")
+
+    write_manifest(manifest_path, manifest)
+
+
+## Summaries (see sketches.py) of the readings of every domain in a daily file
+## from byte offset on, and the offset where the next update continues
+def summarize_tail(fpath, domains=DEFAULT_DOMAINS, offset=0, alpha=sketches.DEFAULT_ALPHA):
+    df, end = read_power_tail(fpath, offset, domains)
+    summaries = sketches.summarize_frame(df.drop(columns="timestamp"), alpha)
+    return {c: summary.to_dict() for c, summary in summaries.items()}, end
+
+
+## Keep per-day summaries of the readings in stats_path up to date with the
+## daily files in basepath. Only what was added to a file since the last run
+## is read and merged into its summaries, so memory use doesn't depend on how
+## many days there are
+def update_stats(
+    basepath, stats_path, domains=DEFAULT_DOMAINS, jobs=1, alpha=sketches.DEFAULT_ALPHA
+):
+    files = input_files(basepath)
+    stats = read_manifest(stats_path)
+    if stats is None or stats["domains"] != domains or stats["alpha"] != alpha:
+        stats = {"alpha": alpha, "domains": domains, "files": {}}
+
+    names = [p.name for p in files]
+    stats["files"] = {n: e for n, e in stats["files"].items() if n in names}
+
+    tasks = []
+    for fpath in files:
+        entry = stats["files"].get(fpath.name)
+        stat = fpath.stat()
+        if entry is None or stat.st_size < entry["offset"]:
+            tasks.append((fpath, domains, 0, alpha))
+        elif stat.st_size != entry["size"] or stat.st_mtime != entry["mtime"]:
+            tasks.append((fpath, domains, entry["offset"], alpha))
+
+    for (fpath, _, offset, _), (columns, end) in zip(
+        tasks, ordered_map(summarize_tail, tasks, jobs)
+    ):
+        if offset:
+            old = stats["files"][fpath.name]["columns"]
+            for c in columns:
+                merged = sketches.Summary.from_dict(old[c])
+                merged.merge(sketches.Summary.from_dict(columns[c]))
+                columns[c] = merged.to_dict()
+        stats["files"][fpath.name] = dict(file_entry(fpath, end), columns=columns)
+
+    if not tasks:
+        print(stats_path, "is up to date")
+    write_manifest(stats_path, stats)
+
+
+## Convert a daily csv to binary records, keeping the energy of every domain.
+## Missing readings are stored as powerdb.MISSING, so they read back as NaN
+def convert_to_records(fpath, output_dir):
+    header = read_header(fpath)
+    columns = energy_columns(header)
+    df = pandas.read_csv(
+        fpath,
+        sep=CSV_DELIMITER,
+        header=0,
+        names=header,
+        usecols=["timestamp", "duration"] + columns,
+    )
+    timestamps = parse_timestamps(df["timestamp"])
+
+    records = numpy.zeros(len(df), dtype=powerdb.record_dtype(columns))
+    records["timestamp"] = timestamps.dt.as_unit("ns").dt.tz_convert("UTC").astype("int64")
+    records["duration"] = df["duration"]
+    for column in columns:
+        records[column] = df[column].fillna(0)
+        records[column][df[column].isna().to_numpy()] = powerdb.MISSING
+
+    utc_offset = 0
+    if len(df):
+        utc_offset = int(timestamps.iloc[0].utcoffset().total_seconds())
+    output = Path(output_dir) / (fpath.stem + powerdb.RECORD_EXT)
+    print("Converting", fpath.name, "->", output)
+    powerdb.write_records(output, records, utc_offset)
+
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(
@@ -42,14 +371,96 @@ if __name__ == "__main__":
     parser.add_argument(
         "--output-csv", type=str, help="path to file where to store results"
     )
+    parser.add_argument(
+        "--output-parquet",
+        type=str,
+        help="path to a columnar (parquet) file where to store results, e.g. \
+        './data/cpu-ram.parquet' next to the csv read by main.py",
+    )
     parser.add_argument(
         "--input-dir",
         nargs=1,
         help="path to directory where output from power-monitoring manager is \
         stored, e.g. './data/power-monitoring-db'",
     )
+    parser.add_argument(
+        "--domains",
+        nargs="+",
+        default=DEFAULT_DOMAINS,
+        help="RAPL domains to include in the output, as named in the csv \
+        header without the package index (default: CORE CPU DRAM). Use 'all' \
+        to include every energy column found in the header",
+    )
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        default=1,
+        help="number of worker processes parsing daily files in parallel \
+        (default: 1, 0 for one per CPU)",
+    )
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="only parse what was added to the input directory since the \
+        last incremental run and append it to the output csv. What has been \
+        read is tracked in a manifest next to the output csv",
+    )
+    parser.add_argument(
+        "--manifest",
+        type=str,
+        help="path to the manifest used by --incremental (default: \
+        OUTPUT_CSV.manifest.json)",
+    )
+
+    parser.add_argument(
+        "--output-records",
+        type=str,
+        help="directory to write a binary record file (see powerdb.py) to for \
+        every daily csv in the input directory, e.g. to convert existing \
+        data to what collector.py --format binary writes",
+    )
+
+    parser.add_argument(
+        "--output-stats",
+        type=str,
+        help="json file with per-day sketches of the readings of every \
+        domain, e.g. './data/power-stats.json', which main.py builds its \
+        tables from. Only what was added since the last run is read",
+    )
 
     args = parser.parse_args()
+    if not (
+        args.output_csv or args.output_parquet or args.output_records or args.output_stats
+    ):
+        parser.error(
+            "expected --output-csv, --output-parquet, --output-records and/or \
+            --output-stats"
+        )
+    if args.incremental and (args.output_parquet or not args.output_csv):
+        parser.error("--incremental only supports --output-csv")
+
+    domains = None if args.domains == ["all"] else args.domains
+
+    jobs = resolve_jobs(args.jobs)
+
+    if args.incremental:
+        manifest_path = args.manifest or default_manifest_path(args.output_csv)
+        update_parsed_csv(
+            args.input_dir[0], args.output_csv, manifest_path, domains, jobs
+        )
+    elif args.output_csv:
+        write_parsed_csv(
+            args.input_dir[0], args.output_csv, domains, jobs, args.output_parquet
+        )
+    elif args.output_parquet:
+        write_parsed_columnar(args.input_dir[0], args.output_parquet, domains, jobs)
+
+    if args.output_stats:
+        update_stats(args.input_dir[0], args.output_stats, domains, jobs)
 
-    data = read_and_parse_csv(args.input_path)
-    data.to_csv(args.output_csv, index=False)
+    if args.output_records:
+        os.makedirs(args.output_records, exist_ok=True)
+        files = Path(args.input_dir[0]).glob("*.csv")
+        tasks = [(p, args.output_records) for p in sorted(files)]
+        for _ in ordered_map(convert_to_records, tasks, jobs):
+            pass
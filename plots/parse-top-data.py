@@ -5,99 +5,174 @@ import os
 import re
 import sys
 
-def chunk_csv_header():
-    return [
-        "timestamp",
-        "CPU US",
-        "CPU SY",
-        "CPU ID",
-        "MEM USED",
-        "MEM BUFF",
-        "Stellar CPU%",
-        "Stellar MEM%",
-        "PGSQL CPU%",
-        "PGSQL MEM%",
-    ]
-
-def csv_rows_generator(lines):
-    if not lines:
-        return
+from parallel import ordered_map, resolve_jobs
+
+SYSTEM_COLUMNS = ["CPU US", "CPU SY", "CPU ID", "MEM USED", "MEM BUFF"]
+GROUP_COLUMNS = ["CPU%", "MEM%", "RES KiB"]
+
+# Process groups tracked by default, as (name, regex matched against the
+# COMMAND column of top). Every process matching a group is added to it
+DEFAULT_GROUPS = [("Stellar", "stellar"), ("PGSQL", "postgres")]
 
-    row = lines.pop()
-    while not row.startswith("top"):
-        if not lines: return
+LAYOUTS = ["wide", "long"]
 
-        row = lines.pop().strip()
+## The wide layout has one row per sample with the columns of each group next
+## to each other, the long layout has one row per sample and group
+def chunk_csv_header(groups=DEFAULT_GROUPS, layout="wide"):
+    if layout == "long":
+        return ["timestamp", "group", "processes"] + GROUP_COLUMNS
+    header = ["timestamp"] + SYSTEM_COLUMNS
+    for name, _ in groups:
+        header += [name + " " + col for col in GROUP_COLUMNS]
+    return header
 
-    yield row.split(" ")[2]
 
-    while not row.startswith("%Cpu"):
-        row = lines.pop().strip()
+## Parse NAME=REGEX from the command line into a process group
+def parse_group(arg):
+    name, sep, pattern = arg.partition("=")
+    if not sep or not name:
+        raise argparse.ArgumentTypeError("expected NAME=REGEX, got '%s'" % arg)
+    return name, pattern
 
-    cpu_stats = row.split("  ")
-    cpu_us = cpu_stats[1].split(" ")[0]
-    cpu_sy = cpu_stats[2].split(" ")[0]
-    cpu_id = cpu_stats[4].split(" ")[0]
 
-    yield cpu_us
-    yield cpu_sy
-    yield cpu_id
+def compile_groups(groups):
+    return [(name, re.compile(pattern)) for name, pattern in groups]
 
-    while not row.startswith("MiB Mem"):
-        row = lines.pop().strip()
+# e.g. "%Cpu(s):  5.7 us,  0.8 sy,  0.0 ni,100.0 id, ..."
+CPU_FIELDS = re.compile(r"([\d.]+) us,\s*([\d.]+) sy,.*?([\d.]+) id")
+# e.g. "MiB Mem :  31900.5 total,  10419.7 free,    505.9 used,  20974.8 buff/cache"
+MEM_FIELDS = re.compile(r"([\d.]+)\+? used,\s*([\d.]+)\+? buff/cache")
 
-    mem = row.split("  ")
-    mem_used = mem[2].strip().split(" ")[0]
-    mem_buff = mem[4].strip().split(" ")[0]
+# Keys of the system-wide values of a sample, in the order of SYSTEM_COLUMNS
+SYSTEM_KEYS = ["cpu_us", "cpu_sy", "cpu_id", "mem_used", "mem_buff"]
 
-    yield mem_used
-    yield mem_buff
+# top switches to a unit suffix when memory doesn't fit its column
+RES_UNITS = {"m": 1024, "g": 1024 ** 2, "t": 1024 ** 3, "p": 1024 ** 4}
 
-    while not "PID" in row:
-        row = lines.pop().strip()
 
-    procs = []
-    while not row.startswith("top") and lines:
-        row = lines.pop().strip()
-        if not row.startswith("top"):
-            procs.append(row)
+def new_sample(line, groups):
+    sample = dict.fromkeys(SYSTEM_KEYS)
+    sample["time"] = line.split(None, 3)[2]
+    # Per group: [number of processes, CPU%, MEM%, RES in KiB]
+    sample["groups"] = {name: [0, 0.0, 0.0, 0.0] for name, _ in groups}
+    return sample
 
-    lines.append(row)
 
-    stellar = next(filter(lambda x: "stellar" in x, procs), None)
-    postgres = next(filter(lambda x: "postgres" in x, procs), None)
+## Copy the values captured by a summary-line regex into sample, as floats.
+## Values are matched by their label since top's column alignment varies
+def add_summary(sample, pattern, keys, line):
+    match = pattern.search(line)
+    if match:
+        for key, value in zip(keys, match.groups()):
+            sample[key] = float(value)
 
-    if stellar:
-        stellar = re.split(r'\s+', stellar.strip())
-        stellar_cpu = stellar[8]
-        stellar_mem = stellar[9]
-        yield stellar_cpu
-        yield stellar_mem
-    else :
-        yield ""
-        yield ""
 
-    if postgres:
-        postgres = re.split(r'\s+', postgres.strip())
-        postgres_cpu = postgres[8]
-        postgres_mem = postgres[9]
-        yield postgres_cpu
-        yield postgres_mem
-    else :
-        yield ""
-        yield ""
+def parse_res(value):
+    unit = RES_UNITS.get(value[-1])
+    if unit is None:
+        return float(value)
+    return float(value[:-1]) * unit
 
-def read_top_file(fpath, delimiter = ','):
+
+## Add CPU%, MEM% and RES of a process table line to every group matching its
+## command
+def add_process(sample, line, groups):
+    fields = line.split(None, 11)
+    if len(fields) < 12:
+        return
+    command = fields[11]
+    for name, pattern in groups:
+        if pattern.search(command):
+            totals = sample["groups"][name]
+            totals[0] += 1
+            totals[1] += float(fields[8])
+            totals[2] += float(fields[9])
+            totals[3] += parse_res(fields[5])
+
+
+## Single pass over the lines of top batch output (top -b), as a state machine
+## over the sections of each refresh: the "top -" line starts a new sample,
+## followed by the "%Cpu(s)" and "MiB Mem" summaries and the process table
+## after the "PID" header. Yields one dict per sample, with the process
+## values summed per group of compile_groups()
+def iter_samples(lines, groups):
+    sample = None
+    in_procs = False
+    for line in lines:
+        head = line[:5]
+        if head == "top -":
+            if sample is not None:
+                yield sample
+            sample = new_sample(line, groups)
+            in_procs = False
+        elif in_procs:
+            if line.strip():
+                add_process(sample, line, groups)
+        elif sample is None:
+            continue
+        elif head == "%Cpu(":
+            add_summary(sample, CPU_FIELDS, SYSTEM_KEYS[:3], line)
+        elif head == "MiB M":
+            add_summary(sample, MEM_FIELDS, SYSTEM_KEYS[3:], line)
+        elif "PID" in line:
+            in_procs = True
+
+    if sample is not None:
+        yield sample
+
+
+## The rows of a sample in the given layout, as lists of values. Groups
+## without any matching process get empty values
+def sample_rows(sample, layout="wide"):
+    if layout == "long":
+        return [
+            [sample["time"], name] + (totals if totals[0] else [0, None, None, None])
+            for name, totals in sample["groups"].items()
+        ]
+    row = [sample["time"]] + [sample[key] for key in SYSTEM_KEYS]
+    for totals in sample["groups"].values():
+        row += totals[1:] if totals[0] else [None, None, None]
+    return [row]
+
+
+def format_row(values, delimiter=","):
+    return delimiter.join(["" if v is None else str(v) for v in values])
+
+
+## Stream the samples of a top file as csv rows, without reading the whole
+## file into memory
+def read_top_file(fpath, delimiter = ',', groups=DEFAULT_GROUPS, layout="wide"):
+    compiled = compile_groups(groups)
     with open(fpath, 'r') as f:
-        lines = f.readlines()
-        lines.reverse()
+        for sample in iter_samples(f, compiled):
+            for row in sample_rows(sample, layout):
+                yield format_row(row, delimiter)
+
+def file_date(fpath):
+    return os.path.basename(fpath).split(".")[0]
+
+
+## Parse a whole top file into csv rows prefixed with the date taken from the
+## filename, returned as one string so that a worker process can hand it back
+## in one piece
+def parse_top_file_csv(fpath, delimiter=",", groups=DEFAULT_GROUPS, layout="wide"):
+    date = file_date(fpath)
+    rows = read_top_file(fpath, delimiter, groups, layout)
+    return "".join(date + " " + row + "\n" for row in rows)
+
+
+## Parse a whole top file into a dataframe with the columns of
+## chunk_csv_header() and full timestamps
+def read_top_frame(fpath, groups=DEFAULT_GROUPS, layout="wide"):
+    import pandas as pd
+
+    compiled = compile_groups(groups)
+    with open(fpath, "r") as f:
+        rows = [r for s in iter_samples(f, compiled) for r in sample_rows(s, layout)]
+    df = pd.DataFrame.from_records(rows, columns=chunk_csv_header(groups, layout))
+    df["timestamp"] = pd.to_datetime(file_date(fpath) + " " + df["timestamp"])
+    return df
 
-        entries = []
-        while len(lines) > 0:
-            gen = csv_rows_generator(lines)
-            row = delimiter.join([x for x in gen])
-            entries.append(row)
-        return entries
 
 def is_valid_file(fpath):
     return os.path.isfile(fpath)
@@ -105,7 +180,7 @@ def is_valid_file(fpath):
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser("Parse output from top files, printed to \
-                                     stdout")
+                                     stdout or written to --output")
 
     parser.add_argument(
         "--input-files",
@@ -113,19 +188,62 @@ if __name__ == "__main__":
         required=True,
         help="List of files to take as input",
     )
+    parser.add_argument(
+        "--output",
+        help="file to write the results to instead of stdout. Files ending in \
+        .parquet are written in columnar format (see datastore.py), anything \
+        else as csv",
+    )
+    parser.add_argument(
+        "--group",
+        dest="groups",
+        action="append",
+        type=parse_group,
+        metavar="NAME=REGEX",
+        help="track the processes whose COMMAND matches REGEX as group NAME, \
+        summing their CPU%%, MEM%% and RES per sample. Can be given several \
+        times (default: Stellar=stellar PGSQL=postgres)",
+    )
+    parser.add_argument(
+        "--layout",
+        choices=LAYOUTS,
+        default="wide",
+        help="wide: one row per sample with system-wide and per-group \
+        columns (default). long: one row per sample and group",
+    )
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        default=1,
+        help="number of worker processes parsing files in parallel \
+        (default: 1, 0 for one per CPU)",
+    )
     args = parser.parse_args()
-    input_files = list(filter(is_valid_file, args.input_files))
+    input_files = sorted(filter(is_valid_file, args.input_files), key=file_date)
+    jobs = resolve_jobs(args.jobs)
+    groups = args.groups or DEFAULT_GROUPS
 
     DELIM = ","
 
-    print(DELIM.join(chunk_csv_header()))
+    if args.output and args.output.endswith(".parquet"):
+        import datastore
+
+        tasks = [(fpath, groups, args.layout) for fpath in input_files]
+        datastore.write_columnar_chunks(
+            ordered_map(read_top_frame, tasks, jobs), args.output
+        )
+        sys.exit(0)
+
+    out = open(args.output, "w") if args.output else sys.stdout
+    out.write(DELIM.join(chunk_csv_header(groups, args.layout)) + "\n")
 
     if len(input_files) > 0:
-        for fpath in input_files:
-            csv_rows = read_top_file(fpath, DELIM)
-            date = fpath.split("/")[-1].split(".")[0]
-            for r in csv_rows:
-                print(date + " " + r)
+        tasks = [(fpath, DELIM, groups, args.layout) for fpath in input_files]
+        for rows in ordered_map(parse_top_file_csv, tasks, jobs):
+            out.write(rows)
 
     else:
         print("Expected at least one file as argument")
+
+    if args.output:
+        out.close()
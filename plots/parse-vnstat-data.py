@@ -2,15 +2,22 @@
 
 import argparse
 import csv
-import json
+import itertools
+
+import vnstatjson
 
 CSV_DELIMITER = ","
 
 
-def read_json_file(fpath):
+## Stream the day entries of an interface from a vnstat export, by default
+## those of the first interface in the file
+def read_json_file(fpath, interface=None):
     with open(fpath, "r") as f:
-        data = json.loads(f.read())
-        return data["interfaces"][0]["traffic"]["day"]
+        for name, entry in vnstatjson.iter_traffic(f, "day"):
+            if interface is None:
+                interface = name
+            if name == interface:
+                yield entry
 
 
 def parse_timestamp(traffic_obj):
@@ -30,8 +37,9 @@ def flatten_traffic_obj(data):
     ]
 
 
+## Write rows as they come, so that they never have to be held in memory
 def writecsv(fpath, rows, delimiter):
-    with open(fpath, "w") as f:
+    with open(fpath, "w", newline="") as f:
         writer = csv.writer(f, delimiter=delimiter)
         writer.writerows(rows)
 
@@ -50,10 +58,16 @@ if __name__ == "__main__":
         nargs=1,
         help="path to csv file to save results in",
     )
+    parser.add_argument(
+        "--interface",
+        help="name of the interface to read (default: the first one)",
+    )
     args = parser.parse_args()
 
-    traffic_data = read_json_file(args.input_file)
-    traffic = list(map(flatten_traffic_obj, traffic_data))
+    traffic_data = read_json_file(args.input_file[0], args.interface)
+    traffic = map(flatten_traffic_obj, traffic_data)
     header = ["timestamp", "rx", "tx"]
 
-    writecsv(args.output_file, [header] + traffic, delimiter=CSV_DELIMITER)
+    writecsv(
+        args.output_file[0], itertools.chain([header], traffic), delimiter=CSV_DELIMITER
+    )
@@ -0,0 +1,115 @@
+"""
+Binary power records, as written by power-monitoring/collector.py with
+--format binary, one YYYY-MM-DD.rapl file per day.
+
+A file starts with a header of
+
+    8 bytes    magic, b"RAPLREC1"
+    uint32     size of the header in bytes
+    uint32     number of domains
+    int32      UTC offset of the collector in seconds
+    uint32     reserved
+    16 bytes   NUL padded name of every domain (CORE, CPU, DRAM, ...)
+
+followed by fixed-width records of
+
+    int64      timestamp at the start of the window, in ns since the epoch
+    uint64     duration of the window in us
+    uint64     energy used by every domain during the window in uJ, or
+               MISSING (2^64 - 1) if it is unknown
+
+all little endian. A file is mapped into a NumPy structured array as is, so
+reading it involves no parsing, and only the columns used are ever paged in.
+"""
+
+import datetime
+import struct
+
+import numpy as np
+import pandas as pd
+
+RECORD_EXT = ".rapl"
+MAGIC = b"RAPLREC1"
+HEADER = struct.Struct("<8sIIiI")
+NAME_SIZE = 16
+
+# Energy of a domain which wasn't read, e.g. the UNCORE column manager.sh
+# leaves empty. Read as NaN W rather than 0 W
+MISSING = np.iinfo(np.uint64).max
+
+
+def record_dtype(domains):
+    fields = [("timestamp", "<i8"), ("duration", "<u8")]
+    return np.dtype(fields + [(d, "<u8") for d in domains])
+
+
+"""
+Read the header of a record file. Returns the domains, the UTC offset of the
+collector in seconds and the size of the header, i.e. the offset of the first
+record
+"""
+def read_header(fpath):
+    with open(fpath, "rb") as f:
+        magic, size, count, utc_offset, _ = HEADER.unpack(f.read(HEADER.size))
+        if magic != MAGIC:
+            raise ValueError("%s is not a power record file" % fpath)
+        names = f.read(NAME_SIZE * count)
+    domains = [
+        names[i : i + NAME_SIZE].rstrip(b"\0").decode("ascii")
+        for i in range(0, len(names), NAME_SIZE)
+    ]
+    return domains, utc_offset, size
+
+
+def encode_header(domains, utc_offset):
+    header = HEADER.pack(MAGIC, HEADER.size + NAME_SIZE * len(domains), len(domains), utc_offset, 0)
+    return header + b"".join(d.encode("ascii").ljust(NAME_SIZE, b"\0") for d in domains)
+
+
+"""
+Memory-map the records of a file from record index start on, read-only. A
+record that is still being written at the end of the file is left out
+"""
+def open_records(fpath, start=0):
+    domains, utc_offset, header_size = read_header(fpath)
+    dtype = record_dtype(domains)
+    with open(fpath, "rb") as f:
+        f.seek(0, 2)
+        count = (f.tell() - header_size) // dtype.itemsize
+    if count <= start:
+        return np.empty(0, dtype=dtype), utc_offset
+    records = np.memmap(
+        fpath,
+        dtype=dtype,
+        mode="r",
+        offset=header_size + start * dtype.itemsize,
+        shape=(count - start,),
+    )
+    return records, utc_offset
+
+
+def write_records(fpath, records, utc_offset):
+    with open(fpath, "wb") as f:
+        f.write(encode_header(list(records.dtype.names[2:]), utc_offset))
+        f.write(np.ascontiguousarray(records).tobytes())
+
+
+def timezone(utc_offset):
+    return datetime.timezone(datetime.timedelta(seconds=utc_offset))
+
+
+"""
+Power (W) of the given domains from records, as a dataframe with a timestamp
+column followed by one column per domain, like the csv written by
+parse-and-normalize-power-data.py. MISSING energies are NaN
+"""
+def power_frame(records, utc_offset, domains):
+    timestamps = pd.to_datetime(records["timestamp"], unit="ns", utc=True)
+    df = pd.DataFrame({"timestamp": timestamps.tz_convert(timezone(utc_offset))})
+    duration = records["duration"].astype("float64")
+    for domain in domains:
+        energy = records[domain]
+        power = energy / duration
+        power[energy == MISSING] = np.nan
+        df[domain] = power
+    return df
@@ -0,0 +1,117 @@
+"""
+Per-stage instrumentation of main.py: the wall time, CPU time and memory of
+every load, table and plot stage, written as a JSON report, and optionally a
+cProfile dump of every stage (view with python -m pstats or snakeviz).
+
+Memory is reported as the resident set size after the stage and how much it
+grew, and as how much the stage raised the peak RSS of the process. The peak
+only grows, so a stage that allocates less than an earlier one did shows no
+peak delta even if it needed a lot of memory.
+
+A disabled Profiler measures nothing, so the stages cost the same as without
+it.
+"""
+
+import contextlib
+import cProfile
+import json
+import os
+import resource
+import sys
+import time
+
+PAGE_KB = os.sysconf("SC_PAGE_SIZE") // 1024 if hasattr(os, "sysconf") else 4
+
+
+## The peak RSS of this process, in KiB (ru_maxrss is in bytes on macOS)
+def peak_rss_kb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak // 1024 if sys.platform == "darwin" else peak
+
+
+## The current RSS of this process in KiB, or None where /proc is missing
+def rss_kb():
+    try:
+        with open("/proc/self/statm", "r") as f:
+            return int(f.read().split()[1]) * PAGE_KB
+    except OSError:
+        return None
+
+
+class Profiler:
+    """
+    Measures the stages run in stage() blocks, in order. With dump_dir, each
+    stage is also run under cProfile and its stats dumped to
+    <dump_dir>/<stage>.prof
+    """
+
+    def __init__(self, enabled=False, dump_dir=None):
+        self.enabled = enabled or dump_dir is not None
+        self.dump_dir = dump_dir
+        self.stages = []
+        self.start = time.perf_counter()
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        if not self.enabled:
+            yield
+            return
+
+        profile = None
+        if self.dump_dir is not None:
+            profile = cProfile.Profile()
+        rss_before = rss_kb()
+        peak_before = peak_rss_kb()
+        cpu = time.process_time()
+        start = time.perf_counter()
+        if profile:
+            profile.enable()
+        try:
+            yield
+        finally:
+            if profile:
+                profile.disable()
+            wall = time.perf_counter() - start
+            cpu = time.process_time() - cpu
+            rss_after = rss_kb()
+            peak_after = peak_rss_kb()
+            self.stages.append({
+                "name": name,
+                "wall_seconds": wall,
+                "cpu_seconds": cpu,
+                "rss_kb": rss_after,
+                "rss_delta_kb": None if rss_after is None else rss_after - rss_before,
+                "peak_rss_kb": peak_after,
+                "peak_rss_delta_kb": peak_after - peak_before,
+            })
+            if profile:
+                os.makedirs(self.dump_dir, exist_ok=True)
+                profile.dump_stats(os.path.join(self.dump_dir, name + ".prof"))
+
+    def report(self):
+        return {
+            "wall_seconds": time.perf_counter() - self.start,
+            "cpu_seconds": time.process_time(),
+            "peak_rss_kb": peak_rss_kb(),
+            "stages": self.stages,
+        }
+
+    def write(self, fpath):
+        with open(fpath, "w") as f:
+            json.dump(self.report(), f, indent=2)
+
+    ## A table of the stages, slowest first, e.g. for stderr
+    def format_table(self):
+        lines = ["%-28s %9s %9s %10s %10s" % ("stage", "wall s", "cpu s", "RSS MB", "peak +MB")]
+        for s in sorted(self.stages, key=lambda s: -s["wall_seconds"]):
+            lines.append(
+                "%-28s %9.3f %9.3f %10s %10.1f"
+                % (
+                    s["name"],
+                    s["wall_seconds"],
+                    s["cpu_seconds"],
+                    "-" if s["rss_kb"] is None else "%.1f" % (s["rss_kb"] / 1024),
+                    s["peak_rss_delta_kb"] / 1024,
+                )
+            )
+        return "\n".join(lines)
@@ -0,0 +1,219 @@
+#!/usr/bin/env python
+
+import argparse
+import csv
+import datetime
+import os
+import shutil
+import sqlite3
+import sys
+
+CSV_DELIMITER = ","
+HEADER = ["timestamp", "interface", "rx", "tx"]
+
+# Tables of vnstat 2.x read by this script. Dates are stored as local time
+# text, "YYYY-MM-DD" in day and "YYYY-MM-DD HH:MM:SS" in fiveminute
+TABLES = ["day", "fiveminute"]
+
+# How much of the end of the output to search for the rows of the watermark
+TAIL_BYTES = 1 << 16
+
+
+## SQL expression for the epoch of a row. vnstat stores local time, which
+## sqlite converts to UTC with the local timezone of this machine, unless the
+## UTC offset of the machine running vnstat is given
+def epoch_expression(utc_offset):
+    if utc_offset is None:
+        return "CAST(strftime('%s', t.date, 'utc') AS INTEGER)"
+    return "CAST(strftime('%%s', t.date) AS INTEGER) - %d" % int(utc_offset * 3600)
+
+
+## The first date of table with an epoch of at least since, in the local time
+## text vnstat stores (see epoch_expression()). Comparing the date column
+## itself against it, rather than its epoch, lets sqlite use the index of
+## (interface, date)
+def date_bound(table, since, utc_offset=None):
+    if utc_offset is None:
+        local = datetime.datetime.fromtimestamp(since)
+    else:
+        local = datetime.datetime.fromtimestamp(
+            since, datetime.timezone(datetime.timedelta(hours=utc_offset))
+        ).replace(tzinfo=None)
+    if table == "fiveminute":
+        return local.strftime("%Y-%m-%d %H:%M:%S")
+    day = local.date()
+    if local.time() != datetime.time(0):
+        day += datetime.timedelta(days=1)
+    return day.isoformat()
+
+
+## The query of query_traffic() and its parameters
+def traffic_query(table, since=0, interfaces=None, utc_offset=None):
+    if table not in TABLES:
+        raise ValueError("Expected one of %s, got %s" % (TABLES, table))
+
+    # Interfaces first (CROSS JOIN keeps that order), so that the rows of
+    # each are found with a search of the (interface, date) index instead of
+    # a scan of the table
+    query = (
+        "SELECT {epoch} AS ts, interface.name, t.rx, t.tx "
+        "FROM interface CROSS JOIN {table} AS t ON interface.id = t.interface "
+        "WHERE t.date >= ?"
+    ).format(epoch=epoch_expression(utc_offset), table=table)
+    params = [date_bound(table, since, utc_offset)]
+    if interfaces:
+        query += " AND interface.name IN (%s)" % ",".join("?" * len(interfaces))
+        params += interfaces
+    query += " ORDER BY ts, interface.name"
+    return query, params
+
+
+## Rows (epoch, interface, rx, tx) of table with an epoch of at least since,
+## ordered by time and interface, read straight from vnstat.db
+def query_traffic(db_path, table, since=0, interfaces=None, utc_offset=None):
+    query, params = traffic_query(table, since, interfaces, utc_offset)
+
+    # Read-only, so that a running vnstatd is never blocked or written to
+    db = sqlite3.connect("file:%s?mode=ro" % db_path, uri=True)
+    try:
+        yield from db.execute(query, params)
+    finally:
+        db.close()
+
+
+## Parse --since: seconds since the epoch, or an ISO date/time in local time
+## unless it has an offset
+def parse_since(value):
+    if value == "auto":
+        return value
+    try:
+        return int(value)
+    except ValueError:
+        pass
+    try:
+        return int(datetime.datetime.fromisoformat(value).timestamp())
+    except ValueError:
+        raise argparse.ArgumentTypeError(
+            "expected 'auto', seconds since the epoch or an ISO date, got '%s'" % value
+        )
+
+
+## Find the watermark of an earlier run: the timestamp of the last row in
+## fpath, and the offset of the first row with it. Those rows may have been
+## incomplete when they were read (vnstat keeps adding to the current day or
+## five minutes), so they are read again and replace the ones in the file.
+## Returns (0, size of the file) if there are no rows
+def find_watermark(fpath):
+    if not os.path.isfile(fpath):
+        return 0, 0
+    with open(fpath, "rb") as f:
+        size = f.seek(0, 2)
+        start = max(size - TAIL_BYTES, 0)
+        f.seek(start)
+        tail = f.read()
+    lines = tail.splitlines(keepends=True)
+    if start > 0:
+        # The first line may be cut off
+        start += len(lines[0])
+        lines = lines[1:]
+    rows = [line for line in lines if line.strip()]
+    if not rows or rows[-1].startswith(HEADER[0].encode()):
+        return 0, size
+
+    watermark = rows[-1].split(CSV_DELIMITER.encode(), 1)[0]
+    offset = start
+    for line in lines:
+        if line.split(CSV_DELIMITER.encode(), 1)[0] == watermark:
+            break
+        offset += len(line)
+    return int(watermark), offset
+
+
+def write_rows(out, rows, header):
+    writer = csv.writer(out, delimiter=CSV_DELIMITER)
+    if header:
+        writer.writerow(HEADER)
+    count = 0
+    for row in rows:
+        writer.writerow(row)
+        count += 1
+    return count
+
+
+"""
+Write rows as csv to fpath, or to stdout if fpath is None. With keep, they are
+appended to the first keep bytes of fpath instead. The result is written to a
+temporary file which then replaces fpath, so fpath is left as it was if
+reading the rows fails. Returns the number of rows written
+"""
+def write_traffic(fpath, rows, keep=0):
+    if not fpath:
+        return write_rows(sys.stdout, rows, True)
+
+    tmp = fpath + ".tmp"
+    try:
+        if keep:
+            shutil.copyfile(fpath, tmp)
+            os.truncate(tmp, keep)
+        with open(tmp, "a" if keep else "w", newline="") as out:
+            count = write_rows(out, rows, not keep)
+        os.replace(tmp, fpath)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+    return count
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Read traffic per interface from a vnstat 2.x database \
+        (vnstat.db) into a csv with the columns timestamp (seconds since the \
+        epoch), interface, rx and tx"
+    )
+    parser.add_argument(
+        "--db",
+        required=True,
+        help="path to vnstat.db, e.g. /var/lib/vnstat/vnstat.db",
+    )
+    parser.add_argument(
+        "--table",
+        choices=TABLES,
+        default="fiveminute",
+        help="which resolution to read (default: fiveminute)",
+    )
+    parser.add_argument(
+        "--output-file",
+        help="path to csv file to save results in (default: stdout)",
+    )
+    parser.add_argument(
+        "--since",
+        type=parse_since,
+        default=0,
+        help="only read rows from this time on, as seconds since the epoch \
+        or an ISO date. 'auto' continues where the last run left off, \
+        appending to --output-file",
+    )
+    parser.add_argument(
+        "--interface",
+        dest="interfaces",
+        action="append",
+        help="only read this interface. Can be given several times (default: \
+        every interface)",
+    )
+    parser.add_argument(
+        "--utc-offset",
+        type=float,
+        help="UTC offset in hours of the machine vnstat ran on, e.g. 2 for \
+        CEST (default: the local timezone of this machine)",
+    )
+    args = parser.parse_args()
+
+    append = args.since == "auto"
+    if append and not args.output_file:
+        parser.error("--since auto requires --output-file")
+    since, keep = find_watermark(args.output_file) if append else (args.since, 0)
+
+    rows = query_traffic(args.db, args.table, since, args.interfaces, args.utc_offset)
+    count = write_traffic(args.output_file, rows, keep)
+    if args.output_file:
+        print("Wrote", count, "rows from", args.table, "to", args.output_file)
@@ -0,0 +1,130 @@
+"""
+Bounded-memory, mergeable summaries of streams of values: the count, the
+exact mean and approximate quantiles.
+
+Quantiles come from a DDSketch-style sketch: values are counted in buckets
+whose bounds grow geometrically by gamma = (1 + alpha) / (1 - alpha), so a
+quantile read back is within alpha relative error of a value of that rank in
+the data. pandas interpolates between the two values around the rank, so a
+quantile is within alpha of one of them. With the default alpha of 0.1 %, a
+3 W reading is off by at most 3 mW, whether the summary holds one day or
+years of samples. The number of buckets only grows with the logarithm of the
+range of the values (a few thousand for 1 mW to 1 kW), and summaries of
+different days or nodes are merged by adding their bucket counts, with the
+same guarantee.
+"""
+
+import math
+
+import numpy as np
+
+DEFAULT_ALPHA = 0.001
+
+# Values closer to zero than this are counted as zero (e.g. UNCORE readings)
+ZERO_THRESHOLD = 1e-9
+
+
+class Summary:
+    def __init__(self, alpha=DEFAULT_ALPHA):
+        self.alpha = alpha
+        self.log_gamma = math.log((1 + alpha) / (1 - alpha))
+        self.count = 0
+        self.total = 0.0
+        self.zeros = 0
+        # Bucket index -> count, for positive values and the magnitude of
+        # negative ones. Bucket i holds values in (gamma^(i-1), gamma^i]
+        self.positive = {}
+        self.negative = {}
+
+    ## Add an array of values. NaN values are skipped
+    def update(self, values):
+        values = np.asarray(values, dtype="float64")
+        values = values[~np.isnan(values)]
+        self.count += len(values)
+        self.total += float(values.sum())
+
+        small = np.abs(values) < ZERO_THRESHOLD
+        self.zeros += int(small.sum())
+        for buckets, part in [
+            (self.positive, values[~small & (values > 0)]),
+            (self.negative, -values[~small & (values < 0)]),
+        ]:
+            index = np.ceil(np.log(part) / self.log_gamma).astype("int64")
+            for i, n in zip(*np.unique(index, return_counts=True)):
+                buckets[int(i)] = buckets.get(int(i), 0) + int(n)
+
+    def merge(self, other):
+        if other.alpha != self.alpha:
+            raise ValueError("Can't merge summaries with different alpha")
+        self.count += other.count
+        self.total += other.total
+        self.zeros += other.zeros
+        for buckets, others in [(self.positive, other.positive), (self.negative, other.negative)]:
+            for i, n in others.items():
+                buckets[i] = buckets.get(i, 0) + n
+        return self
+
+    def mean(self):
+        return self.total / self.count if self.count else math.nan
+
+    ## A value in the middle of bucket i, within alpha of anything in it
+    def bucket_value(self, i):
+        gamma = math.exp(self.log_gamma)
+        return 2 * gamma ** i / (gamma + 1)
+
+    ## The q-quantile (0 <= q <= 1) with the rank pandas uses, q * (count - 1)
+    def quantile(self, q):
+        if not self.count:
+            return math.nan
+        rank = q * (self.count - 1)
+        seen = 0
+        for i in sorted(self.negative, reverse=True):
+            seen += self.negative[i]
+            if seen > rank:
+                return -self.bucket_value(i)
+        seen += self.zeros
+        if seen > rank:
+            return 0.0
+        for i in sorted(self.positive):
+            seen += self.positive[i]
+            if seen > rank:
+                return self.bucket_value(i)
+        return self.bucket_value(max(self.positive))
+
+    def to_dict(self):
+        return {
+            "alpha": self.alpha,
+            "count": self.count,
+            "total": self.total,
+            "zeros": self.zeros,
+            "positive": {str(i): n for i, n in self.positive.items()},
+            "negative": {str(i): n for i, n in self.negative.items()},
+        }
+
+    @classmethod
+    def from_dict(cls, d):
+        summary = cls(d["alpha"])
+        summary.count = d["count"]
+        summary.total = d["total"]
+        summary.zeros = d["zeros"]
+        summary.positive = {int(i): n for i, n in d["positive"].items()}
+        summary.negative = {int(i): n for i, n in d["negative"].items()}
+        return summary
+
+
+"""
+Summaries of every column of a dataframe
+"""
+def summarize_frame(df, alpha=DEFAULT_ALPHA):
+    summaries = {}
+    for column in df.columns:
+        summaries[column] = Summary(alpha)
+        summaries[column].update(df[column].to_numpy(dtype="float64"))
+    return summaries
+
+
+def merge_all(summaries, alpha=DEFAULT_ALPHA):
+    merged = Summary(alpha)
+    for summary in summaries:
+        merged.merge(summary)
+    return merged
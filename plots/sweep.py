@@ -0,0 +1,102 @@
+"""
+Sensitivity of the power estimates of main.py to their parameters: the PUE
+of the data center, the power of the storage of a node, the number of nodes
+and the energy intensity of the network (kWh per GB).
+
+Every estimate is linear in these parameters once the readings are
+aggregated, so the data is reduced to a handful of coefficients once (by
+main.py) and every scenario of the grid is evaluated from those at once, with
+numpy broadcasting. Thousands of scenarios cost about as much as one.
+
+The estimates, per node:
+
+- power: PUE * (CPU + RAM + storage) + network, for the 10 % quantile, mean
+  and 90 % quantile of the RAPL readings and of the daily network traffic
+  (like the tables, quantiles of the parts are added up)
+- power per transaction, operation and successful transaction: the mean over
+  hours of PUE * (CPU + RAM + storage) + network, divided by the count in
+  that hour (like plot_power_per_transaction())
+
+and for the network, the power per node times the number of nodes.
+"""
+
+import numpy as np
+import pandas as pd
+
+PARAMETERS = ["pue", "storage_w", "nodes", "gb_to_kwh"]
+
+# Counts of hourly activity the power per unit is computed for: output column
+# prefix -> column of the hourly frame
+UNITS = {"tx": "txs_tot", "op": "ops", "successful_tx": "txs"}
+
+
+"""
+Values of a parameter given as a number, or as start:stop:num for num evenly
+spaced values from start to stop (inclusive)
+"""
+def parse_values(arg):
+    parts = arg.split(":")
+    if len(parts) == 1:
+        return np.array([float(arg)])
+    if len(parts) != 3:
+        raise ValueError("Expected a number or start:stop:num, got '%s'" % arg)
+    return np.linspace(float(parts[0]), float(parts[1]), int(parts[2]))
+
+
+"""
+Every combination of the values of the parameters (see PARAMETERS), one
+scenario per row
+"""
+def scenarios(pue, storage_w, nodes, gb_to_kwh):
+    grids = np.meshgrid(pue, storage_w, nodes, gb_to_kwh, indexing="ij")
+    return pd.DataFrame({name: g.ravel() for name, g in zip(PARAMETERS, grids)})
+
+
+"""
+Coefficients of the power per unit (see UNITS) from hourly data with the
+columns rapl_w (CPU + RAM), network_gb (mean of received and sent) and the
+counts. For each unit, the means over hours of rapl_w / count, 1 / count and
+network_gb / count, over the hours where all are known and the count isn't 0
+"""
+def unit_coefficients(hourly):
+    rapl = hourly["rapl_w"].to_numpy(dtype="float64")
+    network = hourly["network_gb"].to_numpy(dtype="float64")
+    coefficients = {}
+    for unit, column in UNITS.items():
+        count = hourly[column].to_numpy(dtype="float64")
+        known = ~(np.isnan(rapl) | np.isnan(network) | np.isnan(count))
+        known[known] = count[known] > 0
+        coefficients[unit] = (
+            np.mean(rapl[known] / count[known]),
+            np.mean(1 / count[known]),
+            np.mean(network[known] / count[known]),
+        )
+    return coefficients
+
+
+"""
+The estimates for every scenario (a frame of the parameters, see
+scenarios()), from rapl_w and network_gb, the 10 % quantile, mean and 90 %
+quantile (indexed q10, mean, q90) of CPU + RAM power and of the daily network
+traffic of a node, and the hourly data of unit_coefficients(). Returns the
+scenarios with a column per estimate
+"""
+def evaluate(scenarios, rapl_w, network_gb, hourly):
+    pue = scenarios["pue"].to_numpy()
+    storage = scenarios["storage_w"].to_numpy()
+    nodes = scenarios["nodes"].to_numpy()
+    # W of network per GB a day, and per GB an hour
+    daily = scenarios["gb_to_kwh"].to_numpy() * 1000 / 24
+    hourly_w = scenarios["gb_to_kwh"].to_numpy() * 1000
+
+    out = scenarios.copy()
+    for row in ["q10", "mean", "q90"]:
+        node = pue * (rapl_w[row] + storage) + network_gb[row] * daily
+        out["node_%s_w" % row] = node
+        out["total_%s_kw" % row] = node * nodes / 1000
+
+    for unit, (rapl, inverse, network) in unit_coefficients(hourly).items():
+        node = pue * rapl + pue * storage * inverse + hourly_w * network
+        out["node_per_%s_w" % unit] = node
+        out["total_per_%s_w" % unit] = node * nodes
+    return out
@@ -0,0 +1,124 @@
+"""
+Streaming reader for the JSON exports of vnstat (vnstat --json d/f).
+
+The exports are a single object holding every entry of every interface, so
+json.loads() needs the whole file, its parsed tree and whatever is made of it
+in memory at once. iter_traffic() instead reads the file in chunks and yields
+the entries of interfaces[*].traffic.<key> one at a time, so memory use
+stays flat however large the export gets.
+
+Only the skeleton of the document is scanned in Python. Each entry is a small
+object, decoded in one go by the json module.
+"""
+
+import json
+import re
+
+CHUNK_SIZE = 1 << 16
+
+# A string, or one of the characters structuring the document. Numbers and
+# literals between them are skipped
+TOKEN = re.compile(r'"(?:[^"\\]|\\.)*"|[{}\[\],:]')
+SEPARATOR = re.compile(r"[\s,]*")
+
+DECODER = json.JSONDecoder()
+
+
+class Reader:
+    """
+    A sliding window over a text file, extended one chunk at a time
+    """
+
+    def __init__(self, f, chunk_size=CHUNK_SIZE):
+        self.f = f
+        self.chunk_size = chunk_size
+        self.buf = ""
+        self.pos = 0
+        self.eof = False
+
+    def more(self):
+        if self.eof:
+            return False
+        chunk = self.f.read(self.chunk_size)
+        if not chunk:
+            self.eof = True
+            return False
+        self.buf = self.buf[self.pos :] + chunk
+        self.pos = 0
+        return True
+
+    ## The next string or structural character. A match can only be trusted
+    ## if no string starts in the text skipped to reach it, since it could
+    ## otherwise lie inside a string that continues in the next chunk
+    def token(self):
+        while True:
+            match = TOKEN.search(self.buf, self.pos)
+            if match and '"' not in self.buf[self.pos : match.start()]:
+                self.pos = match.end()
+                return match.group()
+            if not self.more():
+                return None
+
+    ## Decode the value starting at the current position (after separators)
+    def value(self):
+        while True:
+            self.pos = SEPARATOR.match(self.buf, self.pos).end()
+            try:
+                value, self.pos = DECODER.raw_decode(self.buf, self.pos)
+                return value
+            except json.JSONDecodeError:
+                if not self.more():
+                    raise
+
+    ## The next character that isn't a separator, without consuming it
+    def peek(self):
+        while True:
+            self.pos = SEPARATOR.match(self.buf, self.pos).end()
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self.more():
+                return None
+
+
+"""
+Yield (interface name, entry) for every entry of interfaces[*].traffic.<key>
+of the vnstat export in f, e.g. key "fiveminute" or "day"
+"""
+def iter_traffic(f, key, chunk_size=CHUNK_SIZE):
+    reader = Reader(f, chunk_size)
+    # The key of every container we are in, and whether it's an object
+    path = []
+    objects = []
+    expect_key = False
+    current_key = None
+    interface = None
+
+    while True:
+        token = reader.token()
+        if token is None:
+            return
+
+        if token == "{":
+            path.append(current_key)
+            objects.append(True)
+            current_key = None
+            expect_key = True
+        elif token == "[":
+            path.append(current_key)
+            objects.append(False)
+            current_key = None
+            if path == [None, "interfaces", None, "traffic", key]:
+                while reader.peek() == "{":
+                    yield interface, reader.value()
+        elif token in "}]":
+            current_key = path.pop()
+            objects.pop()
+            expect_key = False
+        elif token == ",":
+            expect_key = objects[-1]
+        elif token == ":":
+            expect_key = False
+        elif expect_key:
+            current_key = json.loads(token)
+        elif current_key == "name" and path == [None, "interfaces", None]:
+            interface = json.loads(token)
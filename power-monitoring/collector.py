@@ -0,0 +1,348 @@
+#!/usr/bin/env python3
+
+"""
+Read the RAPL energy counters of the machine and append them to one csv file
+per day, in the format written by manager.sh:
+
+    timestamp;duration;CORE0;CPU0;DRAM0;UNCORE0;EXIT_CODE
+
+Each row holds the energy (uJ) used by every domain during a window of
+duration microseconds. Unlike manager.sh, the powercap files are opened once
+and re-read with pread, so sampling forks no processes and can run at 10 Hz
+or faster.
+
+With --continuous, the counters are read every tick and the energy between
+consecutive readings is summed, so no time goes unobserved, and one row is
+written per --aggregate seconds.
+
+With --format binary, rows are written as fixed-width binary records instead
+of text (see plots/powerdb.py for the layout and the readers).
+"""
+
+import argparse
+import datetime
+import os
+import random
+import struct
+import sys
+import time
+
+# The helpers shared by the monitoring services, in monitoring-common next to
+# this directory
+sys.path.insert(
+    0,
+    os.path.join(os.path.dirname(os.path.dirname(os.path.realpath(__file__))), "monitoring-common"),
+)
+import service
+
+DEFAULT_POWERCAP_ROOT = "/sys/devices/virtual/powercap/intel-rapl"
+DEFAULT_OUTPUT_DIR = os.path.join(os.path.expanduser("~"), "power-monitoring-db")
+CSV_DELIMITER = ";"
+
+# manager.sh joins domain name and package index with awk's SUBSEP, which
+# ends up in the header. Kept so that files from both collectors look alike
+DOMAIN_SUBSEP = "\x1c"
+
+# Binary records (--format binary), as read by plots/powerdb.py: a header
+# with the magic, header size, number of domains, UTC offset of the machine
+# in seconds and a reserved field, followed by a NUL padded name per domain.
+# Every record is the epoch timestamp (ns) at the start of the window, its
+# duration (us) and the energy (uJ) of every domain
+RECORD_MAGIC = b"RAPLREC1"
+RECORD_HEADER = struct.Struct("<8sIIiI")
+RECORD_NAME_SIZE = 16
+FORMATS = {"csv": ".csv", "binary": ".rapl"}
+
+# The longest value of an energy_uj file is 20 digits (a 64 bit counter)
+READ_SIZE = 32
+
+
+def read_value(fpath):
+    with open(fpath, "r") as f:
+        return f.read().strip()
+
+
+## The package index of a powercap zone directory, e.g. 0 for both
+## intel-rapl:0 and intel-rapl:0:1
+def package_index(dirname):
+    return dirname.split(":")[1]
+
+
+## The column name of a zone in the csv header. As in manager.sh, package-N
+## zones are called CPU and every zone gets the index of its package
+def column_name(name, package):
+    if name.startswith("package-"):
+        name = "cpu"
+    return name.upper() + DOMAIN_SUBSEP + package
+
+
+## The name of a column in binary records: without SUBSEP, and without the
+## index for package 0 (CORE, CPU, ..., CPU1, ...) as parse-and-normalize
+## names them
+def record_name(column):
+    name, _, package = column.partition(DOMAIN_SUBSEP)
+    return name if package == "0" else name + package
+
+
+class Domain:
+    """
+    An energy_uj file, kept open and re-read with pread
+    """
+
+    def __init__(self, zone_dir):
+        self.zone_dir = zone_dir
+        self.column = column_name(
+            read_value(os.path.join(zone_dir, "name")),
+            package_index(os.path.basename(zone_dir)),
+        )
+        self.max_energy = int(
+            read_value(os.path.join(zone_dir, "max_energy_range_uj"))
+        )
+        self.fd = os.open(os.path.join(zone_dir, "energy_uj"), os.O_RDONLY)
+
+    def read(self):
+        return int(os.pread(self.fd, READ_SIZE, 0))
+
+    ## Energy used between two readings. The counter wraps around at
+    ## max_energy_range_uj, which is added back like calculate_energy does
+    def energy(self, begin, end):
+        used = end - begin
+        if used < 0:
+            used += self.max_energy
+        return used
+
+    def close(self):
+        os.close(self.fd)
+
+
+## Open every zone with an energy counter below root (what `find root -name
+## energy_uj` finds in manager.sh), sorted by column name
+def find_domains(root):
+    domains = []
+    for dirpath, dirnames, filenames in os.walk(root, followlinks=False):
+        # Zones link back to their parents and devices, don't walk those
+        dirnames[:] = [d for d in dirnames if d.startswith("intel-rapl:")]
+        if "energy_uj" in filenames and ":" in os.path.basename(dirpath):
+            domains.append(Domain(dirpath))
+    return sorted(domains, key=lambda d: d.column)
+
+
+def read_counters(domains):
+    return [d.read() for d in domains]
+
+
+def csv_header(domains):
+    columns = ["timestamp", "duration"] + [d.column for d in domains] + ["EXIT_CODE"]
+    return CSV_DELIMITER.join(columns)
+
+
+## An epoch timestamp (ns) in local time, as manager.sh writes it
+def timestamp(epoch_ns):
+    local = datetime.datetime.fromtimestamp(epoch_ns / 1e9).astimezone()
+    return local.isoformat(timespec="seconds")
+
+
+def format_row(start_ns, duration_us, energies):
+    values = [timestamp(start_ns), str(duration_us)] + [str(e) for e in energies] + ["0"]
+    return CSV_DELIMITER.join(values)
+
+
+def record_header(domains):
+    utc_offset = datetime.datetime.now().astimezone().utcoffset()
+    header = RECORD_HEADER.pack(
+        RECORD_MAGIC,
+        RECORD_HEADER.size + RECORD_NAME_SIZE * len(domains),
+        len(domains),
+        int(utc_offset.total_seconds()),
+        0,
+    )
+    names = [record_name(d.column).encode("ascii") for d in domains]
+    return header + b"".join(n.ljust(RECORD_NAME_SIZE, b"\0") for n in names)
+
+
+## The header and a function encoding a row, for a format of FORMATS
+def encoders(domains, fmt):
+    if fmt == "binary":
+        record = struct.Struct("<qQ%dQ" % len(domains))
+        return (
+            lambda: record_header(domains),
+            lambda start, duration, energies: record.pack(start, duration, *energies),
+        )
+    return (
+        lambda: (csv_header(domains) + "\n").encode(),
+        lambda start, duration, energies: (format_row(start, duration, energies) + "\n").encode(),
+    )
+
+
+class DailyWriter(service.DailyWriter):
+    """
+    Writes readings to OUTPUT_DIR/YYYY-MM-DD.csv (or .rapl) in a format of
+    FORMATS. Like manager.sh, every reading is stamped with the time its
+    window started
+    """
+
+    def __init__(self, output_dir, fmt, domains):
+        header, self.encode = encoders(domains, fmt)
+        super().__init__(output_dir, FORMATS[fmt], header)
+
+    def write(self, start_ns, duration, energies):
+        super().write(self.encode(start_ns, duration, energies))
+
+
+## Measure the energy used during one window of interval seconds. Returns the
+## epoch timestamp (ns) of its start, its duration in microseconds and the
+## energy of every domain
+def sample(domains, interval):
+    start = time.time_ns()
+    begin = read_counters(domains)
+    begin_ns = time.monotonic_ns()
+    time.sleep(interval)
+    end_ns = time.monotonic_ns()
+    end = read_counters(domains)
+
+    energies = [d.energy(b, e) for d, b, e in zip(domains, begin, end)]
+    return start, (end_ns - begin_ns) // 1000, energies
+
+
+def run(domains, writer, interval, max_delay, samples=None):
+    taken = 0
+    while samples is None or taken < samples:
+        start, duration, energies = sample(domains, interval)
+        writer.write(start, duration, energies)
+        taken += 1
+        if max_delay > 0:
+            time.sleep(random.uniform(0, max_delay))
+
+
+## Read the counters every interval seconds and write one row with the energy
+## summed over each aggregate seconds. Consecutive readings share their
+## boundaries, so the rows cover all of the time the collector runs. The
+## counters have to be read at least once per wraparound period (a
+## max_energy_range_uj of 262 kJ lasts over 20 minutes at 200 W) for the
+## correction to be exact
+def run_continuous(domains, writer, interval, aggregate, rows=None):
+    interval_ns = int(interval * 1e9)
+    # Tolerate some scheduling jitter on the last tick of a row
+    row_ns = int(aggregate * 1e9) - interval_ns // 2
+
+    started = time.time_ns()
+    previous = read_counters(domains)
+    row_start = next_tick = time.monotonic_ns()
+    totals = [0] * len(domains)
+    now = row_start
+    written = 0
+    try:
+        while rows is None or written < rows:
+            next_tick += interval_ns
+            delay = next_tick - time.monotonic_ns()
+            if delay > 0:
+                time.sleep(delay / 1e9)
+            else:
+                # Overslept by more than a tick, don't try to catch up
+                next_tick = time.monotonic_ns()
+
+            now = time.monotonic_ns()
+            counters = read_counters(domains)
+            for i, domain in enumerate(domains):
+                totals[i] += domain.energy(previous[i], counters[i])
+            previous = counters
+
+            if now - row_start >= row_ns:
+                writer.write(started, (now - row_start) // 1000, totals)
+                totals = [0] * len(domains)
+                started += now - row_start
+                row_start = now
+                written += 1
+    finally:
+        # Don't lose the partial row when stopped
+        if now > row_start:
+            writer.write(started, (now - row_start) // 1000, totals)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Collect RAPL energy readings into daily csv files, like \
+        manager.sh does"
+    )
+    parser.add_argument(
+        "--powercap-root",
+        default=DEFAULT_POWERCAP_ROOT,
+        help="directory holding the RAPL powercap zones (default: %s)"
+        % DEFAULT_POWERCAP_ROOT,
+    )
+    parser.add_argument(
+        "--output-dir",
+        default=DEFAULT_OUTPUT_DIR,
+        help="directory to write the daily files to (default: %s)"
+        % DEFAULT_OUTPUT_DIR,
+    )
+    parser.add_argument(
+        "--rate",
+        type=float,
+        default=1.0,
+        help="samples per second, i.e. the inverse of the length of each \
+        measured window (default: 1, as manager.sh)",
+    )
+    parser.add_argument(
+        "--max-delay",
+        type=float,
+        default=5.0,
+        help="sleep a random 0 to MAX_DELAY seconds between windows, as \
+        manager.sh does (default: 5, 0 to sample back to back)",
+    )
+    parser.add_argument(
+        "--samples",
+        type=int,
+        help="stop after this many samples (rows with --continuous) instead \
+        of running forever",
+    )
+    parser.add_argument(
+        "--continuous",
+        action="store_true",
+        help="read the counters every 1/RATE seconds without any gaps and \
+        write the summed energy once per --aggregate seconds, instead of \
+        measuring separate windows. --max-delay is ignored",
+    )
+    parser.add_argument(
+        "--aggregate",
+        type=float,
+        default=10.0,
+        help="seconds of readings summed into each row with --continuous \
+        (default: 10)",
+    )
+    parser.add_argument(
+        "--format",
+        choices=list(FORMATS),
+        default="csv",
+        help="csv: the text files of manager.sh (default). binary: \
+        fixed-width records in YYYY-MM-DD.rapl files, which the plots scripts \
+        memory-map instead of parsing",
+    )
+    args = parser.parse_args()
+    if args.rate <= 0:
+        parser.error("--rate must be positive")
+    if args.continuous and args.aggregate < 1.0 / args.rate:
+        parser.error("--aggregate must be at least one tick (1/RATE seconds)")
+
+    domains = find_domains(args.powercap_root)
+    if not domains:
+        print("No RAPL domains found in", args.powercap_root, file=sys.stderr)
+        print("Is intel_rapl_msr loaded? (modprobe intel_rapl_msr)", file=sys.stderr)
+        sys.exit(1)
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    writer = DailyWriter(args.output_dir, args.format, domains)
+    service.exit_on_sigterm()
+    try:
+        if args.continuous:
+            run_continuous(
+                domains, writer, 1.0 / args.rate, args.aggregate, args.samples
+            )
+        else:
+            run(domains, writer, 1.0 / args.rate, args.max_delay, args.samples)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        writer.close()
+        for domain in domains:
+            domain.close()
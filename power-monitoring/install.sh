@@ -1,5 +1,20 @@
 #!/usr/bin/env bash
 
+# The unit runs /root/power-monitoring/collector.py, which imports the helpers of
+# /root/monitoring-common, so both directories are deployed next to each other
+INSTALL_DIR="/root"
+
+[[ "$(realpath .)" != "$INSTALL_DIR/power-monitoring" ]] && \
+    cp -r "." "$INSTALL_DIR/power-monitoring"
+
+[[ -d "../monitoring-common" && "$(realpath ..)" != "$INSTALL_DIR" ]] && \
+    cp -r "../monitoring-common" "$INSTALL_DIR/"
+
+if [[ ! -f "$INSTALL_DIR/monitoring-common/service.py" ]]; then
+    echo "$INSTALL_DIR/monitoring-common is missing, run from power-monitoring of the repository" >&2
+    exit 1
+fi
+
 [[ -f "./power-monitoring.service" ]] && \
     cp "./power-monitoring.service" "/etc/systemd/system/power-monitoring.service"
 
@@ -1,5 +1,20 @@
 #!/usr/bin/env bash
 
+# The unit runs /root/sysstat-monitoring/sampler.py, which imports the helpers of
+# /root/monitoring-common, so both directories are deployed next to each other
+INSTALL_DIR="/root"
+
+[[ "$(realpath .)" != "$INSTALL_DIR/sysstat-monitoring" ]] && \
+    cp -r "." "$INSTALL_DIR/sysstat-monitoring"
+
+[[ -d "../monitoring-common" && "$(realpath ..)" != "$INSTALL_DIR" ]] && \
+    cp -r "../monitoring-common" "$INSTALL_DIR/"
+
+if [[ ! -f "$INSTALL_DIR/monitoring-common/service.py" ]]; then
+    echo "$INSTALL_DIR/monitoring-common is missing, run from sysstat-monitoring of the repository" >&2
+    exit 1
+fi
+
 [[ -f "./sysstat-monitoring.service" ]] && \
     cp "./sysstat-monitoring.service" "/etc/systemd/system/sysstat-monitoring.service"
 
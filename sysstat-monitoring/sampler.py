@@ -0,0 +1,372 @@
+#!/usr/bin/env python3
+
+"""
+Sample system-wide and per-process CPU and memory usage from /proc and
+append it to one csv file per day, instead of saving the text output of sar
+and top for parse-top-data.py to scrape.
+
+The rows have the columns parse-top-data.py writes (its wide layout), with
+full timestamps:
+
+    timestamp,CPU US,CPU SY,CPU ID,MEM USED,MEM BUFF,Stellar CPU%,...
+
+CPU columns are percentages of all CPUs over the last interval, memory
+columns MiB, and per group of processes the summed CPU% (100 is one CPU, as
+in top), MEM% and RES KiB, left empty while no process of the group runs.
+
+By default, it samples once per second during 60 seconds at a random time
+every 30 minutes, like manager.sh.
+"""
+
+import argparse
+import datetime
+import os
+import random
+import re
+import sys
+import time
+
+# The helpers shared by the monitoring services, in monitoring-common next to
+# this directory
+sys.path.insert(
+    0,
+    os.path.join(os.path.dirname(os.path.dirname(os.path.realpath(__file__))), "monitoring-common"),
+)
+import service
+
+DEFAULT_PROC_ROOT = "/proc"
+DEFAULT_OUTPUT_DIR = os.path.join(os.path.expanduser("~"), "sysstat-monitoring-db")
+
+SYSTEM_COLUMNS = ["CPU US", "CPU SY", "CPU ID", "MEM USED", "MEM BUFF"]
+GROUP_COLUMNS = ["CPU%", "MEM%", "RES KiB"]
+
+# Process groups, as (name, regex matched against the process name, whether
+# only the process with the lowest pid is tracked). manager.sh tracks every
+# stellar-core process (pgrep stellar-core) and a single postgres process
+# (pidof -s postgres)
+DEFAULT_GROUPS = [("Stellar", "stellar-core", False), ("PGSQL", "^postgres$", True)]
+
+# Seconds between searches for the processes of a group while it has none,
+# e.g. because stellar-core wasn't running yet when sampling started
+RESOLVE_SECONDS = 10
+
+CLOCK_TICKS = os.sysconf("SC_CLK_TCK")
+PAGE_KIB = os.sysconf("SC_PAGE_SIZE") // 1024
+
+READ_SIZE = 4096
+
+
+class ProcFile:
+    """
+    A file under /proc, kept open and re-read with pread
+    """
+
+    def __init__(self, fpath):
+        self.fd = os.open(fpath, os.O_RDONLY)
+
+    def read(self):
+        return os.pread(self.fd, READ_SIZE, 0).decode()
+
+    def close(self):
+        os.close(self.fd)
+
+
+## The first line of /proc/stat as (busy user, system, idle, total) jiffies.
+## As in top, user excludes niced time and total is everything but guest
+## time, which user already includes
+def parse_cpu_times(text):
+    fields = [int(v) for v in text.split("\n", 1)[0].split()[1:9]]
+    user, nice, system, idle = fields[:4]
+    return user, system, idle, sum(fields)
+
+
+## Used and buff/cache memory in MiB from /proc/meminfo, computed like top
+def parse_meminfo(text):
+    kib = {}
+    for line in text.splitlines():
+        key, _, value = line.partition(":")
+        kib[key] = int(value.split()[0])
+    buff = kib["Buffers"] + kib["Cached"] + kib.get("SReclaimable", 0)
+    used = kib["MemTotal"] - kib["MemFree"] - buff
+    return used / 1024, buff / 1024, kib["MemTotal"]
+
+
+## CPU time (jiffies) and RSS (KiB) from /proc/<pid>/stat. The command name
+## may contain spaces and parentheses, so fields are counted from its end
+def parse_process_stat(text):
+    fields = text[text.rindex(")") + 2 :].split()
+    utime, stime, rss = int(fields[11]), int(fields[12]), int(fields[21])
+    return utime + stime, rss * PAGE_KIB
+
+
+def process_name(proc_root, pid):
+    try:
+        with open(os.path.join(proc_root, pid, "comm"), "r") as f:
+            return f.read().rstrip("\n")
+    except OSError:
+        return None
+
+
+## Find the pids of every group by process name, the way pgrep and pidof do
+def find_pids(proc_root, groups):
+    pids = {name: [] for name, _, _ in groups}
+    numeric = sorted((p for p in os.listdir(proc_root) if p.isdigit()), key=int)
+    for pid in numeric:
+        comm = process_name(proc_root, pid)
+        if comm is None:
+            continue
+        for name, pattern, single in groups:
+            if pattern.search(comm) and not (single and pids[name]):
+                pids[name].append(pid)
+    return pids
+
+
+class Sampler:
+    """
+    Keeps /proc/stat, /proc/meminfo and the stat files of the tracked
+    processes open, and turns consecutive readings into csv rows
+    """
+
+    def __init__(self, proc_root, groups):
+        self.proc_root = proc_root
+        self.groups = [(name, re.compile(p), single) for name, p, single in groups]
+        self.stat = ProcFile(os.path.join(proc_root, "stat"))
+        self.meminfo = ProcFile(os.path.join(proc_root, "meminfo"))
+        self.processes = {}
+        self.previous = None
+        self.resolved = None
+
+    ## Re-resolve the pids of the groups, e.g. after a tracked process exited
+    ## or while a group has none
+    def find_processes(self):
+        self.close_processes()
+        for name, pids in find_pids(self.proc_root, self.groups).items():
+            files = {}
+            for pid in pids:
+                try:
+                    files[pid] = ProcFile(os.path.join(self.proc_root, pid, "stat"))
+                except OSError:
+                    pass
+            self.processes[name] = files
+        self.resolved = time.monotonic()
+
+    ## Start over, e.g. at the start of a window: re-resolve the pids and
+    ## forget the previous reading
+    def reset(self):
+        self.find_processes()
+        self.previous = None
+
+    ## Whether it is time to look for the processes of a group without any
+    def resolve_due(self, now):
+        if self.resolved is not None and now - self.resolved < RESOLVE_SECONDS:
+            return False
+        return any(not self.processes.get(name) for name, _, _ in self.groups)
+
+    def read_processes(self):
+        processes = {}
+        vanished = False
+        for name, files in self.processes.items():
+            readings = {}
+            for pid, f in files.items():
+                try:
+                    readings[pid] = parse_process_stat(f.read())
+                except (OSError, ValueError):
+                    vanished = True
+            processes[name] = readings
+        return processes, vanished
+
+    def read(self):
+        processes, vanished = self.read_processes()
+        return time.monotonic(), parse_cpu_times(self.stat.read()), processes, vanished
+
+    ## Take a reading, and return the row for the interval since the previous
+    ## one, or None for the first reading
+    def sample(self):
+        now, cpu, processes, vanished = self.read()
+        used, buff, total_kib = parse_meminfo(self.meminfo.read())
+        previous, self.previous = self.previous, (now, cpu, processes)
+        if vanished or self.resolve_due(now):
+            self.find_processes()
+            # Read the pids just found right away, so they count from the next
+            # row on
+            self.previous = (now, cpu, self.read_processes()[0])
+        if previous is None:
+            return None
+
+        elapsed = now - previous[0]
+        total = (cpu[3] - previous[1][3]) or 1
+        row = [
+            100 * (cpu[0] - previous[1][0]) / total,
+            100 * (cpu[1] - previous[1][1]) / total,
+            100 * (cpu[2] - previous[1][2]) / total,
+            used,
+            buff,
+        ]
+        for name, _, _ in self.groups:
+            readings = processes.get(name, {})
+            before = previous[2].get(name, {})
+            pids = [pid for pid in readings if pid in before]
+            if not pids:
+                row += [None, None, None]
+                continue
+            jiffies = sum(readings[pid][0] - before[pid][0] for pid in pids)
+            res = sum(readings[pid][1] for pid in pids)
+            row += [100 * jiffies / CLOCK_TICKS / elapsed, 100 * res / total_kib, res]
+        return row
+
+    def close_processes(self):
+        for files in self.processes.values():
+            for f in files.values():
+                f.close()
+        self.processes = {}
+
+    def close(self):
+        self.close_processes()
+        self.stat.close()
+        self.meminfo.close()
+
+
+def csv_header(groups):
+    header = ["timestamp"] + SYSTEM_COLUMNS
+    for name, _, _ in groups:
+        header += [name + " " + col for col in GROUP_COLUMNS]
+    return ",".join(header)
+
+
+def format_value(value):
+    if value is None:
+        return ""
+    if isinstance(value, float):
+        return "%.2f" % value
+    return str(value)
+
+
+def format_row(values):
+    now = datetime.datetime.now().astimezone().isoformat(timespec="seconds")
+    return ",".join([now] + [format_value(v) for v in values])
+
+
+class DailyWriter(service.DailyWriter):
+    """
+    Writes rows of values to OUTPUT_DIR/YYYY-MM-DD.csv, with the given header
+    """
+
+    def __init__(self, output_dir, header):
+        super().__init__(output_dir, ".csv", lambda: (header + "\n").encode())
+
+    def write(self, values):
+        super().write((format_row(values) + "\n").encode())
+
+
+## Write samples(rows) every interval seconds, or forever if samples is None
+def run_window(sampler, writer, interval, samples=None):
+    sampler.reset()
+    sampler.sample()
+    next_tick = time.monotonic()
+    written = 0
+    while samples is None or written < samples:
+        next_tick += interval
+        time.sleep(max(next_tick - time.monotonic(), 0))
+        row = sampler.sample()
+        if row is not None:
+            writer.write(row)
+            written += 1
+
+
+## Sample during duration seconds at a random time within every period
+## seconds, like manager.sh
+def run_periodic(sampler, writer, interval, period, duration, windows=None):
+    taken = 0
+    while windows is None or taken < windows:
+        delay = random.uniform(0, period - duration)
+        time.sleep(delay)
+        run_window(sampler, writer, interval, int(duration / interval))
+        time.sleep(max(period - delay - duration, 0))
+        taken += 1
+
+
+def parse_group(arg):
+    name, sep, pattern = arg.partition("=")
+    if not sep or not name:
+        raise argparse.ArgumentTypeError("expected NAME=REGEX, got '%s'" % arg)
+    return name, pattern, False
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Sample CPU and memory usage from /proc into daily csv \
+        files"
+    )
+    parser.add_argument(
+        "--proc-root",
+        default=DEFAULT_PROC_ROOT,
+        help="procfs to read from (default: %s)" % DEFAULT_PROC_ROOT,
+    )
+    parser.add_argument(
+        "--output-dir",
+        default=DEFAULT_OUTPUT_DIR,
+        help="directory to write the daily csv files to (default: %s)"
+        % DEFAULT_OUTPUT_DIR,
+    )
+    parser.add_argument(
+        "--rate",
+        type=float,
+        default=1.0,
+        help="samples per second (default: 1)",
+    )
+    parser.add_argument(
+        "--continuous",
+        action="store_true",
+        help="sample all the time instead of in windows",
+    )
+    parser.add_argument(
+        "--period",
+        type=float,
+        default=1800,
+        help="seconds between the starts of sampling windows (default: 1800)",
+    )
+    parser.add_argument(
+        "--duration",
+        type=float,
+        default=60,
+        help="seconds of sampling per window (default: 60)",
+    )
+    parser.add_argument(
+        "--group",
+        dest="groups",
+        action="append",
+        type=parse_group,
+        metavar="NAME=REGEX",
+        help="track the processes whose name matches REGEX as group NAME. Can \
+        be given several times (default: every stellar-core process as \
+        Stellar and the first postgres process as PGSQL)",
+    )
+    parser.add_argument(
+        "--samples",
+        type=int,
+        help="stop after this many rows (windows unless --continuous) \
+        instead of running forever",
+    )
+    args = parser.parse_args()
+    if args.rate <= 0:
+        parser.error("--rate must be positive")
+    if not args.continuous and not 0 < args.duration <= args.period:
+        parser.error("expected 0 < --duration <= --period")
+
+    groups = args.groups or DEFAULT_GROUPS
+    os.makedirs(args.output_dir, exist_ok=True)
+    sampler = Sampler(args.proc_root, groups)
+    writer = DailyWriter(args.output_dir, csv_header(groups))
+    service.exit_on_sigterm()
+    try:
+        if args.continuous:
+            run_window(sampler, writer, 1.0 / args.rate, args.samples)
+        else:
+            run_periodic(
+                sampler, writer, 1.0 / args.rate, args.period, args.duration, args.samples
+            )
+    except KeyboardInterrupt:
+        pass
+    finally:
+        writer.close()
+        sampler.close()
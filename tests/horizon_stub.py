@@ -0,0 +1,104 @@
+#!/usr/bin/env python
+
+"""
+A local stand-in for the Horizon /ledgers endpoint, to run
+plots/fetch-ledger-activity.py against without hitting horizon.stellar.org.
+
+It serves ledgers 1 to top, one closed every 5 s from START, with order=desc
+paging like Horizon: without a cursor a page starts at the newest ledger,
+and with the paging token of ledger L (L << 32) it starts below L. top can be
+raised while it runs to let new ledgers close, and the requests it answered
+are kept in requests.
+"""
+
+import argparse
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import threading
+from urllib.parse import parse_qs, urlsplit
+
+START = datetime(2021, 5, 13, tzinfo=timezone.utc)
+LEDGER_SECONDS = 5
+
+
+def ledger_record(sequence):
+    closed = START + timedelta(seconds=sequence * LEDGER_SECONDS)
+    ops = 100 + sequence * 7919 % 400
+    return {
+        "paging_token": str(sequence << 32),
+        "sequence": sequence,
+        "successful_transaction_count": ops // 3,
+        "failed_transaction_count": ops // 20,
+        "operation_count": ops,
+        "closed_at": closed.strftime("%Y-%m-%dT%H:%M:%SZ"),
+    }
+
+
+class HorizonStub(ThreadingHTTPServer):
+    def __init__(self, top, port=0):
+        super().__init__(("127.0.0.1", port), LedgersHandler)
+        self.top = top
+        self.requests = []
+        self.thread = None
+
+    @property
+    def url(self):
+        return "http://127.0.0.1:%d/ledgers?limit=200&order=desc" % self.server_port
+
+    def page(self, query):
+        limit = int(query.get("limit", ["10"])[0])
+        below = self.top + 1
+        if "cursor" in query:
+            below = min(int(query["cursor"][0]) >> 32, below)
+        sequences = range(below - 1, max(below - 1 - limit, 0), -1)
+        return {
+            "_links": {},
+            "_embedded": {"records": [ledger_record(s) for s in sequences]},
+        }
+
+    def __enter__(self):
+        self.thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.shutdown()
+        self.server_close()
+        self.thread.join()
+
+
+class LedgersHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        parts = urlsplit(self.path)
+        if parts.path != "/ledgers":
+            self.send_error(404)
+            return
+        self.server.requests.append(self.path)
+        body = json.dumps(self.server.page(parse_qs(parts.query))).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/hal+json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Serve synthetic Horizon /ledgers pages on localhost"
+    )
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument(
+        "--top",
+        type=int,
+        default=17280,
+        help="sequence of the newest ledger (default: 17280, a day of ledgers)",
+    )
+    args = parser.parse_args()
+
+    server = HorizonStub(args.top, args.port)
+    print("Serving ledgers 1-%d at %s" % (args.top, server.url))
+    server.serve_forever()
@@ -0,0 +1,16 @@
+import importlib.util
+import os
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+## Load a script of the repository by its path relative to the root. Most
+## have hyphenated names or live in directories which aren't packages, so
+## they can't be imported
+def load_script(relpath):
+    path = os.path.join(ROOT, relpath)
+    name = os.path.basename(relpath)[:-3].replace("-", "_")
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
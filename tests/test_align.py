@@ -0,0 +1,115 @@
+import os
+import sys
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from scripts import ROOT
+
+sys.path.insert(0, os.path.join(ROOT, "plots"))
+import align  # noqa: E402
+
+T0 = pd.Timestamp("2021-05-26 00:00:00")
+
+
+def seconds(*values):
+    return pd.DatetimeIndex([T0 + pd.Timedelta(seconds=v) for v in values])
+
+
+def frame(times, **columns):
+    return pd.DataFrame(columns, index=seconds(*times), dtype="float64")
+
+
+class AsofTest(unittest.TestCase):
+    def test_matches_merge_asof(self):
+        rng = np.random.default_rng(1)
+        df = frame(np.sort(rng.choice(1000, 200, replace=False)), value=rng.random(200))
+        target = seconds(*np.sort(rng.choice(1000, 100)))
+        for direction in align.DIRECTIONS:
+            expected = pd.merge_asof(
+                pd.DataFrame(index=target),
+                df,
+                left_index=True,
+                right_index=True,
+                direction=direction,
+                tolerance=pd.Timedelta("3s"),
+            )
+            out = align.asof(df, target, direction, tolerance="3s")
+            np.testing.assert_array_equal(out["value"], expected["value"])
+
+    def test_unsorted_index(self):
+        df = frame([20, 0, 10], value=[2, 0, 1])
+        out = align.asof(df, seconds(5, 15, 25))
+        self.assertEqual(out["value"].tolist(), [0, 1, 2])
+
+    def test_before_first_sample(self):
+        out = align.asof(frame([10], value=[1]), seconds(0, 10))
+        self.assertTrue(np.isnan(out["value"].iloc[0]))
+        self.assertEqual(out["value"].iloc[1], 1)
+
+
+class IntervalTest(unittest.TestCase):
+    def test_weighted_by_time(self):
+        # 1 W for 1 s, then 7 W for 3 s: 22 J over 4 s
+        df = frame([0, 1], power=[1, 7])
+        out = align.interval_mean(df, seconds(0, 4), durations=[1, 3])
+        self.assertAlmostEqual(out["power"].iloc[0], 22 / 4)
+
+    def test_gaps(self):
+        # Every second up to 4 s, then nothing until 20 s
+        df = frame([0, 1, 2, 3, 4, 20], power=[1, 1, 1, 1, 3, 5])
+        grid = seconds(0, 5, 10, 15, 20, 25)
+        out = align.interval_mean(df, grid, max_gap="2s")
+        # The sample at 4 s holds until 6 s, for the first second of [5, 10)
+        self.assertEqual(out["power"].tolist()[:2], [(4 + 3) / 5, 3])
+        self.assertTrue(np.isnan(out["power"].iloc[2:4]).all())
+
+        covered = align.interval_mean(df, grid, max_gap="2s", min_coverage=0.5)
+        self.assertTrue(np.isnan(covered["power"].iloc[1]))
+
+    def test_missing_values_are_not_zero(self):
+        df = frame([0, 1, 2, 3], power=[2, np.nan, 2, 2])
+        out = align.interval_mean(df, seconds(0, 4), durations=1)
+        self.assertEqual(out["power"].iloc[0], 2)
+
+    def test_window_straddling_a_boundary(self):
+        # A 10 s window starting 5 s before the end of the first minute
+        df = frame([0, 55], power=[2, 8])
+        grid = seconds(0, 60, 120)
+        out = align.interval_mean(df, grid, durations=[10, 10])
+        self.assertAlmostEqual(out["power"].iloc[0], (2 * 10 + 8 * 5) / 15)
+        self.assertAlmostEqual(out["power"].iloc[1], 8)
+
+        counts = align.interval_sum(frame([0, 55], bytes=[100, 1000]), grid, 10)
+        self.assertEqual(counts["bytes"].tolist(), [600, 500])
+
+    def test_unsorted_index(self):
+        rng = np.random.default_rng(2)
+        times = np.sort(rng.choice(3600, 500, replace=False))
+        df = frame(times, power=rng.random(500))
+        durations = rng.uniform(0.5, 1.5, 500)
+        grid = seconds(*range(0, 3601, 300))
+        expected = align.interval_mean(df, grid, durations)
+
+        order = rng.permutation(500)
+        out = align.interval_mean(df.iloc[order], grid, durations[order])
+        np.testing.assert_allclose(out["power"], expected["power"])
+
+    def test_resample_mean(self):
+        # Evenly spaced samples weigh the same, like resample().mean()
+        index = pd.date_range(T0, periods=7200, freq="1s", tz="UTC")
+        df = pd.DataFrame({"power": np.arange(7200.0)}, index=index)
+        out = align.resample_mean(df, "1h")
+        expected = df.resample("1h").mean()
+        self.assertTrue(out.index.equals(expected.index))
+        np.testing.assert_allclose(out["power"], expected["power"])
+
+    def test_tz_mismatch(self):
+        df = frame([0], power=[1])
+        with self.assertRaises(ValueError):
+            align.interval_mean(df, seconds(0, 1).tz_localize("UTC"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,130 @@
+import os
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+from scripts import ROOT, load_script
+
+collector = load_script("power-monitoring/collector.py")
+
+MAX_ENERGY = 10000
+STEP = 3000
+
+
+## A powercap tree with a package zone and its core and dram subzones, like
+## /sys/devices/virtual/powercap/intel-rapl
+def make_powercap(root):
+    zones = {
+        "intel-rapl:0": "package-0",
+        "intel-rapl:0/intel-rapl:0:0": "core",
+        "intel-rapl:0/intel-rapl:0:1": "dram",
+    }
+    for path, name in zones.items():
+        zone_dir = os.path.join(root, path)
+        os.makedirs(zone_dir)
+        write_value(os.path.join(zone_dir, "name"), name)
+        write_value(os.path.join(zone_dir, "max_energy_range_uj"), MAX_ENERGY)
+        write_value(os.path.join(zone_dir, "energy_uj"), MAX_ENERGY - 1000)
+    return [os.path.join(root, path) for path in zones]
+
+
+## Rewrite a file in place, so that the descriptors kept open by the
+## collector read the new value
+def write_value(fpath, value):
+    with open(fpath, "w") as f:
+        f.write("%s\n" % value)
+
+
+class CollectorTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.root = os.path.join(self.tmp.name, "intel-rapl")
+        self.zones = make_powercap(self.root)
+        self.output_dir = os.path.join(self.tmp.name, "db")
+        os.makedirs(self.output_dir)
+        self.domains = collector.find_domains(self.root)
+        self.bumps = 0
+
+    def tearDown(self):
+        for domain in self.domains:
+            domain.close()
+        self.tmp.cleanup()
+
+    ## Stands in for time.sleep: every domain uses STEP uJ, wrapping around
+    ## at MAX_ENERGY
+    def bump(self, seconds):
+        self.bumps += 1
+        for zone_dir in self.zones:
+            fpath = os.path.join(zone_dir, "energy_uj")
+            with open(fpath, "r") as f:
+                value = int(f.read())
+            write_value(fpath, (value + STEP) % MAX_ENERGY)
+
+    def read_output(self):
+        (name,) = os.listdir(self.output_dir)
+        with open(os.path.join(self.output_dir, name), "r") as f:
+            return [line.rstrip("\n").split(";") for line in f]
+
+    def test_finds_domains_like_manager_sh(self):
+        self.assertEqual(
+            [d.column for d in self.domains], ["CORE\x1c0", "CPU\x1c0", "DRAM\x1c0"]
+        )
+
+    def test_energy_of_a_wrapped_counter(self):
+        domain = self.domains[0]
+        begin = domain.read()
+        self.bump(0)
+        self.assertEqual(domain.energy(begin, domain.read()), STEP)
+
+    def test_windows(self):
+        writer = collector.DailyWriter(self.output_dir, "csv", self.domains)
+        with mock.patch.object(collector.time, "sleep", self.bump):
+            collector.run(self.domains, writer, 0.1, 0, samples=4)
+        writer.close()
+
+        rows = self.read_output()
+        self.assertEqual(rows[0], collector.csv_header(self.domains).split(";"))
+        self.assertEqual(len(rows), 5)
+        for row in rows[1:]:
+            self.assertEqual(row[2:], [str(STEP)] * 3 + ["0"])
+
+    def test_readings_are_stamped_with_the_start_of_their_window(self):
+        start = 1621000000 * 10**9
+        for fmt in collector.FORMATS:
+            writer = collector.DailyWriter(self.output_dir, fmt, self.domains)
+            with mock.patch.object(collector.time, "sleep", self.bump), \
+                    mock.patch.object(collector.time, "time_ns", lambda: start):
+                collector.run(self.domains, writer, 0.1, 0, samples=1)
+            writer.close()
+
+        sys.path.insert(0, os.path.join(ROOT, "plots"))
+        try:
+            import powerdb
+        finally:
+            sys.path.remove(os.path.join(ROOT, "plots"))
+        for name in os.listdir(self.output_dir):
+            fpath = os.path.join(self.output_dir, name)
+            if name.endswith(powerdb.RECORD_EXT):
+                records, _ = powerdb.open_records(fpath)
+                self.assertEqual(records["timestamp"].tolist(), [start])
+            else:
+                with open(fpath, "r") as f:
+                    row = f.read().split("\n")[1].split(";")
+                self.assertEqual(row[0], collector.timestamp(start))
+
+    def test_continuous_readings_cover_all_energy(self):
+        writer = collector.DailyWriter(self.output_dir, "csv", self.domains)
+        with mock.patch.object(collector.time, "sleep", self.bump):
+            collector.run_continuous(self.domains, writer, 0.001, 0.002, rows=3)
+        writer.close()
+
+        rows = self.read_output()[1:]
+        self.assertGreaterEqual(len(rows), 3)
+        self.assertGreater(self.bumps, 1)
+        for column in range(2, 5):
+            self.assertEqual(sum(int(r[column]) for r in rows), STEP * self.bumps)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,63 @@
+import os
+import sys
+import tempfile
+import unittest
+
+import pandas as pd
+
+from scripts import ROOT
+
+sys.path.insert(0, os.path.join(ROOT, "plots"))
+import datastore  # noqa: E402
+
+# Like data/top-stats.csv, including a row of a top output cut short
+TOP_STATS = """timestamp,CPU US,CPU SY,CPU ID,MEM USED,MEM BUFF,Stellar CPU%,Stellar MEM%,PGSQL CPU%,PGSQL MEM%
+2021-05-17 15:45:55,5.7,0.8,0.0,10419.7,505.9,33.3,0.8,6.7,0.5
+2021-05-17 15:45:56,3.5,0.9,1.0,10419.7,505.9,28.0,0.8,9.0,0.5
+2021-05-17 ,,,,,,,,,
+2021-05-18 00:00:01,4.1,0.7,2.0,10420.1,506.0,30.5,0.8,7.5,0.5
+"""
+
+
+class DatastoreTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.csv_path = os.path.join(self.tmp.name, "top-stats.csv")
+        with open(self.csv_path, "w") as f:
+            f.write(TOP_STATS)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_convert_top_stats(self):
+        datastore.convert_csv(self.csv_path)
+        self.assertTrue(datastore.has_fresh_columnar(self.csv_path))
+
+        df = datastore.read_columnar(datastore.columnar_path(self.csv_path))
+        self.assertTrue(pd.api.types.is_datetime64_any_dtype(df.index))
+        self.assertEqual(
+            list(df.index),
+            [
+                pd.Timestamp("2021-05-17 15:45:55"),
+                pd.Timestamp("2021-05-17 15:45:56"),
+                pd.Timestamp("2021-05-18 00:00:01"),
+            ],
+        )
+        self.assertEqual(df["Stellar CPU%"].tolist(), [33.3, 28.0, 30.5])
+
+        day = datastore.read_range(
+            datastore.columnar_path(self.csv_path), "2021-05-18", "2021-05-19"
+        )
+        self.assertEqual(len(day), 1)
+
+    def test_mixed_utc_offsets(self):
+        df = pd.DataFrame(
+            {"value": [1, 2]},
+            index=pd.Index(["2021-03-28 01:00:00+01:00", "2021-03-28 03:00:00+02:00"]),
+        )
+        df = datastore.to_columnar_frame(df)
+        self.assertEqual(df.index[1] - df.index[0], pd.Timedelta(hours=1))
+
+
+if __name__ == "__main__":
+    unittest.main()
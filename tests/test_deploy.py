@@ -0,0 +1,81 @@
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+
+from scripts import ROOT
+from test_collector import make_powercap
+from test_sampler import FakeProc
+
+
+class DeployTest(unittest.TestCase):
+    """
+    Runs the entry points of the services the way their units do, from the
+    directories install.sh copies to /root: the service's own directory and
+    monitoring-common next to it, and nothing else of the repository
+    """
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.install_dir = os.path.join(self.tmp.name, "root")
+        self.output_dir = os.path.join(self.tmp.name, "db")
+        os.makedirs(self.output_dir)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def deploy(self, service):
+        for name in (service, "monitoring-common"):
+            shutil.copytree(
+                os.path.join(ROOT, name),
+                os.path.join(self.install_dir, name),
+                ignore=shutil.ignore_patterns("__pycache__"),
+            )
+
+    def run_entry_point(self, relpath, *args):
+        result = subprocess.run(
+            [sys.executable, os.path.join(self.install_dir, relpath), *args],
+            cwd=self.tmp.name,
+            capture_output=True,
+            text=True,
+            timeout=60,
+        )
+        self.assertEqual(result.returncode, 0, result.stderr)
+        (name,) = os.listdir(self.output_dir)
+        with open(os.path.join(self.output_dir, name), "r") as f:
+            return f.read().split("\n")
+
+    def test_collector(self):
+        self.deploy("power-monitoring")
+        powercap_root = os.path.join(self.tmp.name, "intel-rapl")
+        make_powercap(powercap_root)
+        lines = self.run_entry_point(
+            "power-monitoring/collector.py",
+            "--powercap-root", powercap_root,
+            "--output-dir", self.output_dir,
+            "--rate", "100",
+            "--max-delay", "0",
+            "--samples", "2",
+        )
+        self.assertEqual(len(lines), 4)
+
+    def test_sampler(self):
+        self.deploy("sysstat-monitoring")
+        proc_root = os.path.join(self.tmp.name, "proc")
+        os.makedirs(proc_root)
+        FakeProc(proc_root).set_process(100, "stellar-core", 0, 1024)
+        lines = self.run_entry_point(
+            "sysstat-monitoring/sampler.py",
+            "--proc-root", proc_root,
+            "--output-dir", self.output_dir,
+            "--rate", "100",
+            "--continuous",
+            "--samples", "2",
+        )
+        self.assertEqual(len(lines), 4)
+
+
+if __name__ == "__main__":
+    unittest.main()
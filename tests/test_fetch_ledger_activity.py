@@ -0,0 +1,113 @@
+import contextlib
+import csv
+import io
+import os
+import sys
+import tempfile
+import unittest
+
+from horizon_stub import HorizonStub
+from scripts import ROOT, load_script
+
+fetch = load_script("plots/fetch-ledger-activity.py")
+
+# Ledgers close every 5 s from midnight, so this is ledger 360 (of 1000)
+END_DATE = "2021-05-13T00:30"
+FIRST_LEDGER = 360
+
+
+class FetchLedgerActivityTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.output = os.path.join(self.tmp.name, "ledger-activity.csv")
+        self.server = HorizonStub(top=1000).__enter__()
+
+    def tearDown(self):
+        self.server.__exit__(None, None, None)
+        self.tmp.cleanup()
+
+    def fetch(self, url=None):
+        with contextlib.redirect_stdout(io.StringIO()):
+            fetch.fetch_all_items(
+                END_DATE,
+                url or self.server.url,
+                self.output,
+                self.output + ".state.json",
+                self.output + ".pages",
+                concurrency=2,
+            )
+
+    def read_rows(self, fpath=None):
+        with open(fpath or self.output, "r") as f:
+            return list(csv.reader(f))
+
+    def test_fetches_ledgers_down_to_end_date(self):
+        self.fetch()
+        rows = self.read_rows()
+        self.assertEqual(rows[0], fetch.CSV_HEADER)
+        self.assertEqual(
+            sorted(int(r[4]) for r in rows[1:]), list(range(FIRST_LEDGER, 1001))
+        )
+        self.assertEqual(rows[1][0], "2021-05-13T01:23:20Z")
+
+        rollup = self.read_rows(fetch.rollup_path(self.output, "1h"))
+        self.assertEqual(sum(int(r[1]) for r in rollup[1:]), 1001 - FIRST_LEDGER)
+
+    def test_resumes_with_new_ledgers_only(self):
+        self.fetch()
+        self.server.top = 1250
+        self.server.requests.clear()
+        self.fetch()
+
+        ledgers = [int(r[4]) for r in self.read_rows()[1:]]
+        self.assertEqual(sorted(ledgers), list(range(FIRST_LEDGER, 1251)))
+        # The head, and the two pages of ledgers 1001-1250
+        self.assertEqual(len(self.server.requests), 3)
+
+    def test_pages_are_cached_per_url(self):
+        self.fetch()
+        os.remove(self.output)
+        os.remove(self.output + ".state.json")
+        self.server.requests.clear()
+        self.fetch(self.server.url.replace("limit=200", "limit=100"))
+
+        ledgers = [int(r[4]) for r in self.read_rows()[1:]]
+        self.assertEqual(sorted(ledgers), list(range(FIRST_LEDGER, 1001)))
+        # No page of the first url was reused for the second
+        pages = [r for r in self.server.requests if "cursor=" in r]
+        self.assertGreaterEqual(len(pages), 7)
+        self.assertTrue(all("limit=100" in r for r in pages))
+        self.assertEqual(len(os.listdir(self.output + ".pages")), 2)
+
+    def test_migrates_headerless_csv(self):
+        old = [
+            fetch.record_to_list(r)[:4]
+            for r in fetch.filter_records(self.server.page({"limit": ["200"]})["_embedded"]["records"])
+        ]
+        with open(self.output, "w") as f:
+            csv.writer(f).writerows(old + old[:10])
+
+        self.fetch()
+        rows = self.read_rows()
+        self.assertEqual(rows[0], fetch.CSV_HEADER)
+        self.assertEqual(rows[1:201], [[str(v) for v in r] + [""] for r in old])
+        ledgers = [int(r[4]) for r in rows[201:]]
+        self.assertEqual(sorted(ledgers), list(range(FIRST_LEDGER, 801)))
+
+    def test_main_reads_the_csv_in_time_order(self):
+        self.fetch()
+        self.server.top = 1250
+        self.fetch()
+
+        sys.path.insert(0, os.path.join(ROOT, "plots"))
+        try:
+            main = load_script("plots/main.py")
+        finally:
+            sys.path.remove(os.path.join(ROOT, "plots"))
+        df = main.read_csv(self.output, "2021-05-13", "2021-05-13")
+        self.assertTrue(df.index.is_monotonic_increasing)
+        self.assertEqual(len(df), 1251 - FIRST_LEDGER)
+
+
+if __name__ == "__main__":
+    unittest.main()
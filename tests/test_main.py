@@ -0,0 +1,27 @@
+import contextlib
+import io
+import os
+import sys
+import unittest
+
+from scripts import ROOT
+
+sys.path.insert(0, os.path.join(ROOT, "plots"))
+import main  # noqa: E402
+
+COMMANDS = ["tables", "sweep", "figures", "figure", "all"]
+
+
+class LegacyArgsTest(unittest.TestCase):
+    def test_output_dir_alone_is_all(self):
+        with contextlib.redirect_stderr(io.StringIO()) as err:
+            self.assertEqual(main.legacy_args(["figures-out"], COMMANDS), ["all", "-o", "figures-out"])
+        self.assertIn("main.py all -o figures-out", err.getvalue())
+
+    def test_commands_are_kept(self):
+        for argv in (["tables"], ["all", "-o", "out"], ["--help"], []):
+            self.assertEqual(main.legacy_args(argv, COMMANDS), argv)
+
+
+if __name__ == "__main__":
+    unittest.main()
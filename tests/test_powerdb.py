@@ -0,0 +1,56 @@
+import contextlib
+import io
+import os
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+import numpy as np
+
+from scripts import ROOT, load_script
+
+sys.path.insert(0, os.path.join(ROOT, "plots"))
+import powerdb  # noqa: E402
+
+parse_power = load_script("plots/parse-and-normalize-power-data.py")
+
+# A daily file of manager.sh, whose UNCORE column is always empty
+DAILY_CSV = """timestamp;duration;CORE\x1c0;CPU\x1c0;DRAM\x1c0;UNCORE\x1c0;EXIT_CODE
+2021-05-14T00:00:03+02:00;1003122;12516997;13054715;1099789;;0
+2021-05-14T00:00:06+02:00;1004778;1532222;1981196;1109067;;0
+2021-05-14T00:00:09+02:00;1000000;2000000;3000000;;;0
+"""
+
+
+class RecordsRoundTripTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.csv_path = Path(self.tmp.name, "2021-05-14.csv")
+        with open(self.csv_path, "w") as f:
+            f.write(DAILY_CSV)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_missing_readings_stay_unknown(self):
+        with contextlib.redirect_stdout(io.StringIO()):
+            parse_power.convert_to_records(self.csv_path, self.tmp.name)
+        records_path = self.csv_path.with_suffix(powerdb.RECORD_EXT)
+
+        domains = ["CORE", "CPU", "DRAM", "UNCORE"]
+        expected = parse_power.read_power_file(self.csv_path, domains)
+        records, utc_offset = powerdb.open_records(records_path)
+        self.assertEqual(list(records["UNCORE"]), [powerdb.MISSING] * 3)
+
+        df = powerdb.power_frame(records, utc_offset, domains)
+        self.assertEqual(list(df["timestamp"]), list(expected["timestamp"]))
+        for domain in domains:
+            np.testing.assert_allclose(df[domain], expected[domain])
+        self.assertTrue(df["UNCORE"].isna().all())
+        self.assertTrue(np.isnan(df["DRAM"].iloc[2]))
+        self.assertAlmostEqual(df["CPU"].mean(), expected["CPU"].mean())
+
+
+if __name__ == "__main__":
+    unittest.main()
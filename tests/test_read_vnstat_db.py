@@ -0,0 +1,159 @@
+import os
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import unittest
+
+import pandas as pd
+
+from scripts import ROOT, load_script
+
+sys.path.insert(0, os.path.join(ROOT, "plots"))
+import main  # noqa: E402
+
+read_vnstat_db = load_script("plots/read-vnstat-db.py")
+
+SCRIPT = os.path.join(ROOT, "plots", "read-vnstat-db.py")
+
+# The tables of vnstat 2.x read by the script, with the index vnstat creates
+SCHEMA = """
+CREATE TABLE interface (id INTEGER PRIMARY KEY, name TEXT NOT NULL UNIQUE);
+CREATE TABLE day (
+    id INTEGER PRIMARY KEY, interface INTEGER NOT NULL, date DATE NOT NULL,
+    rx INTEGER NOT NULL, tx INTEGER NOT NULL, UNIQUE (interface, date)
+);
+CREATE TABLE fiveminute (
+    id INTEGER PRIMARY KEY, interface INTEGER NOT NULL, date DATE NOT NULL,
+    rx INTEGER NOT NULL, tx INTEGER NOT NULL, UNIQUE (interface, date)
+);
+CREATE INDEX idx_day ON day (interface, date);
+CREATE INDEX idx_fiveminute ON fiveminute (interface, date);
+"""
+
+# 2021-05-26 00:00 in CEST (UTC+2), as vnstat stores it: local time text
+MIDNIGHT = 1621980000
+UTC_OFFSET = "2"
+
+
+class VnstatDb:
+    def __init__(self, fpath):
+        self.fpath = fpath
+        db = sqlite3.connect(fpath)
+        db.executescript(SCHEMA)
+        db.executemany("INSERT INTO interface (id, name) VALUES (?, ?)", [(1, "eth0"), (2, "eth1")])
+        db.commit()
+        db.close()
+
+    ## Set the traffic of interface at minute (of 2021-05-26, local time)
+    def set_fiveminute(self, interface, minute, rx, tx):
+        date = "2021-05-26 %02d:%02d:00" % divmod(minute, 60)
+        db = sqlite3.connect(self.fpath)
+        db.execute(
+            "INSERT INTO fiveminute (interface, date, rx, tx) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT (interface, date) DO UPDATE SET rx = excluded.rx, tx = excluded.tx",
+            (interface, date, rx, tx),
+        )
+        db.commit()
+        db.close()
+
+
+class ReadVnstatDbTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.db = VnstatDb(os.path.join(self.tmp.name, "vnstat.db"))
+        self.output = os.path.join(self.tmp.name, "traffic-5m.csv")
+        for minute in (0, 5, 10):
+            self.db.set_fiveminute(1, minute, 100 + minute, 200 + minute)
+            self.db.set_fiveminute(2, minute, 1, 2)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def run_script(self, *args):
+        subprocess.run(
+            [sys.executable, SCRIPT, "--db", self.db.fpath, "--utc-offset", UTC_OFFSET, *args],
+            check=True,
+            capture_output=True,
+        )
+
+    def read_output(self):
+        with open(self.output, "r") as f:
+            return f.read().splitlines()
+
+    def test_since(self):
+        rows = list(read_vnstat_db.query_traffic(self.db.fpath, "fiveminute", MIDNIGHT + 300, utc_offset=2))
+        self.assertEqual(
+            rows,
+            [
+                (MIDNIGHT + 300, "eth0", 105, 205),
+                (MIDNIGHT + 300, "eth1", 1, 2),
+                (MIDNIGHT + 600, "eth0", 110, 210),
+                (MIDNIGHT + 600, "eth1", 1, 2),
+            ],
+        )
+
+    def test_date_bound(self):
+        self.assertEqual(read_vnstat_db.date_bound("fiveminute", MIDNIGHT + 300, 2), "2021-05-26 00:05:00")
+        # A day is only complete from its midnight on
+        self.assertEqual(read_vnstat_db.date_bound("day", MIDNIGHT, 2), "2021-05-26")
+        self.assertEqual(read_vnstat_db.date_bound("day", MIDNIGHT + 1, 2), "2021-05-27")
+
+    def test_date_filter_searches_the_index(self):
+        for table in read_vnstat_db.TABLES:
+            query, params = read_vnstat_db.traffic_query(table, MIDNIGHT + 300, utc_offset=2)
+            db = sqlite3.connect(self.db.fpath)
+            plan = " ".join(row[-1] for row in db.execute("EXPLAIN QUERY PLAN " + query, params))
+            db.close()
+            self.assertIn("SEARCH t USING", plan)
+            self.assertNotIn("SCAN t", plan)
+
+    def test_since_auto_rereads_the_last_rows(self):
+        self.run_script("--since", "auto", "--output-file", self.output)
+        self.assertEqual(len(self.read_output()), 7)
+
+        # vnstat adds to the current five minutes, and starts the next
+        self.db.set_fiveminute(1, 10, 999, 999)
+        self.db.set_fiveminute(1, 15, 115, 215)
+        self.run_script("--since", "auto", "--output-file", self.output)
+
+        lines = self.read_output()
+        self.assertEqual(lines[0], "timestamp,interface,rx,tx")
+        self.assertEqual(
+            lines[5:],
+            [
+                "%d,eth0,999,999" % (MIDNIGHT + 600),
+                "%d,eth1,1,2" % (MIDNIGHT + 600),
+                "%d,eth0,115,215" % (MIDNIGHT + 900),
+            ],
+        )
+
+    def test_output_is_replaced_atomically(self):
+        self.run_script("--output-file", self.output)
+        before = self.read_output()
+
+        def failing_rows():
+            yield (MIDNIGHT + 900, "eth0", 1, 1)
+            raise sqlite3.OperationalError("database is locked")
+
+        with self.assertRaises(sqlite3.OperationalError):
+            read_vnstat_db.write_traffic(self.output, failing_rows(), keep=100)
+        self.assertEqual(self.read_output(), before)
+        self.assertFalse(os.path.exists(self.output + ".tmp"))
+
+    def test_read_by_main(self):
+        self.run_script("--output-file", self.output)
+        df = main.read_network_data(self.output)
+        self.assertEqual(list(df.columns), ["rx", "tx"])
+        self.assertEqual(df.index[0], pd.Timestamp("2021-05-26 00:00:00+02:00"))
+        self.assertEqual(df["rx"].tolist(), [101, 106, 111])
+
+        # And from its columnar copy
+        main.datastore.convert_csv(self.output)
+        columnar = main.read_network_data(self.output)
+        self.assertTrue(columnar.index.equals(df.index))
+        self.assertEqual(columnar["rx"].tolist(), [101, 106, 111])
+
+
+if __name__ == "__main__":
+    unittest.main()
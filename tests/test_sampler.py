@@ -0,0 +1,140 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from scripts import load_script
+
+sampler = load_script("sysstat-monitoring/sampler.py")
+
+MEMINFO = """MemTotal:        8192000 kB
+MemFree:         2048000 kB
+Buffers:          102400 kB
+Cached:          1024000 kB
+SReclaimable:      98816 kB
+"""
+
+
+## Rewrite a file in place, so that the descriptors kept open by the sampler
+## read the new content
+def write_file(fpath, text):
+    with open(fpath, "w") as f:
+        f.write(text)
+
+
+class FakeProc:
+    """
+    A /proc-like directory with stat, meminfo and the stat and comm files of
+    the processes added to it
+    """
+
+    def __init__(self, root):
+        self.root = root
+        write_file(os.path.join(root, "meminfo"), MEMINFO)
+        self.set_cpu(0, 0, 0)
+
+    ## Jiffies of all CPUs in user, system and idle mode
+    def set_cpu(self, user, system, idle):
+        line = "cpu  %d 0 %d %d 0 0 0 0 0 0\n" % (user, system, idle)
+        write_file(os.path.join(self.root, "stat"), line + "cpu0 0 0 0 0 0 0 0 0 0 0\n")
+
+    def set_process(self, pid, comm, jiffies, rss_pages):
+        proc_dir = os.path.join(self.root, str(pid))
+        os.makedirs(proc_dir, exist_ok=True)
+        write_file(os.path.join(proc_dir, "comm"), comm + "\n")
+        # Fields after the command name, from the state on: utime and stime
+        # are the 12th and 13th, rss the 22nd
+        fields = ["S"] + ["0"] * 40
+        fields[11], fields[12], fields[21] = str(jiffies), "0", str(rss_pages)
+        write_file(os.path.join(proc_dir, "stat"), "%d (%s) %s\n" % (pid, comm, " ".join(fields)))
+
+
+class SamplerTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.proc = FakeProc(self.tmp.name)
+        self.now = 1000.0
+        patcher = mock.patch.object(sampler.time, "monotonic", lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.sampler = sampler.Sampler(self.tmp.name, sampler.DEFAULT_GROUPS)
+
+    def tearDown(self):
+        self.sampler.close()
+        self.tmp.cleanup()
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+    ## Take a sample after seconds have passed
+    def sample_after(self, seconds):
+        self.sleep(seconds)
+        return self.sampler.sample()
+
+    def test_system_and_process_usage(self):
+        self.proc.set_process(100, "stellar-core", 0, 1024)
+        self.proc.set_process(101, "stellar-core", 0, 1024)
+        self.proc.set_process(200, "postgres", 0, 512)
+        self.proc.set_process(201, "postgres", 0, 512)
+        self.sampler.reset()
+        self.assertIsNone(self.sampler.sample())
+
+        self.proc.set_cpu(30, 10, 60)
+        self.proc.set_process(100, "stellar-core", sampler.CLOCK_TICKS, 1024)
+        self.proc.set_process(101, "stellar-core", sampler.CLOCK_TICKS // 2, 1024)
+        self.proc.set_process(200, "postgres", sampler.CLOCK_TICKS, 512)
+        row = self.sample_after(2)
+
+        res = 2 * 1024 * sampler.PAGE_KIB
+        self.assertEqual(row[:3], [30, 10, 60])
+        self.assertAlmostEqual(row[3], (8192000 - 2048000 - 1225216) / 1024)
+        self.assertAlmostEqual(row[4], 1225216 / 1024)
+        self.assertEqual(row[5:8], [75, 100 * res / 8192000, res])
+        # Only the first postgres process is tracked, like pidof -s
+        self.assertEqual(row[8], 50)
+
+    def test_empty_group_is_resolved_while_sampling(self):
+        self.proc.set_process(100, "stellar-core", 0, 1024)
+        self.sampler.reset()
+        self.sampler.sample()
+        self.assertEqual(self.sample_after(1)[8:], [None, None, None])
+
+        self.proc.set_process(200, "postgres", 0, 512)
+        self.assertEqual(self.sample_after(1)[8:], [None, None, None])
+        self.assertEqual(self.sampler.processes["PGSQL"], {})
+
+        # Found once RESOLVE_SECONDS passed since the last search, and
+        # counted from the next row on
+        self.assertEqual(self.sample_after(sampler.RESOLVE_SECONDS)[8:], [None, None, None])
+        self.assertEqual(list(self.sampler.processes["PGSQL"]), ["200"])
+        self.proc.set_process(200, "postgres", sampler.CLOCK_TICKS, 512)
+        row = self.sample_after(1)
+        self.assertEqual(row[8], 100)
+        self.assertEqual(row[10], 512 * sampler.PAGE_KIB)
+        # The rows of the other group went on meanwhile
+        self.assertEqual(row[5], 0)
+
+    def test_run_window_writes_daily_csv(self):
+        self.proc.set_process(100, "stellar-core", 0, 1024)
+        output_dir = os.path.join(self.tmp.name, "db")
+        os.makedirs(output_dir)
+        header = sampler.csv_header(sampler.DEFAULT_GROUPS)
+        writer = sampler.DailyWriter(output_dir, header)
+        with mock.patch.object(sampler.time, "sleep", self.sleep):
+            sampler.run_window(self.sampler, writer, 1.0, samples=3)
+        writer.close()
+
+        (name,) = os.listdir(output_dir)
+        with open(os.path.join(output_dir, name), "r") as f:
+            lines = f.read().splitlines()
+        self.assertEqual(lines[0], header)
+        self.assertEqual(len(lines), 4)
+        res = 1024 * sampler.PAGE_KIB
+        self.assertEqual(
+            lines[1].split(",")[6:],
+            ["0.00", "%.2f" % (100 * res / 8192000), str(res), "", "", ""],
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
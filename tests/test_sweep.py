@@ -0,0 +1,35 @@
+import os
+import sys
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from scripts import ROOT
+
+sys.path.insert(0, os.path.join(ROOT, "plots"))
+import sweep  # noqa: E402
+
+
+class UnitCoefficientsTest(unittest.TestCase):
+    def test_hours_without_activity_are_left_out(self):
+        hourly = pd.DataFrame(
+            {
+                "rapl_w": [4.0, 4.0, np.nan, 4.0],
+                "network_gb": [1.0, 1.0, 1.0, 1.0],
+                "txs_tot": [2, 0, 2, 4],
+                "ops": [4, 0, 4, 8],
+                "txs": [1, 0, 1, 2],
+            }
+        )
+        coefficients = sweep.unit_coefficients(hourly)
+        rapl, inverse, network = coefficients["tx"]
+        self.assertEqual(rapl, (4 / 2 + 4 / 4) / 2)
+        self.assertEqual(inverse, (1 / 2 + 1 / 4) / 2)
+        self.assertEqual(network, (1 / 2 + 1 / 4) / 2)
+        for values in coefficients.values():
+            self.assertTrue(np.isfinite(values).all())
+
+
+if __name__ == "__main__":
+    unittest.main()